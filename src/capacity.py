@@ -0,0 +1,120 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Account for the disk space of the image trees and of the filesystem.
+
+The usage of ``latest`` and of every snapshot is measured by walking the
+trees once, oldest snapshot first, and counting the allocated blocks of
+each inode only for the first tree that references it.  Each tree then
+reports its own size and the space it adds to the trees before it, which
+for snapshots sharing data through hardlinks is what deleting it frees at
+most.  Only the set of inodes seen is kept in memory.  The result is
+stored in ``disk-usage.json`` in the state directory so that hooks can
+report it without walking the trees.  Hooks that add or remove trees
+adjust the stored figures from the manifests instead; the next sync that
+changes anything measures them again.
+"""
+
+import os
+import time
+
+import reclaim
+import state
+
+USAGE_FILE = "disk-usage.json"
+
+
+def free_bytes(path):
+    """Return the bytes available to unprivileged users on the filesystem of path."""
+    stat = os.statvfs(path)
+    return stat.f_bavail * stat.f_frsize
+
+
+def _tree_usage(root, seen):
+    usage = {"bytes": 0, "new-bytes": 0}
+    for dirpath, dirs, files in os.walk(root):
+        for name in files:
+            try:
+                stat = os.lstat(os.path.join(dirpath, name))
+            except OSError:
+                continue
+            size = stat.st_blocks * 512
+            usage["bytes"] += size
+            if (stat.st_dev, stat.st_ino) not in seen:
+                seen.add((stat.st_dev, stat.st_ino))
+                usage["new-bytes"] += size
+    return usage
+
+
+def measure(image_dir):
+    """Return the disk usage of the trees of image_dir and of its filesystem."""
+    names = sorted(
+        (name for name in os.listdir(image_dir) if name.startswith(reclaim.SNAPSHOT_PREFIX)),
+        key=lambda name: reclaim.snapshot_time(os.path.join(image_dir, name)),
+    )
+    names.append("latest")
+    seen = set()
+    trees = {}
+    for name in names:
+        root = os.path.join(image_dir, name)
+        if os.path.isdir(root):
+            trees[name] = _tree_usage(root, seen)
+    stat = os.statvfs(image_dir)
+    return {
+        "trees": trees,
+        "free": free_bytes(image_dir),
+        "size": stat.f_blocks * stat.f_frsize,
+        "updated": time.time(),
+    }
+
+
+def update(state_dir, image_dir):
+    """Measure image_dir and store the result in the state directory."""
+    usage = measure(image_dir)
+    state.write_json(os.path.join(state_dir, USAGE_FILE), usage)
+    return usage
+
+
+def load(state_dir):
+    return state.read_json(os.path.join(state_dir, USAGE_FILE))
+
+
+def adjust(state_dir, image_dir, trees):
+    """Update the stored usage of trees without walking them.
+
+    trees maps tree names to their estimated usage, or to None for trees
+    that are gone.  The free space of the filesystem is read again.
+    """
+    usage = load(state_dir)
+    usage.setdefault("trees", {})
+    for name, tree in trees.items():
+        if tree is None:
+            usage["trees"].pop(name, None)
+        else:
+            usage["trees"][name] = tree
+    stat = os.statvfs(image_dir)
+    usage.update(
+        free=free_bytes(image_dir), size=stat.f_blocks * stat.f_frsize, updated=time.time()
+    )
+    state.write_json(os.path.join(state_dir, USAGE_FILE), usage)
+    return usage
+
+
+def summary(usage):
+    """Return a short description of a disk usage record, or "" without one."""
+    trees = usage.get("trees") or {}
+    if not trees:
+        return ""
+    parts = []
+    if "latest" in trees:
+        parts.append("latest {}".format(state.format_bytes(trees["latest"]["bytes"])))
+    snapshots = [usage for name, usage in trees.items() if name != "latest"]
+    if snapshots:
+        parts.append(
+            "{} snapshots +{}".format(
+                len(snapshots),
+                state.format_bytes(sum(tree["new-bytes"] for tree in snapshots)),
+            )
+        )
+    parts.append("{} free".format(state.format_bytes(usage.get("free", 0))))
+    return ", ".join(parts)
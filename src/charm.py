@@ -3,19 +3,44 @@
 # See LICENSE file for licensing details.
 
 import copy
+import hashlib
+import json
 import logging
 import os
 import shutil
 import subprocess
+import sys
 import time
 from datetime import datetime
 
 from ops.charm import CharmBase
 from ops.framework import StoredState
 from ops.main import main
-from ops.model import ActiveStatus, BlockedStatus
+from ops.model import ActiveStatus, BlockedStatus, MaintenanceStatus
+
+import capacity
+import compare
+import manifest
+import metrics
+import planner
+import precompress
+import reclaim
+import snapshots
+import state
+import streams
+import syncjob
+import throttle
+import trim
+import verify
 
 logger = logging.getLogger(__name__)
+# hooks are timed from the start of the dispatch, which imports this module first
+_STARTED = time.monotonic()
+
+
+def _digest(*values):
+    """Return a digest of JSON-serializable values."""
+    return hashlib.sha256(json.dumps(values, sort_keys=True, default=str).encode()).hexdigest()
 
 
 def _get_env():
@@ -31,6 +56,53 @@ def _get_env():
     return env
 
 
+def _verify_results(report):
+    """Format a verification report as action results."""
+    results = {
+        key: str(value) for key, value in report.items() if key not in ("missing", "corrupt")
+    }
+    for key in ("missing", "corrupt"):
+        results[key] = "\n".join(report[key])
+    return results
+
+
+def _listing(entries, limit=20):
+    """Join at most limit entries with newlines, noting how many were left out."""
+    listed = "\n".join(entries[:limit])
+    if len(entries) > limit:
+        listed += "\n... and {} more".format(len(entries) - limit)
+    return listed
+
+
+def _plan_results(plan, limit=20):
+    """Format a sync plan as action results, listing at most limit paths each."""
+    results = {
+        key: str(value) for key, value in plan.items() if key != "selectors" and value is not None
+    }
+    for i, selector in enumerate(plan["selectors"], start=1):
+        results["selector-{}".format(i)] = {
+            "selector": selector["selector"],
+            "items": str(selector["items"]),
+            "add": str(len(selector["add"])),
+            "add-bytes": str(selector["add-bytes"]),
+            "add-paths": _listing(selector["add"], limit),
+            "prune": str(len(selector["prune"])),
+            "prune-bytes": str(selector["prune-bytes"]),
+            "prune-paths": _listing(selector["prune"], limit),
+        }
+    return results
+
+
+def _diff_results(report, limit=20):
+    """Format a metadata comparison as action results, listing at most limit versions each."""
+    results = {}
+    for key in ("added", "removed", "changed"):
+        results[key] = str(len(report[key]))
+        results["{}-bytes".format(key)] = str(report["{}-bytes".format(key)])
+        results["{}-versions".format(key)] = _listing(report[key], limit)
+    return results
+
+
 class SimpleStreamsCharm(CharmBase):
     _stored = StoredState()
 
@@ -38,32 +110,107 @@ class SimpleStreamsCharm(CharmBase):
         super().__init__(*args)
         self.framework.observe(self.on.config_changed, self._on_config_changed)
         self.framework.observe(self.on.install, self._on_install)
+        self.framework.observe(self.on.upgrade_charm, self._on_upgrade_charm)
         self.framework.observe(self.on.update_status, self._on_update_status)
         self.framework.observe(self.on.synchronize_action, self._on_synchronize_action)
+        self.framework.observe(self.on.sync_status_action, self._on_sync_status_action)
+        self.framework.observe(self.on.cancel_sync_action, self._on_cancel_sync_action)
         self.framework.observe(self.on.create_snapshot_action, self._on_create_snapshot_action)
         self.framework.observe(self.on.publish_snapshot_action, self._on_publish_snapshot_action)
         self.framework.observe(self.on.list_snapshots_action, self._on_list_snapshots_action)
         self.framework.observe(self.on.delete_snapshot_action, self._on_delete_snapshot_action)
+        self.framework.observe(self.on.gc_action, self._on_gc_action)
+        self.framework.observe(self.on.verify_action, self._on_verify_action)
+        self.framework.observe(self.on.plan_sync_action, self._on_plan_sync_action)
+        self.framework.observe(self.on.diff_snapshots_action, self._on_diff_snapshots_action)
         self.framework.observe(self.on.publish_relation_joined, self._on_publish_relation_joined)
-        self._stored.set_default(config={})
+        self.framework.observe(
+            self.on.replicas_relation_changed, self._on_replicas_relation_changed
+        )
+        self.framework.observe(
+            self.on.replicas_relation_departed, self._on_replicas_relation_changed
+        )
+        self.framework.observe(self.framework.on.commit, self._on_commit)
+        self._stored.set_default(config={}, config_hash="", cron_hash="")
+
+    def _on_commit(self, _):
+        """Log and record how long the dispatched hook or action took."""
+        hook = os.environ.get("JUJU_DISPATCH_PATH")
+        if not hook:
+            return
+        duration = time.monotonic() - _STARTED
+        logger.info("{} took {:.3f}s".format(hook, duration))
+        try:
+            records = metrics.record_hook(self._sync_state_dir(), hook, duration)
+            metrics.write_textfile(
+                self._stored.config.get("metrics-textfile-dir"),
+                self.model.app.name,
+                records,
+                name="hooks",
+            )
+        except OSError as e:
+            logger.info("Cannot record hook metrics: {}".format(e))
 
     def _on_publish_relation_joined(self, event):
-        publish_path = self._image_publish_dir()
-        event.relation.data[self.model.unit].update({"path": publish_path})
+        self._update_publish_relation(event.relation)
+
+    def _update_publish_relation(self, relation):
+        """Tell the web server where the images are and which metadata it can serve."""
+        encodings = precompress.available(self._stored.config.get("metadata-compression"))
+        trimmed_index = ""
+        if self._stored.config.get("trimmed-streams"):
+            trimmed_index = "{}/{}".format(trim.TRIMMED_DIR, trim.INDEX_FILE)
+        relation.data[self.model.unit].update(
+            {
+                "path": self._image_publish_dir(),
+                "encodings": " ".join(encodings),
+                "trimmed-index": trimmed_index,
+            }
+        )
 
     def _on_update_status(self, _):
+        config_error = self._config_error()
+        if config_error:
+            self.model.unit.status = BlockedStatus(config_error)
+            return
+        if syncjob.is_running(self._sync_state_dir()):
+            status = syncjob.read_status(self._sync_state_dir())
+            self.model.unit.status = MaintenanceStatus(syncjob.describe(status))
+            return
+        last_run = syncjob.read_last_run(self._sync_state_dir())
+        if last_run.get("phase") == "blocked":
+            self.model.unit.status = BlockedStatus(last_run.get("message") or "Sync blocked")
+            return
         path = self._image_publish_dir() + "/.data"
         if os.path.isdir(path):
-            stat = os.stat(path)
-            self.model.unit.status = ActiveStatus(
-                "Publishes: {}".format(time.ctime(stat.st_mtime))
-            )
+            published = manifest.load_summary(self._image_publish_dir())
+            if published:
+                message = "Publishes: {} ({} items, {})".format(
+                    time.ctime(published["created"]),
+                    published["items"],
+                    state.format_bytes(published["bytes"]),
+                )
+            else:
+                message = "Publishes: {}".format(time.ctime(os.stat(path).st_mtime))
+            if last_run.get("finished"):
+                message += "; last sync {} at {}".format(
+                    last_run.get("phase"), time.ctime(last_run["finished"])
+                )
+            usage = capacity.summary(capacity.load(self._sync_state_dir()))
+            if usage:
+                message += "; disk: {}".format(usage)
+            self.model.unit.status = ActiveStatus(message)
         else:
             self.model.unit.status = BlockedStatus("Images not synchronized")
 
     def _on_install(self, _):
         subprocess.check_output(["apt", "install", "-y", "simplestreams"])
 
+    def _on_upgrade_charm(self, _):
+        # the new code may write a different cron entry or job configuration
+        self._stored.config_hash = ""
+        self._stored.cron_hash = ""
+
     def _on_config_changed(self, _):
         for key in self.model.config:
             if key not in self._stored.config:
@@ -73,30 +220,142 @@ class SimpleStreamsCharm(CharmBase):
                 value = self.model.config[key]
                 logger.info("Setting {} to: {}".format(key, value))
                 self._stored.config[key] = value
+        config_error = self._config_error()
+        if config_error:
+            logger.info(config_error)
+            self.model.unit.status = BlockedStatus(config_error)
+            return
+        if isinstance(self.model.unit.status, BlockedStatus):
+            self._on_update_status(None)
+        mirror_url = self._mirror_url()
+        config_hash = _digest(self._sync_config(), mirror_url, self.charm_dir)
+        if config_hash == self._stored.config_hash and (
+            not self._cron_enabled() or os.path.exists(self._cron_path())
+        ):
+            logger.info("Configuration unchanged")
+            return
         if not os.path.isdir(self._image_download_dir()):
             os.makedirs(self._image_download_dir())
         if not os.path.isdir(self._image_publish_dir()):
             os.symlink(self._image_download_dir(), self._image_publish_dir())
-        if (
+        self._advertise_mirror(mirror_url)
+        self._refresh_cron_job()
+        for relation in self.model.relations["publish"]:
+            self._update_publish_relation(relation)
+        self._stored.config_hash = config_hash
+
+    def _config_error(self):
+        """Return why the sync windows or bandwidth limit cannot be used, if they cannot."""
+        for key, parse in (
+            ("sync-windows", throttle.parse_windows),
+            ("max-bandwidth", throttle.parse_bandwidth),
+        ):
+            try:
+                parse(self._stored.config.get(key))
+            except ValueError as e:
+                return "Invalid {}: {}".format(key, e)
+        return None
+
+    def _on_replicas_relation_changed(self, _):
+        self._advertise_mirror()
+        self._refresh_cron_job()
+
+    def _mirror_url(self):
+        """Return the URL peers can mirror from, or None without peers."""
+        relation = self.model.get_relation("replicas")
+        if relation is None:
+            return None
+        template = self._stored.config.get("peer-mirror-url") or ""
+        if not template:
+            return ""
+        address = self.model.get_binding(relation).network.ingress_address
+        return template.format(address=address) if address else ""
+
+    def _advertise_mirror(self, url=None):
+        """Offer this unit's latest tree to its peers at peer-mirror-url."""
+        relation = self.model.get_relation("replicas")
+        if relation is None:
+            return
+        relation.data[self.unit]["mirror-url"] = self._mirror_url() if url is None else url
+
+    def _peer_mirrors(self):
+        """Map the units sharing the sync, this one included, to their mirror URL."""
+        relation = self.model.get_relation("replicas")
+        if relation is None:
+            return {}
+        mirrors = {}
+        for unit in relation.units | {self.unit}:
+            url = relation.data[unit].get("mirror-url")
+            if url:
+                mirrors[unit.name] = url
+        return mirrors
+
+    def _cron_enabled(self):
+        return (
             "cron-schedule" in self._stored.config
             and self._stored.config["cron-schedule"] != "None"  # noqa: W503
-        ):
+        )
+
+    def _cron_path(self):
+        return "/etc/cron.d/{}".format(self.model.app.name)
+
+    def _refresh_cron_job(self):
+        if self._cron_enabled():
             self._setup_cron_job(self._stored.config)
 
     def _on_synchronize_action(self, event):
-        selectors = self._stored.config["image-selectors"]
-        for selector in selectors.splitlines():
-            logger.info("Syncing {}".format(selector))
-            env = _get_env()
-            try:
-                subprocess.check_output(
-                    self._sync_selector_cmd(selector), env=env, stderr=subprocess.STDOUT
+        state_dir = self._sync_state_dir()
+        if syncjob.is_running(state_dir):
+            event.fail(
+                "Sync job {} is already running".format(
+                    syncjob.read_status(state_dir).get("job-id")
                 )
-                logger.info("Syncing complete")
-            except subprocess.CalledProcessError as e:
-                logger.info("Error {}".format(e.output))
-                event.fail(e.output)
-                return
+            )
+            return
+        force = event.params.get("force", False)
+        config = self._sync_config()
+        if not event.params.get("wait", False):
+            job_id = syncjob.start(
+                state_dir, config, force=force, python=sys.executable, env=_get_env()
+            )
+            event.set_results({"job-id": job_id})
+            return
+        os.makedirs(state_dir, exist_ok=True)
+        state.write_json("{}/{}".format(state_dir, syncjob.CONFIG_FILE), config)
+        os.environ.update(_get_env())
+        try:
+            status = syncjob.SyncJob(state_dir, force=force).run()
+        except syncjob.AlreadyRunning as e:
+            event.fail("Sync job {} is already running".format(e))
+            return
+        event.set_results(dict(status["results"], **{"job-id": status["job-id"]}))
+        if status["phase"] != "done":
+            event.fail(status.get("message", "Sync {}".format(status["phase"])))
+
+    def _on_sync_status_action(self, event):
+        status = syncjob.read_status(self._sync_state_dir())
+        if not status:
+            event.fail("No sync job has run")
+            return
+        if status.get("phase") not in syncjob.TERMINAL_PHASES and not syncjob.is_running(
+            self._sync_state_dir()
+        ):
+            status["phase"] = "lost"
+        results = {
+            key: str(value)
+            for key, value in status.items()
+            if key not in ("results", "pid") and value is not None
+        }
+        results["results"] = status.get("results", {})
+        event.set_results(results)
+
+    def _on_cancel_sync_action(self, event):
+        if not syncjob.cancel(self._sync_state_dir()):
+            event.fail("No sync job is running")
+            return
+        event.set_results(
+            {"job-id": syncjob.read_status(self._sync_state_dir()).get("job-id", "")}
+        )
 
     def _on_create_snapshot_action(self, event):
         snapshot_name = self._get_snapshot_name()
@@ -105,9 +364,18 @@ class SimpleStreamsCharm(CharmBase):
         download_root = self._image_download_dir()
         if not os.path.exists(snapshot_root):
             os.makedirs(snapshot_root)
+        dedup = (
+            self._stored.config["copy-on-snapshot"]
+            and self._stored.config.get("snapshot-copy-mode") == "dedup"  # noqa: W503
+        )
+        if dedup:
+            digests = streams.item_digests("{}/.data".format(download_root))
+            store = "{}/{}".format(self._stored.config["image-dir"], snapshots.STORE_DIR)
         for product in next(os.walk(download_root))[1]:
             if ".data" != product:
-                if self._stored.config["copy-on-snapshot"]:
+                if dedup:
+                    snapshots.dedup_copytree(download_root, snapshot_root, product, digests, store)
+                elif self._stored.config["copy-on-snapshot"]:
                     shutil.copytree(
                         "{}/{}".format(download_root, product),
                         "{}/{}".format(snapshot_root, product),
@@ -117,20 +385,125 @@ class SimpleStreamsCharm(CharmBase):
                         "{}/{}".format(download_root, product),
                         "{}/{}".format(snapshot_root, product),
                     )
-        shutil.copytree("{}/.data".format(download_root), "{}/.data".format(snapshot_root))
+        previous = snapshots.previous_snapshot(self._stored.config["image-dir"], snapshot_name)
+        summary = snapshots.incremental_copytree(
+            "{}/.data".format(download_root),
+            "{}/.data".format(snapshot_root),
+            "{}/.data".format(previous) if previous else None,
+        )
+        created = manifest.load(download_root)
+        if created:
+            created["created"] = time.time()
+            manifest.write(snapshot_root, created)
+        else:
+            created = manifest.update(snapshot_root)
+        summary.update(name=snapshot_name, items=created["items"], bytes=created["bytes"])
+        encodings = precompress.available(self._stored.config.get("metadata-compression"))
+        if encodings:
+            precompress.compress_tree(snapshot_root, encodings, source=download_root)
+        if self._stored.config["copy-on-snapshot"] and not dedup:
+            usage = {"bytes": created["bytes"], "new-bytes": created["bytes"]}
+        else:
+            # item data is linked or shared with latest, only metadata is new
+            usage = {"bytes": summary["bytes-changed"], "new-bytes": summary["bytes-changed"]}
+        self._adjust_usage({snapshot_name: usage})
+        event.set_results({key: str(value) for key, value in summary.items()})
 
     def _on_delete_snapshot_action(self, event):
         snapshot = event.params["name"]
         logger.info("Delete snapshot {}".format(snapshot))
         shutil.rmtree("{}/{}".format(self._stored.config["image-dir"], snapshot))
+        self._adjust_usage({snapshot: None})
+
+    def _on_gc_action(self, event):
+        if syncjob.is_running(self._sync_state_dir()):
+            event.fail("Cannot collect garbage while a sync job is running")
+            return
+        try:
+            summary = reclaim.collect(
+                self._stored.config["image-dir"],
+                keep_count=self._stored.config.get("snapshot-keep-count") or 0,
+                keep_days=self._stored.config.get("snapshot-keep-days") or 0,
+                dry_run=event.params.get("dry-run", False),
+            )
+        except ValueError as e:
+            event.fail(str(e))
+            return
+        if not summary["dry-run"]:
+            self._adjust_usage(dict.fromkeys(summary["snapshots"]))
+        results = {key: str(value) for key, value in summary.items() if key != "snapshots"}
+        results["snapshots"] = summary["snapshots"]
+        event.set_results(results)
+
+    def _on_plan_sync_action(self, event):
+        config = self._sync_config()
+        for key in ("image-selectors", "image-max"):
+            if event.params.get(key):
+                config[key] = event.params[key]
+        os.environ.update(_get_env())
+        try:
+            plan = planner.plan(config, self._sync_state_dir())
+        except (OSError, ValueError) as e:
+            event.fail("Cannot plan sync: {}".format(e))
+            return
+        event.set_results(_plan_results(plan))
+
+    def _on_diff_snapshots_action(self, event):
+        roots = []
+        for param in ("from", "to"):
+            name = event.params.get(param) or ("publish" if param == "from" else "latest")
+            root = "{}/{}".format(self._stored.config["image-dir"], name)
+            if not os.path.isdir(root):
+                event.fail("Snapshot {} does not exist".format(name))
+                return
+            roots.append(root)
+        try:
+            report = compare.diff(*roots)
+        except ValueError as e:
+            event.fail(str(e))
+            return
+        event.set_results(_diff_results(report))
+
+    def _on_verify_action(self, event):
+        name = event.params.get("name") or "latest"
+        root = "{}/{}".format(self._stored.config["image-dir"], name)
+        if not os.path.isdir(root):
+            event.fail("Snapshot does not exist")
+            return
+        report = self._verify(root)
+        event.set_results(_verify_results(report))
+        if report["missing"] or report["corrupt"]:
+            event.fail(
+                "{} missing and {} corrupt items".format(
+                    len(report["missing"]), len(report["corrupt"])
+                )
+            )
+
+    def _verify(self, root):
+        state_dir = self._sync_state_dir()
+        os.makedirs(state_dir, exist_ok=True)
+        return verify.verify(root, "{}/{}".format(state_dir, verify.CACHE_FILE))
 
     def _on_list_snapshots_action(self, event):
         snapshots = []
+        details = {}
+        usage = capacity.load(self._sync_state_dir()).get("trees", {})
         for directory in next(os.walk("{}/".format(self._stored.config["image-dir"])))[1]:
             if directory.startswith("snapshot-"):
                 snapshots.append(directory)
+                summary = manifest.load_summary(
+                    "{}/{}".format(self._stored.config["image-dir"], directory)
+                )
+                details[directory] = {
+                    key: str(value) for key, value in summary.items() if value is not None
+                }
+                if summary.get("created") is not None:
+                    details[directory]["created"] = time.ctime(summary["created"])
+                if directory in usage:
+                    details[directory]["disk-bytes"] = str(usage[directory]["bytes"])
+                    details[directory]["new-bytes"] = str(usage[directory]["new-bytes"])
         logger.info("List snapshots {}".format(snapshots))
-        event.set_results({"snapshots": snapshots})
+        event.set_results({"snapshots": snapshots, "details": details})
 
     def _on_publish_snapshot_action(self, event):
         name = event.params["name"]
@@ -140,50 +513,56 @@ class SimpleStreamsCharm(CharmBase):
         if not os.path.isdir(snapshot_path):
             event.fail("Snapshot does not exist")
             return
+        if event.params.get("verify", False):
+            report = self._verify(snapshot_path)
+            if report["missing"] or report["corrupt"]:
+                event.set_results(_verify_results(report))
+                event.fail("Snapshot {} failed verification".format(name))
+                return
         if os.path.islink(publish_path):
             os.unlink(publish_path)
         os.symlink(snapshot_path, publish_path)
         event.set_results({name: publish_path})
 
-    def _sync_selector_cmd(self, selector, esc_char=None):
-        cmd = [
-            "sstream-mirror",
-        ]
-        if "keep" not in self._stored.config or self._stored.config["keep"]:
-            cmd.append("--keep")
-        if (
-            "keyring-file" not in self._stored.config
-            or not self._stored.config["keyring-file"]  # noqa: W503
-        ):
-            cmd.append("--no-verify")
-        else:
-            cmd.append("--keyring={}".format(self._stored.config["keyring-file"]))
-        if self._stored.config["verbose"]:
-            cmd.append("--verbose")
-        if "path" in self._stored.config and self._stored.config["path"]:
-            cmd.append("--path={}".format(self._stored.config["path"]))
-        if "log-file" in self._stored.config and self._stored.config["log-file"]:
-            cmd.append("--log-file={}".format(self._stored.config["log-file"]))
-        if self._stored.config["image-max"]:
-            cmd.append("--max={}".format(self._stored.config["image-max"]))
-        cmd.append(self._stored.config["image-source"])
-        cmd.append(self._image_download_dir())
-        for s in selector.split():
-            if esc_char:
-                cmd.append("{}{}{}".format(esc_char, s, esc_char))
-            else:
-                cmd.append(s)
-        return cmd
-
     def _setup_cron_job(self, config):
-        with open("/etc/cron.d/{}".format(self.model.app.name), "w") as f:
-            for selector in config["image-selectors"].splitlines():
-                f.write(
-                    "{} root {}\n".format(
-                        config["cron-schedule"],
-                        " ".join(self._sync_selector_cmd(selector, "'")),
-                    )
-                )
+        """Write the job configuration and cron entry unless they are unchanged."""
+        state_dir = self._sync_state_dir()
+        sync_config = self._sync_config()
+        entry = "{} root python3 {}/src/syncjob.py --state-dir={} --scheduled\n".format(
+            config["cron-schedule"], self.charm_dir, state_dir
+        )
+        cron_path = self._cron_path()
+        cron_hash = _digest(sync_config, entry)
+        if cron_hash == self._stored.cron_hash and os.path.exists(cron_path):
+            return
+        os.makedirs(state_dir, exist_ok=True)
+        state.write_json("{}/{}".format(state_dir, syncjob.CONFIG_FILE), sync_config)
+        with open(cron_path, "w") as f:
+            f.write(entry)
+        self._stored.cron_hash = cron_hash
+
+    def _sync_config(self):
+        """Return the configuration sync jobs run with."""
+        return dict(
+            self._stored.config,
+            target=self._image_download_dir(),
+            app=self.model.app.name,
+            unit=self.unit.name,
+            peers=self._peer_mirrors(),
+        )
+
+    def _adjust_usage(self, trees):
+        """Update the disk usage update-status reports for trees a hook added or removed.
+
+        Walking every tree is left to the sync job; see capacity.adjust.
+        """
+        try:
+            capacity.adjust(self._sync_state_dir(), self._stored.config["image-dir"], trees)
+        except OSError as e:
+            logger.info("Cannot update disk usage: {}".format(e))
+
+    def _sync_state_dir(self):
+        return "/var/lib/{}".format(self.model.app.name)
 
     def _image_download_dir(self):
         return "{}/latest".format(self._stored.config["image-dir"])
@@ -0,0 +1,80 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Compare the products metadata of two trees, such as two snapshots.
+
+Each products document under ``.data`` is loaded on its own and reduced to
+the sha256 and size of the items of each product version, so memory use is
+bounded by the largest document and the number of versions rather than by
+the size of the metadata.  Documents that are the same file in both trees,
+as snapshots share unchanged metadata through hardlinks, are not read.
+"""
+
+import os
+
+import streams
+
+
+def _shared(old_dir, new_dir):
+    """Return the relative paths of the documents both trees share."""
+    shared = set()
+    for path in streams.data_files(new_dir):
+        rel_path = os.path.relpath(path, new_dir)
+        try:
+            if os.path.samefile(path, os.path.join(old_dir, rel_path)):
+                shared.add(rel_path)
+        except OSError:
+            pass
+    return shared
+
+
+def _versions(data_dir, skip=()):
+    """Yield ("product version", {item: (sha256, size)}) for the documents of data_dir."""
+    for path in streams.data_files(data_dir):
+        if os.path.relpath(path, data_dir) in skip:
+            continue
+        data = streams.load_products(path)
+        if data is None:
+            continue
+        versions = {}
+        for item in streams.items_of(data):
+            key = "{} {}".format(item["product"], item["version"])
+            versions.setdefault(key, {})[item["item"]] = (item["sha256"], item["size"])
+        yield from versions.items()
+
+
+def _size(items):
+    return sum(size for _, size in items.values())
+
+
+def diff(old_root, new_root):
+    """Report the product versions added, removed and changed from old_root to new_root.
+
+    Versions are listed as "product version"; the byte counts are those of
+    the added and removed items, and of the new or different items of the
+    changed versions.
+    """
+    for root in (old_root, new_root):
+        if not os.path.isdir(os.path.join(root, ".data")):
+            raise ValueError("{} has no stream metadata".format(root))
+    old_dir, new_dir = os.path.join(old_root, ".data"), os.path.join(new_root, ".data")
+    shared = _shared(old_dir, new_dir)
+    old = dict(_versions(old_dir, shared))
+    report = {"added": [], "removed": [], "changed": []}
+    report.update({"added-bytes": 0, "removed-bytes": 0, "changed-bytes": 0})
+    for key, items in _versions(new_dir, shared):
+        before = old.pop(key, None)
+        if before is None:
+            report["added"].append(key)
+            report["added-bytes"] += _size(items)
+        elif before != items:
+            report["changed"].append(key)
+            report["changed-bytes"] += _size(
+                {name: item for name, item in items.items() if before.get(name) != item}
+            )
+    for key, items in old.items():
+        report["removed"].append(key)
+        report["removed-bytes"] += _size(items)
+    for key in ("added", "removed", "changed"):
+        report[key].sort()
+    return report
@@ -0,0 +1,227 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Resumable, optionally segmented HTTP downloads of stream items.
+
+Data is written to ``<dest>.partial`` and the progress of each byte range is
+kept in ``<dest>.partial.json``, so an interrupted download continues where
+it stopped with HTTP Range requests, from the same or an equivalent mirror.
+Large files can be fetched as several concurrent ranges, a transfer can
+be paced by a throttle, and one that stays below a minimum rate is
+abandoned so the caller can fail over.
+The file is checked against the expected sha256 before it is moved into
+place.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+MIN_SEGMENT_SIZE = 64 * 1024 * 1024
+SAVE_INTERVAL = 64 * CHUNK_SIZE
+TIMEOUT = 60
+# seconds over which the transfer rate is compared with min_rate
+RATE_WINDOW = 30
+
+
+class DownloadError(Exception):
+    """The item could not be downloaded; any partial data is kept."""
+
+
+class ChecksumError(DownloadError):
+    """The downloaded data does not match the expected sha256."""
+
+
+class Interrupted(DownloadError):
+    """The download was stopped on request; partial data is kept."""
+
+
+class RangeNotSupported(DownloadError):
+    """The server answered a range request with the whole file."""
+
+
+class TooSlow(DownloadError):
+    """The transfer rate dropped below the floor; partial data is kept."""
+
+
+def sha256sum(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _segments(size, count):
+    """Split size bytes into [start, end, done] ranges of at least MIN_SEGMENT_SIZE."""
+    count = max(1, min(count, size // MIN_SEGMENT_SIZE))
+    step = max(1, -(-size // count))
+    return [[start, min(start + step, size), start] for start in range(0, size, step)] or [
+        [0, 0, 0]
+    ]
+
+
+class Download:
+    """Fetch one URL to dest, resuming any previous partial download."""
+
+    def __init__(
+        self, url, dest, size=None, sha256=None, segments=1, stop=None, min_rate=0, throttle=None
+    ):
+        self.url = url
+        self.dest = dest
+        self.size = size
+        self.sha256 = sha256
+        self.segments = segments
+        self.stop = stop
+        self.min_rate = min_rate
+        self.throttle = throttle
+        self.partial = "{}.partial".format(dest)
+        self.state_path = "{}.partial.json".format(dest)
+        self.downloaded = 0
+        self._lock = threading.Lock()
+        self._unsaved = 0
+
+    def run(self):
+        """Download, verify and move the file into place; return bytes fetched."""
+        os.makedirs(os.path.dirname(self.dest) or ".", exist_ok=True)
+        state = self._load_state()
+        if state is None:
+            state = self._new_state()
+        self.state = state
+        mode = "r+b" if os.path.exists(self.partial) else "w+b"
+        with open(self.partial, mode) as f:
+            if state["size"] is not None:
+                f.truncate(state["size"])
+            try:
+                try:
+                    self._fetch_pending(f)
+                except RangeNotSupported:
+                    logger.info("{} does not support ranges, fetching it whole".format(self.url))
+                    state["segments"] = [[0, state["size"], 0]]
+                    f.truncate(state["size"] or 0)
+                    self._fetch_pending(f)
+            finally:
+                self._save_state()
+        if self.sha256 and sha256sum(self.partial) != self.sha256:
+            self._discard()
+            raise ChecksumError("Checksum mismatch for {}".format(self.url))
+        os.replace(self.partial, self.dest)
+        os.unlink(self.state_path)
+        return self.downloaded
+
+    def _fetch_pending(self, f):
+        pending = [s for s in self.state["segments"] if s[1] is None or s[2] < s[1]]
+        if len(pending) > 1:
+            with ThreadPoolExecutor(max_workers=len(pending)) as executor:
+                list(executor.map(lambda segment: self._fetch(f, segment), pending))
+        elif pending:
+            self._fetch(f, pending[0])
+
+    def _load_state(self):
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # the same checksum identifies the same file on another mirror
+        if (
+            (state.get("url") != self.url and not self.sha256)
+            or state.get("sha256") != self.sha256  # noqa: W503
+            or state.get("size") != self.size  # noqa: W503
+            or not os.path.exists(self.partial)  # noqa: W503
+        ):
+            self._discard()
+            return None
+        logger.info("Resuming download of {}".format(self.url))
+        state["url"] = self.url
+        return state
+
+    def _new_state(self):
+        if os.path.exists(self.partial):
+            os.unlink(self.partial)
+        if self.size is None:
+            segments = [[0, None, 0]]
+        else:
+            segments = _segments(self.size, self.segments)
+        return {"url": self.url, "sha256": self.sha256, "size": self.size, "segments": segments}
+
+    def _save_state(self):
+        with self._lock:
+            tmp = "{}.tmp".format(self.state_path)
+            with open(tmp, "w") as f:
+                json.dump(self.state, f)
+            os.replace(tmp, self.state_path)
+            self._unsaved = 0
+
+    def _discard(self):
+        for path in (self.partial, self.state_path):
+            if os.path.exists(path):
+                os.unlink(path)
+
+    def _fetch(self, f, segment):
+        _, end, offset = segment
+        request = urllib.request.Request(self.url)
+        if offset or end is not None and end < (self.size or 0):
+            last = "" if end is None else end - 1
+            request.add_header("Range", "bytes={}-{}".format(offset, last))
+        try:
+            response = urllib.request.urlopen(request, timeout=TIMEOUT)
+        except OSError as e:
+            raise DownloadError("Error fetching {}: {}".format(self.url, e))
+        with response:
+            if request.has_header("Range") and response.status != 206:
+                raise RangeNotSupported(self.url)
+            window_start, window_offset = time.monotonic(), offset
+            try:
+                for chunk in iter(lambda: response.read(CHUNK_SIZE), b""):
+                    if self.stop and self.stop():
+                        raise Interrupted("Download of {} interrupted".format(self.url))
+                    os.pwrite(f.fileno(), chunk, offset)
+                    offset += len(chunk)
+                    if self.throttle:
+                        # time spent held back does not count against min_rate
+                        window_start += self.throttle(len(chunk))
+                    elapsed = time.monotonic() - window_start
+                    if self.min_rate and elapsed >= RATE_WINDOW:
+                        if (offset - window_offset) / elapsed < self.min_rate:
+                            raise TooSlow(
+                                "Download of {} below {} B/s".format(self.url, self.min_rate)
+                            )
+                        window_start, window_offset = time.monotonic(), offset
+                    with self._lock:
+                        segment[2] = offset
+                        self.downloaded += len(chunk)
+                        self._unsaved += len(chunk)
+                        save = self._unsaved >= SAVE_INTERVAL
+                    if save:
+                        self._save_state()
+            except OSError as e:
+                raise DownloadError("Error fetching {}: {}".format(self.url, e))
+        if end is not None and offset < end:
+            raise DownloadError("Short read fetching {}".format(self.url))
+
+
+def fetch(url, dest, size=None, sha256=None, segments=1, stop=None, min_rate=0, throttle=None):
+    """Download url to dest; see Download.  Returns the bytes transferred.
+
+    throttle, if given, is called with the size of every chunk received and
+    returns the seconds it held the transfer back.
+    """
+    return Download(
+        url,
+        dest,
+        size=size,
+        sha256=sha256,
+        segments=segments,
+        stop=stop,
+        min_rate=min_rate,
+        throttle=throttle,
+    ).run()
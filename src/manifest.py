@@ -0,0 +1,90 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Keep a compact manifest of what a mirror or snapshot tree holds.
+
+The manifest lists every item of the products metadata under ``.data`` by
+product and version, with its path, size and sha256, along with the item
+count, total size and creation time of the tree.  It is written to
+``.manifest.json`` at the root of the tree after each sync and snapshot,
+and its totals alone to ``.manifest-summary.json``, so that status
+reporting reads one small file instead of parsing every item or walking
+the images.
+"""
+
+import os
+import time
+
+import state
+import streams
+
+MANIFEST_FILE = ".manifest.json"
+SUMMARY_FILE = ".manifest-summary.json"
+
+
+def build(data_dir, created=None):
+    """Return the manifest of the items described under data_dir."""
+    products = {}
+    sizes = {}
+    for item in streams.iter_items(data_dir):
+        versions = products.setdefault(item["product"], {})
+        versions.setdefault(item["version"], {})[item["item"]] = {
+            "path": item["path"],
+            "size": item["size"],
+            "sha256": item["sha256"],
+        }
+        # items shared between content ids are only on disk once
+        sizes[item["path"]] = item["size"]
+    return {
+        "created": time.time() if created is None else created,
+        "items": len(sizes),
+        "bytes": sum(sizes.values()),
+        "products": products,
+    }
+
+
+def path_of(root):
+    return os.path.join(root, MANIFEST_FILE)
+
+
+def write(root, manifest):
+    """Replace the manifest of the tree at root, and its summary, atomically."""
+    state.write_json(path_of(root), manifest, indent=None)
+    state.write_json(os.path.join(root, SUMMARY_FILE), summary(manifest), indent=None)
+
+
+def load(root):
+    """Return the manifest of the tree at root, or {} if it has none."""
+    return state.read_json(path_of(root))
+
+
+def load_summary(root):
+    """Return the totals of the tree at root, or {} if it has no manifest.
+
+    Trees written before summaries were kept get theirs from the manifest,
+    once.
+    """
+    totals = state.read_json(os.path.join(root, SUMMARY_FILE))
+    if totals:
+        return totals
+    manifest = load(root)
+    if not manifest:
+        return {}
+    totals = summary(manifest)
+    try:
+        state.write_json(os.path.join(root, SUMMARY_FILE), totals, indent=None)
+    except OSError:
+        pass
+    return totals
+
+
+def update(root, created=None):
+    """Rebuild the manifest of the tree at root from its metadata."""
+    manifest = build(os.path.join(root, ".data"), created)
+    write(root, manifest)
+    return manifest
+
+
+def summary(manifest):
+    """Return the totals of a manifest without the per-item listing."""
+    return {key: manifest.get(key) for key in ("items", "bytes", "created")}
@@ -0,0 +1,183 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Per-selector sync timing and throughput metrics, and hook timings.
+
+Measurements are merged into ``metrics.json`` in the sync state directory so
+that runs started by the synchronize action and by cron update the same
+records, which are then rendered for the node-exporter textfile collector.
+The duration of the charm's hooks and actions is kept the same way in
+``hook-metrics.json``.
+"""
+
+import logging
+import os
+import time
+
+import state
+import streams
+
+logger = logging.getLogger(__name__)
+
+METRICS_FILE = "metrics.json"
+HOOK_METRICS_FILE = "hook-metrics.json"
+PREFIX = "simplestreams_sync"
+# record key, metric name, Prometheus type and help text of each metric
+SELECTOR_METRICS = (
+    (
+        "duration-seconds",
+        "duration_seconds",
+        "gauge",
+        "Wall time of the last sync of the selector.",
+    ),
+    ("bytes-downloaded", "bytes_downloaded", "gauge", "Bytes of items fetched by the last sync."),
+    ("files-fetched", "files_fetched", "gauge", "Items fetched by the last sync."),
+    ("files-skipped", "files_skipped", "gauge", "Items already present during the last sync."),
+    (
+        "throughput-bytes-per-second",
+        "throughput_bytes_per_second",
+        "gauge",
+        "Effective download throughput of the last sync.",
+    ),
+    ("success", "success", "gauge", "Whether the last sync of the selector succeeded."),
+    (
+        "timestamp",
+        "timestamp_seconds",
+        "gauge",
+        "Completion time of the last sync of the selector.",
+    ),
+)
+HOOK_METRICS = (
+    (
+        "duration-seconds",
+        "hook_duration_seconds",
+        "gauge",
+        "Wall time of the last run of the hook.",
+    ),
+    (
+        "total-seconds",
+        "hook_duration_seconds_total",
+        "counter",
+        "Wall time of all runs of the hook.",
+    ),
+    ("count", "hook_runs_total", "counter", "Runs of the hook."),
+    (
+        "timestamp",
+        "hook_timestamp_seconds",
+        "gauge",
+        "Completion time of the last run of the hook.",
+    ),
+)
+
+
+def selector_sizes(target, selectors):
+    """Map each selector to the sizes of the mirrored items it selects, by path.
+
+    The products under ``.data`` are parsed once for all selectors.
+    """
+    terms = {}
+    for selector in selectors:
+        try:
+            terms[selector] = streams.parse_selector(selector)
+        except ValueError as e:
+            logger.info("Cannot measure selector {}: {}".format(selector, e))
+    sizes = {selector: {} for selector in selectors}
+    if not terms:
+        return sizes
+    for item in streams.iter_items(os.path.join(target, ".data")):
+        for selector, selector_terms in terms.items():
+            if streams.matches(selector_terms, item["fields"]):
+                sizes[selector][item["path"]] = item["size"]
+    return sizes
+
+
+def item_sizes(target, selector):
+    """Map the path of each mirrored item the selector selects to its size."""
+    return selector_sizes(target, [selector])[selector]
+
+
+def selector_metrics(before, after, duration, success=True):
+    """Compare the items present before and after a sync of one selector."""
+    fetched = {path: size for path, size in after.items() if before.get(path) != size}
+    downloaded = sum(fetched.values())
+    return {
+        "duration-seconds": round(duration, 3),
+        "bytes-downloaded": downloaded,
+        "files-fetched": len(fetched),
+        "files-skipped": len(after) - len(fetched),
+        "throughput-bytes-per-second": round(downloaded / duration) if duration > 0 else 0,
+        "success": int(success),
+        "timestamp": round(time.time()),
+    }
+
+
+def record(state_dir, values, filename=METRICS_FILE, merge=None):
+    """Merge per-selector measurements into the metrics state; return all records.
+
+    merge, if given, is called with the records and the new values and
+    returns the updated records, instead of replacing the previous values.
+    """
+
+    def apply(records):
+        if merge:
+            return merge(records, values)
+        return dict(records, **values)
+
+    return state.update_json(os.path.join(state_dir, filename), apply)
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render(app, records, definitions=SELECTOR_METRICS, label="selector"):
+    """Render metric records in the Prometheus text exposition format."""
+    lines = []
+    for key, name, metric_type, help_text in definitions:
+        lines.append("# HELP {}_{} {}".format(PREFIX, name, help_text))
+        lines.append("# TYPE {}_{} {}".format(PREFIX, name, metric_type))
+        for subject in sorted(records):
+            if key in records[subject]:
+                lines.append(
+                    '{}_{}{{app="{}",{}="{}"}} {}'.format(
+                        PREFIX, name, _label(app), label, _label(subject), records[subject][key]
+                    )
+                )
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(textfile_dir, app, records, name="sync"):
+    """Write the node-exporter textfile, if the collector directory exists.
+
+    name selects the sync or the hook metrics.
+    """
+    if not textfile_dir or not os.path.isdir(textfile_dir):
+        return None
+    if name == "hooks":
+        path = os.path.join(textfile_dir, "simple-streams-{}-hooks.prom".format(app))
+        content = render(app, records, HOOK_METRICS, "hook")
+    else:
+        path = os.path.join(textfile_dir, "simple-streams-{}.prom".format(app))
+        content = render(app, records)
+    tmp = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp, "w") as f:
+        f.write(content)
+    os.replace(tmp, path)
+    return path
+
+
+def _add_hook_run(records, values):
+    for hook, duration in values.items():
+        previous = records.get(hook, {})
+        records[hook] = {
+            "duration-seconds": round(duration, 3),
+            "total-seconds": round(previous.get("total-seconds", 0) + duration, 3),
+            "count": previous.get("count", 0) + 1,
+            "timestamp": round(time.time()),
+        }
+    return records
+
+
+def record_hook(state_dir, hook, duration):
+    """Add a run of hook lasting duration seconds to the hook metrics; return all records."""
+    return record(state_dir, {hook: duration}, HOOK_METRICS_FILE, _add_hook_run)
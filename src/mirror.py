@@ -0,0 +1,201 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""In-process mirroring of several image selectors in a single pass.
+
+The simplestreams library is installed from the archive by the charm's install
+hook, so it is imported lazily rather than at module load time.  Items from
+HTTP mirrors are fetched with the resumable downloader in download.py,
+several at a time if asked; the products metadata is still written once per
+content id, after all of its items are in place.
+"""
+
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import download
+
+logger = logging.getLogger(__name__)
+
+
+def _simplestreams():
+    from simplestreams import filters, mirrors, objectstores, util
+
+    return filters, mirrors, objectstores, util
+
+
+def _union_filter_mirror(mirrors, filters, util, progress=None, fetch=None, executor=None):
+    """Build an object store mirror that keeps items matching any selector.
+
+    With an executor, fetch runs there and the products are written once
+    the downloads queued for them have finished.
+    """
+
+    class UnionFilterMirror(mirrors.ObjectFilterMirror):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.filter_sets = self.config.get("filter_sets", [])
+            self.inserted = []
+            self.owners = {}
+            self.stats = [{"matched": 0, "fetched": 0, "bytes": 0} for _ in self.filter_sets]
+            self.pending = {}
+
+        def filter_item(self, data, src, target, pedigree):
+            for i, filter_set in enumerate(self.filter_sets):
+                if filters.filter_item(filter_set, data, src, pedigree):
+                    # attribute the item to the first selector that matches it
+                    self.owners[pedigree] = i
+                    self.stats[i]["matched"] += 1
+                    return True
+            return False
+
+        def insert_item(self, data, src, target, pedigree, contentsource):
+            if fetch and data.get("path"):
+                # do what the parent does, with the downloader in place of the store
+                util.products_set(target, data, pedigree)
+                if contentsource is not None:
+                    contentsource.close()
+                self._drain()
+                if executor is None:
+                    self._fetch(data)
+                elif data["path"] not in self.pending:
+                    self.pending[data["path"]] = executor.submit(self._fetch, data)
+                self._inc_rc(data["path"], src, pedigree)
+            else:
+                super().insert_item(data, src, target, pedigree, contentsource)
+                if progress:
+                    progress(data.get("path"), int(data.get("size") or 0))
+            size = int(data.get("size") or 0)
+            self.inserted.append((pedigree, data.get("path"), size))
+            if pedigree in self.owners:
+                self.stats[self.owners[pedigree]]["fetched"] += 1
+                self.stats[self.owners[pedigree]]["bytes"] += size
+
+        def insert_products(self, path, target, content):
+            self._drain(wait=True)
+            super().insert_products(path, target, content)
+
+        def _fetch(self, data):
+            fetch(data)
+            if progress:
+                progress(data["path"], int(data.get("size") or 0))
+
+        def _drain(self, wait=False):
+            """Raise the error of a failed download, waiting for all of them if wait is set."""
+            for path, future in list(self.pending.items()):
+                if not wait and not future.done():
+                    continue
+                try:
+                    future.result()
+                except Exception:
+                    for other in self.pending.values():
+                        other.cancel()
+                    raise
+                del self.pending[path]
+
+    return UnionFilterMirror
+
+
+def _item_fetcher(mirror_urls, target, segments, stop, min_rate=0, throttle=None):
+    """Return a function downloading an item into target, for HTTP mirrors.
+
+    The mirrors are tried in order; one that fails or is slower than
+    min_rate bytes per second hands the partial download on to the next.
+    The last mirror has nothing to hand over to, so it is never too slow.
+    """
+    mirror_urls = [url for url in mirror_urls if url.startswith(("http://", "https://"))]
+    if not mirror_urls:
+        return None
+
+    def fetch(item):
+        dest = os.path.join(target, item["path"])
+        size = int(item["size"]) if item.get("size") else None
+        if size is not None and os.path.isfile(dest) and os.path.getsize(dest) == size:
+            return
+        for i, mirror_url in enumerate(mirror_urls):
+            try:
+                download.fetch(
+                    "{}/{}".format(mirror_url.rstrip("/"), item["path"]),
+                    dest,
+                    size=size,
+                    sha256=item.get("sha256"),
+                    segments=segments,
+                    stop=stop,
+                    min_rate=min_rate if i < len(mirror_urls) - 1 else 0,
+                    throttle=throttle,
+                )
+                return
+            except download.Interrupted:
+                raise
+            except download.DownloadError as e:
+                if i == len(mirror_urls) - 1:
+                    raise
+                logger.info("{}, trying {}".format(e, mirror_urls[i + 1]))
+
+    return fetch
+
+
+def sync(
+    source,
+    target,
+    selectors,
+    keyring=None,
+    path=None,
+    max_items=None,
+    keep=True,
+    progress=None,
+    segments=1,
+    stop=None,
+    fallbacks=(),
+    min_rate=0,
+    throttle=None,
+    workers=1,
+):
+    """Mirror the union of all selectors from source into target.
+
+    The upstream index and products files are fetched and, when a keyring is
+    given, signature-verified once; every selector is then evaluated against
+    the same parsed tree.  progress, if given, is called with the path and
+    size of each item once it is in place.  Items larger than
+    download.MIN_SEGMENT_SIZE are fetched as up to ``segments`` concurrent
+    ranges, and stop, if given, is polled to interrupt a download while
+    keeping its partial data.  Items failing to download from source, or
+    slower than min_rate bytes per second, are fetched from the equivalent
+    mirrors in fallbacks, in order.  throttle, if given, paces the item
+    downloads; see download.fetch.  Up to workers items are downloaded at
+    once, and the products metadata of each content id is only written
+    once all of its items are in place.  Returns a summary of the items inserted,
+    with per-selector counts of matched and fetched items in ``selectors``.
+    """
+    filters, mirrors, objectstores, util = _simplestreams()
+    mirror_url, initial_path = util.path_from_mirror_url(source, path)
+
+    def policy(content, path):
+        if initial_path.endswith("sjson"):
+            return util.read_signed(content, keyring=keyring, checked=bool(keyring))
+        return content
+
+    reader = mirrors.UrlMirrorReader(mirror_url, policy=policy)
+    config = {
+        "max_items": max_items,
+        "keep_items": keep,
+        "filters": [],
+        "filter_sets": [filters.get_filters(selector.split()) for selector in selectors],
+        "item_download": True,
+    }
+    fetch = _item_fetcher(
+        [mirror_url] + list(fallbacks), target, segments, stop, min_rate, throttle
+    )
+    store = objectstores.FileStore(target)
+    logger.info("Syncing {} selectors from {}".format(len(selectors), mirror_url))
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        writer = _union_filter_mirror(
+            mirrors, filters, util, progress, fetch, executor if workers > 1 else None
+        )(config=config, objectstore=store)
+        writer.sync(reader, initial_path)
+    return {
+        "items": len(writer.inserted),
+        "bytes": sum(size for _, _, size in writer.inserted),
+        "selectors": writer.stats,
+    }
@@ -0,0 +1,37 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Share the work of a sync between the units of the application.
+
+Every unit that advertises a mirror URL on the peer relation owns a shard
+of the image selectors, chosen by rendezvous hashing of the selector and
+the unit names so that all units agree on the owners without a leader and
+only the shards of departing units move.  A unit syncs the selectors it
+owns from ``image-source`` and every other selector from the ``latest``
+tree of its owner, with the same keyring, so signatures and item checksums
+are still verified.
+"""
+
+import hashlib
+
+
+def owner(selector, units):
+    """Return the unit responsible for fetching selector from upstream."""
+    return max(
+        sorted(units),
+        key=lambda unit: hashlib.sha256("{}\0{}".format(unit, selector).encode()).digest(),
+    )
+
+
+def source_for(config, selector):
+    """Return the (source, owner) a selector should be synced from.
+
+    config carries this unit's name in ``unit`` and the mirror URL of every
+    unit sharing the work, this one included, in ``peers``.  The owner is
+    None when the selector comes straight from ``image-source``.
+    """
+    mirrors = config.get("peers") or {}
+    unit = owner(selector, mirrors) if mirrors else None
+    if unit is None or unit == config.get("unit"):
+        return config["image-source"], None
+    return mirrors[unit], unit
@@ -0,0 +1,117 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Work out what the next sync would transfer, from the metadata alone.
+
+The upstream index and the products files it lists are fetched (and, with
+a keyring, signature-checked); each selector is evaluated against them as
+sstream-mirror would, keeping the newest ``image-max`` versions of every
+product that has matching items.  The selected items are compared with the
+items present in the download directory to list what a sync would add
+and, without ``keep``, what it would prune.
+"""
+
+import logging
+import os
+import urllib.request
+
+import metrics
+import sources
+import state
+import streams
+import upstream
+
+logger = logging.getLogger(__name__)
+
+TIMEOUT = 30
+
+
+def fetch_document(url, keyring=None):
+    """Fetch and parse one stream document, checking signed ones."""
+    with urllib.request.urlopen(url, timeout=TIMEOUT) as response:
+        body = response.read()
+    if keyring and url.endswith(".sjson") and not sources.signature_ok(body, keyring):
+        raise ValueError("Bad signature on {}".format(url))
+    return streams.parse_document(body)
+
+
+def upstream_items(source, path=None, keyring=None):
+    """Yield every item of the products reachable from the source index."""
+    index_url = upstream.index_url(source, path)
+    base = index_url.split("streams/v1/", 1)[0] if "streams/v1/" in index_url else source
+    document = fetch_document(index_url, keyring)
+    if "products" in document:
+        yield from streams.items_of(document)
+        return
+    for content_id, entry in sorted(document.get("index", {}).items()):
+        products = fetch_document("{}/{}".format(base.rstrip("/"), entry["path"]), keyring)
+        logger.info("Loaded {} from {}".format(content_id, entry["path"]))
+        yield from streams.items_of(products)
+
+
+def _present(target, item):
+    try:
+        return os.path.getsize(os.path.join(target, item["path"])) == item["size"]
+    except OSError:
+        return False
+
+
+def _throughput(state_dir):
+    """Return the mean throughput of the recorded selector syncs, if any."""
+    records = state.read_json(os.path.join(state_dir, metrics.METRICS_FILE))
+    rates = [
+        r.get("throughput-bytes-per-second") or 0 for r in records.values() if isinstance(r, dict)
+    ]
+    rates = [rate for rate in rates if rate > 0]
+    return sum(rates) / len(rates) if rates else None
+
+
+def plan(config, state_dir=None):
+    """Plan a sync of config["image-selectors"] into config["target"].
+
+    Returns per-selector lists of the items to add and prune with their
+    sizes, totals over distinct items, and an ETA from the throughput of
+    past syncs when there is one.
+    """
+    source = sources.parse(config["image-source"])[0]
+    items = list(
+        upstream_items(source, config.get("path") or None, config.get("keyring-file") or None)
+    )
+    keep = config.get("keep", True)
+    selectors = []
+    to_add, to_prune = {}, {}
+    for selector in config["image-selectors"].splitlines():
+        if not selector.strip():
+            continue
+        selected = streams.select(items, selector, config.get("image-max"))
+        wanted = {item["path"] for item in selected}
+        add = {i["path"]: i["size"] for i in selected if not _present(config["target"], i)}
+        prune = {}
+        if not keep:
+            local = metrics.item_sizes(config["target"], selector)
+            prune = {path: size for path, size in local.items() if path not in wanted}
+        to_add.update(add)
+        to_prune.update(prune)
+        selectors.append(
+            {
+                "selector": selector,
+                "items": len(wanted),
+                "add": sorted(add),
+                "add-bytes": sum(add.values()),
+                "prune": sorted(prune),
+                "prune-bytes": sum(prune.values()),
+            }
+        )
+    result = {
+        "source": source,
+        "selectors": selectors,
+        "add": len(to_add),
+        "add-bytes": sum(to_add.values()),
+        "prune": len(to_prune),
+        "prune-bytes": sum(to_prune.values()),
+        "eta-seconds": None,
+    }
+    throughput = _throughput(state_dir) if state_dir else None
+    if throughput:
+        result["eta-seconds"] = round(result["add-bytes"] / throughput)
+    return result
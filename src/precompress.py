@@ -0,0 +1,135 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Keep compressed copies of the stream metadata next to the originals.
+
+Every ``.json`` and ``.sjson`` file under ``streams``, and every products
+file under ``.data`` (named after its content id, without a suffix), gets a
+``.gz`` copy, and a ``.zst`` copy when zstd is requested and installed, so
+that web servers can serve them directly (``gzip_static`` and the like).
+A copy carries the modification time of its original and is rewritten only
+when that changes, so copies a snapshot shares with ``latest`` through
+hardlinks stay shared.  The sha256 of each original and of its copies are
+kept in ``.metadata-checksums.json`` at the root of the tree.
+"""
+
+import gzip
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+
+import state
+
+logger = logging.getLogger(__name__)
+
+CHECKSUMS_FILE = ".metadata-checksums.json"
+METADATA_DIRS = ("streams", ".data")
+SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+
+
+def available(encodings):
+    """Return the requested encodings that can be produced on this unit."""
+    encodings = [e for e in (encodings or "").split() if e in SUFFIXES]
+    return [e for e in encodings if e != "zstd" or shutil.which("zstd")]
+
+
+def _is_metadata(top, name):
+    if name.endswith(tuple(SUFFIXES.values()) + (".tmp",)):
+        return False
+    return top == ".data" or name.endswith((".json", ".sjson"))
+
+
+def metadata_files(root):
+    """Return the relative paths of the metadata files of the tree at root."""
+    paths = []
+    for name in METADATA_DIRS:
+        for dirpath, dirs, files in os.walk(os.path.join(root, name), followlinks=True):
+            dirs.sort()
+            paths.extend(
+                os.path.relpath(os.path.join(dirpath, f), root)
+                for f in sorted(files)
+                if _is_metadata(name, f)
+            )
+    return paths
+
+
+def _load_checksums(root):
+    return state.read_json(os.path.join(root, CHECKSUMS_FILE)).get("files", {})
+
+
+def _sha256(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _compress(src, dst, encoding):
+    tmp = "{}.{}.tmp".format(dst, os.getpid())
+    if encoding == "gzip":
+        with open(src, "rb") as f_in, open(tmp, "wb") as f_out:
+            # no name or timestamp in the header, so equal input gives equal output
+            with gzip.GzipFile(filename="", mode="wb", fileobj=f_out, mtime=0) as gz:
+                shutil.copyfileobj(f_in, gz)
+    else:
+        subprocess.check_call(["zstd", "-q", "-f", "-19", src, "-o", tmp])
+    stat = os.stat(src)
+    os.utime(tmp, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    os.replace(tmp, dst)
+
+
+def compress_tree(root, encodings=("gzip",), source=None):
+    """Bring the compressed copies of the metadata of root up to date.
+
+    source is the tree root was copied from, if any, whose checksums serve
+    for the files root has none for yet.  Returns a summary of the metadata
+    files seen, the copies written and the bytes of the originals and of
+    the new copies.
+    """
+    checksums_path = os.path.join(root, CHECKSUMS_FILE)
+    previous = _load_checksums(root)
+    if source and not previous:
+        previous = _load_checksums(source)
+    summary = {"files": 0, "compressed": 0, "bytes-in": 0, "bytes-out": 0}
+    files = {}
+    for rel_path in metadata_files(root):
+        path = os.path.join(root, rel_path)
+        mtime = os.stat(path).st_mtime_ns
+        entry = previous.get(rel_path, {})
+        if entry.get("mtime") != mtime:
+            entry = {"mtime": mtime, "identity": _sha256(path)}
+        summary["files"] += 1
+        for encoding in encodings:
+            copy = path + SUFFIXES[encoding]
+            try:
+                current = os.stat(copy).st_mtime_ns == mtime
+            except OSError:
+                current = False
+            if not current:
+                _compress(path, copy, encoding)
+                entry[encoding] = _sha256(copy)
+                summary["compressed"] += 1
+                summary["bytes-in"] += os.path.getsize(path)
+                summary["bytes-out"] += os.path.getsize(copy)
+            elif encoding not in entry:
+                entry[encoding] = _sha256(copy)
+        keep = ("mtime", "identity") + tuple(encodings)
+        files[rel_path] = {key: value for key, value in entry.items() if key in keep}
+    _remove_stale(root, set(files), encodings)
+    state.write_json(checksums_path, {"encodings": list(encodings), "files": files})
+    logger.info("Compressed metadata of {}: {}".format(root, summary))
+    return summary
+
+
+def _remove_stale(root, originals, encodings):
+    """Delete copies whose original is gone or whose encoding is not wanted."""
+    wanted = [SUFFIXES[encoding] for encoding in encodings]
+    for name in METADATA_DIRS:
+        for dirpath, dirs, files in os.walk(os.path.join(root, name), followlinks=True):
+            for f in files:
+                base, ext = os.path.splitext(f)
+                if ext not in SUFFIXES.values() or not _is_metadata(name, base):
+                    continue
+                rel_path = os.path.relpath(os.path.join(dirpath, base), root)
+                if rel_path not in originals or ext not in wanted:
+                    os.unlink(os.path.join(dirpath, f))
@@ -0,0 +1,170 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Reclaim image data no longer referenced by the mirror or any snapshot.
+
+Snapshots made without copy-on-snapshot link their product directories to
+``latest``, and sstream-mirror keeps items that dropped out of the stream,
+so data under ``image-dir`` is only ever added.  An item file is live while
+the products metadata of ``latest`` or of a kept snapshot lists its path (or,
+for the object store, its sha256).  Snapshots beyond the retention policy
+are deleted first, then every item file and stored object no longer live.
+Space is counted per inode so that hardlinked data is only reported as
+freed once its last link goes.
+"""
+
+import logging
+import os
+import shutil
+import time
+from datetime import datetime
+
+import manifest
+import snapshots
+import streams
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_PREFIX = "snapshot-"
+# files of an interrupted download, kept so that the next sync resumes it
+PARTIAL_SUFFIXES = (".partial", ".partial.json")
+
+
+def _items(root):
+    """Return (path, sha256) of every item listed in the metadata of root."""
+    data_dir = os.path.join(root, ".data")
+    if not os.path.isdir(data_dir):
+        # without metadata everything the tree links to would look unreferenced
+        raise ValueError("{} has no stream metadata".format(root))
+    return [(item["path"], item["sha256"]) for item in streams.iter_items(data_dir)]
+
+
+def snapshot_time(path):
+    """Return when the snapshot at path was created, as a timestamp."""
+    created = manifest.load_summary(path).get("created")
+    if created is not None:
+        return created
+    try:
+        stamp = os.path.basename(path)[len(SNAPSHOT_PREFIX) :]  # noqa: E203
+        return datetime.strptime(stamp, "%Y%m%d%H%M%S").timestamp()
+    except ValueError:
+        return os.stat(path).st_mtime
+
+
+def expired_snapshots(image_dir, keep_count=0, keep_days=0, now=None):
+    """Return the names of the snapshots the retention policy drops.
+
+    A snapshot is kept while it is one of the keep_count newest or younger
+    than keep_days; with neither set every snapshot is kept.  The published
+    snapshot is never dropped.
+    """
+    if not keep_count and not keep_days:
+        return []
+    now = time.time() if now is None else now
+    published = os.path.realpath(os.path.join(image_dir, "publish"))
+    found = []
+    for name in os.listdir(image_dir):
+        path = os.path.join(image_dir, name)
+        if name.startswith(SNAPSHOT_PREFIX) and os.path.isdir(path) and not os.path.islink(path):
+            found.append((snapshot_time(path), name))
+    expired = []
+    for index, (created, name) in enumerate(sorted(found, reverse=True)):
+        if index < keep_count or keep_days and now - created < keep_days * 86400:
+            continue
+        if os.path.realpath(os.path.join(image_dir, name)) == published:
+            continue
+        expired.append(name)
+    return sorted(expired)
+
+
+def _files(root, skip_metadata=False):
+    for dirpath, dirs, files in os.walk(root):
+        if skip_metadata and dirpath == root:
+            dirs[:] = [d for d in dirs if not d.startswith(".") and d != "streams"]
+            files = [f for f in files if not f.startswith(".")]
+        for name in files:
+            yield os.path.join(dirpath, name)
+
+
+def plan(image_dir, keep_count=0, keep_days=0, now=None):
+    """Work out what a collection would delete, without changing anything.
+
+    Returns the expired snapshot names, the unreferenced item files under
+    ``latest``, the unreferenced objects of the store and the bytes freed.
+    """
+    expired = expired_snapshots(image_dir, keep_count, keep_days, now)
+    latest = os.path.join(image_dir, "latest")
+    live_paths = set()
+    live_digests = set()
+    for name in ["latest"] + sorted(os.listdir(image_dir)):
+        root = os.path.join(image_dir, name)
+        if name != "latest" and (not name.startswith(SNAPSHOT_PREFIX) or name in expired):
+            continue
+        for path, digest in _items(root):
+            live_paths.add(os.path.normpath(path))
+            if digest:
+                live_digests.add(digest)
+    files = [
+        path
+        for path in _files(latest, skip_metadata=True)
+        if not path.endswith(PARTIAL_SUFFIXES)
+        and os.path.relpath(path, latest) not in live_paths  # noqa: W503
+    ]
+    store = os.path.join(image_dir, snapshots.STORE_DIR)
+    objects = [path for path in _files(store) if os.path.basename(path) not in live_digests]
+    doomed = files + objects
+    for name in expired:
+        doomed.extend(_files(os.path.join(image_dir, name)))
+    return {
+        "snapshots": expired,
+        "files": files,
+        "objects": objects,
+        "bytes": _freed_bytes(doomed),
+    }
+
+
+def _freed_bytes(paths):
+    """Return the space released by unlinking paths, counting each inode once."""
+    inodes = {}
+    for path in paths:
+        try:
+            stat = os.stat(path, follow_symlinks=False)
+        except OSError:
+            continue
+        key = (stat.st_dev, stat.st_ino)
+        links, _, size = inodes.get(key, (0, stat.st_nlink, stat.st_size))
+        inodes[key] = (links + 1, stat.st_nlink, size)
+    return sum(size for links, nlink, size in inodes.values() if links >= nlink)
+
+
+def _prune_empty_dirs(root):
+    for dirpath, dirs, files in os.walk(root, topdown=False):
+        if dirpath != root and not os.listdir(dirpath):
+            os.rmdir(dirpath)
+
+
+def collect(image_dir, keep_count=0, keep_days=0, dry_run=False):
+    """Delete expired snapshots and unreferenced data; return a summary.
+
+    With dry_run nothing is deleted and the summary reports what would be.
+    """
+    planned = plan(image_dir, keep_count, keep_days)
+    summary = {
+        "snapshots-deleted": len(planned["snapshots"]),
+        "files-deleted": len(planned["files"]),
+        "objects-deleted": len(planned["objects"]),
+        "bytes-freed": planned["bytes"],
+        "dry-run": dry_run,
+    }
+    if dry_run:
+        logger.info("Garbage collection would free: {}".format(summary))
+        return dict(summary, snapshots=planned["snapshots"])
+    for name in planned["snapshots"]:
+        logger.info("Delete expired snapshot {}".format(name))
+        shutil.rmtree(os.path.join(image_dir, name))
+    for path in planned["files"] + planned["objects"]:
+        os.unlink(path)
+    _prune_empty_dirs(os.path.join(image_dir, "latest"))
+    _prune_empty_dirs(os.path.join(image_dir, snapshots.STORE_DIR))
+    logger.info("Garbage collection freed: {}".format(summary))
+    return dict(summary, snapshots=planned["snapshots"])
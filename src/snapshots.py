@@ -0,0 +1,189 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Build snapshot trees without duplicating data.
+
+Item files are kept once in a content-addressed store below ``image-dir``,
+named by the sha256 recorded for them in the stream metadata, which a file
+is checked against before it is stored.  Snapshot files are then reflinks
+of, or hardlinks to, the stored objects.  Metadata
+is copied incrementally, sharing unchanged files with the previous snapshot.
+"""
+
+import errno
+import fcntl
+import hashlib
+import logging
+import os
+import shutil
+
+logger = logging.getLogger(__name__)
+
+STORE_DIR = ".objects"
+# FICLONE from linux/fs.h
+FICLONE = 0x40049409
+CHUNK_SIZE = 1024 * 1024
+
+
+def object_path(store, digest):
+    return os.path.join(store, "sha256", digest[:2], digest)
+
+
+def reflink(src, dst):
+    """Clone src to dst sharing extents; raises OSError if unsupported."""
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        try:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        except OSError:
+            os.unlink(dst)
+            raise
+    shutil.copystat(src, dst)
+
+
+def clone(src, dst):
+    """Materialize src at dst as cheaply as the filesystem allows.
+
+    Returns "reflink", "hardlink" or "copy" depending on what was used.
+    """
+    try:
+        reflink(src, dst)
+        return "reflink"
+    except OSError:
+        pass
+    try:
+        os.link(src, dst)
+        return "hardlink"
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EMLINK, errno.EPERM, errno.ENOTSUP):
+            raise
+    shutil.copy2(src, dst)
+    return "copy"
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def store_object(store, digest, path):
+    """Add the file at path to the store unless an object already exists.
+
+    Raises ValueError, storing nothing, if the file does not hash to digest:
+    every later snapshot would share a truncated or corrupt object.
+    """
+    obj = object_path(store, digest)
+    if not os.path.exists(obj):
+        os.makedirs(os.path.dirname(obj), exist_ok=True)
+        tmp = "{}.{}.tmp".format(obj, os.getpid())
+        try:
+            os.link(path, tmp)
+        except OSError:
+            shutil.copy2(path, tmp)
+        if _sha256(tmp) != digest:
+            os.unlink(tmp)
+            raise ValueError("{} does not match its sha256 {}".format(path, digest))
+        os.replace(tmp, obj)
+    return obj
+
+
+def dedup_copytree(src_root, dst_root, product, digests, store):
+    """Recreate src_root/product under dst_root from the object store.
+
+    Files whose relative path has a known sha256 are stored once and linked
+    into the snapshot; anything else, including files that do not match
+    their sha256, is copied as shutil.copytree would.
+    Returns a count of files per method used.
+    """
+    counts = {"reflink": 0, "hardlink": 0, "copy": 0}
+    for root, dirs, files in os.walk(os.path.join(src_root, product)):
+        rel_root = os.path.relpath(root, src_root)
+        os.makedirs(os.path.join(dst_root, rel_root), exist_ok=True)
+        for name in dirs + files:
+            src = os.path.join(root, name)
+            dst = os.path.join(dst_root, rel_root, name)
+            if os.path.islink(src):
+                os.symlink(os.readlink(src), dst)
+                continue
+            if name in dirs:
+                continue
+            rel_path = os.path.normpath(os.path.join(rel_root, name))
+            digest = digests.get(rel_path)
+            if digest:
+                try:
+                    counts[clone(store_object(store, digest, src), dst)] += 1
+                    continue
+                except ValueError as e:
+                    logger.info("Not storing {}: {}".format(rel_path, e))
+            shutil.copy2(src, dst)
+            counts["copy"] += 1
+    logger.info("Snapshot of {}: {}".format(product, counts))
+    return counts
+
+
+def previous_snapshot(image_dir, exclude=None):
+    """Return the path of the most recent snapshot-* directory, if any."""
+    try:
+        names = sorted(
+            name
+            for name in os.listdir(image_dir)
+            if name.startswith("snapshot-") and name != exclude
+        )
+    except OSError:
+        return None
+    for name in reversed(names):
+        path = os.path.join(image_dir, name)
+        if os.path.isdir(path) and not os.path.islink(path):
+            return path
+    return None
+
+
+def _unchanged(src_stat, previous):
+    try:
+        prev_stat = os.stat(previous, follow_symlinks=False)
+    except OSError:
+        return False
+    return (
+        prev_stat.st_size == src_stat.st_size
+        and prev_stat.st_mtime_ns == src_stat.st_mtime_ns  # noqa: W503
+    )
+
+
+def incremental_copytree(src, dst, previous=None):
+    """Copy src to dst, hardlinking files unchanged since the previous copy.
+
+    A file counts as unchanged when the previous tree holds a file at the
+    same relative path with the same size and modification time; copies keep
+    the modification time so the check also holds for the next snapshot.
+    Returns a summary of what was linked and copied.
+    """
+    summary = {"files": 0, "files-changed": 0, "bytes-changed": 0, "files-linked": 0}
+    for root, dirs, files in os.walk(src):
+        rel_root = os.path.relpath(root, src)
+        os.makedirs(os.path.join(dst, rel_root), exist_ok=True)
+        for name in dirs + files:
+            path = os.path.join(root, name)
+            target = os.path.join(dst, rel_root, name)
+            if os.path.islink(path):
+                os.symlink(os.readlink(path), target)
+                continue
+            if name in dirs:
+                continue
+            summary["files"] += 1
+            stat = os.stat(path)
+            if previous:
+                prev_path = os.path.join(previous, rel_root, name)
+                if _unchanged(stat, prev_path):
+                    try:
+                        os.link(prev_path, target)
+                        summary["files-linked"] += 1
+                        continue
+                    except OSError:
+                        pass
+            shutil.copy2(path, target)
+            summary["files-changed"] += 1
+            summary["bytes-changed"] += stat.st_size
+    logger.info("Copied {} to {}: {}".format(src, dst, summary))
+    return summary
@@ -0,0 +1,93 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Choose between equivalent upstream mirrors.
+
+``image-source`` may list several mirrors of the same stream, separated by
+whitespace.  Before a sync each of them is probed by fetching its index:
+the time to the response headers gives the latency and the body the
+throughput, and with a keyring the signature of the index is checked with
+gpgv.  Mirrors failing the signature check are dropped, unreachable ones
+are kept as a last resort, and the rest are tried fastest first.
+"""
+
+import logging
+import subprocess
+import tempfile
+import time
+import urllib.request
+
+import upstream
+
+logger = logging.getLogger(__name__)
+
+TIMEOUT = 15
+
+
+def parse(value):
+    """Return the mirrors listed in an image-source value, in order."""
+    return (value or "").split()
+
+
+def signature_ok(body, keyring):
+    """Return True if gpgv accepts the signature of a clearsigned document."""
+    with tempfile.NamedTemporaryFile(suffix=".sjson") as f:
+        f.write(body)
+        f.flush()
+        result = subprocess.run(
+            ["gpgv", "--keyring", keyring, f.name],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+    return result.returncode == 0
+
+
+def probe(source, path=None, keyring=None):
+    """Fetch the index of source and report how it performed.
+
+    Returns a dictionary with the ``latency`` and ``throughput`` (bytes per
+    second) measured, whether the signature ``verified``, and the ``error``
+    that made the mirror unusable, if any.
+    """
+    url = upstream.index_url(source, path)
+    result = {"source": source, "latency": None, "throughput": 0, "verified": None, "error": None}
+    started = time.monotonic()
+    try:
+        with urllib.request.urlopen(url, timeout=TIMEOUT) as response:
+            result["latency"] = time.monotonic() - started
+            body = response.read()
+    except (OSError, ValueError) as e:
+        result["error"] = str(e)
+        return result
+    elapsed = time.monotonic() - started
+    result["throughput"] = round(len(body) / elapsed) if elapsed else len(body)
+    if keyring and url.endswith(".sjson"):
+        try:
+            result["verified"] = signature_ok(body, keyring)
+        except OSError as e:
+            # the sync itself still verifies the signature
+            logger.info("Cannot check the signature of {}: {}".format(url, e))
+            return result
+        if not result["verified"]:
+            result["error"] = "bad signature"
+    return result
+
+
+def rank(candidates, path=None, keyring=None):
+    """Return the usable mirrors, best first, and the probe results.
+
+    A single mirror is returned as is, without probing.
+    """
+    if len(candidates) < 2:
+        return list(candidates), []
+    probes = [probe(source, path, keyring) for source in candidates]
+    reachable = [p for p in probes if p["error"] is None]
+    reachable.sort(key=lambda p: (-p["throughput"], p["latency"]))
+    # unreachable mirrors may only be down for a moment, so keep them last
+    unreachable = [p for p in probes if p["latency"] is None]
+    for p in probes:
+        if p["error"]:
+            logger.info("Image source {}: {}".format(p["source"], p["error"]))
+    ranked = [p["source"] for p in reachable + unreachable]
+    logger.info("Image sources by speed: {}".format(ranked))
+    return ranked, probes
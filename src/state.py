@@ -0,0 +1,59 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Read and write the JSON state files of the charm and the sync job.
+
+The sync job and the helper modules it runs share these, so they live in a
+module importing nothing else of the charm; syncjob.py is also run as a
+script from cron and must not be imported back by its own helpers.
+"""
+
+import fcntl
+import json
+import os
+
+
+def read_json(path):
+    """Return the JSON object at path, or {} if it is missing or invalid."""
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def write_json(path, data, indent=2):
+    """Replace the JSON document at path atomically; return its length.
+
+    With indent None the document is written without any whitespace.
+    """
+    separators = (",", ":") if indent is None else None
+    content = json.dumps(data, indent=indent, separators=separators, sort_keys=True)
+    tmp = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp, "w") as f:
+        f.write(content)
+    os.replace(tmp, path)
+    return len(content)
+
+
+def update_json(path, update):
+    """Replace the JSON object at path with update(current) under a lock; return it.
+
+    Processes updating the same file wait for each other, so none of their
+    changes is lost.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open("{}.lock".format(path), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        data = update(read_json(path))
+        write_json(path, data)
+    return data
+
+
+def format_bytes(size):
+    units = ["B", "KiB", "MiB", "GiB", "TiB"]
+    while size >= 1024 and len(units) > 1:
+        size /= 1024.0
+        units.pop(0)
+    return "{:.1f} {}".format(size, units[0])
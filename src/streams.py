@@ -0,0 +1,145 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Read the products metadata that simplestreams keeps under ``.data``.
+
+The mirror writer stores the products tree of each content id it mirrors
+below ``.data`` in the target directory.  Those documents are the record of
+which items are on disk, with their relative paths, sizes and checksums.
+"""
+
+import json
+import os
+import re
+
+SELECTOR_RE = re.compile(r"([\w|\-]+)[ ]*([!]{0,1}[=~])[ ]*(.*)[ ]*$")
+
+
+def parse_document(content):
+    """Parse a stream document, stripping the armor of a clearsigned one."""
+    if isinstance(content, bytes):
+        content = content.decode()
+    if content.startswith("-----BEGIN PGP SIGNED MESSAGE-----"):
+        # the armor headers end at the first empty line
+        content = content.split("\n\n", 1)[1]
+        content = content.split("\n-----BEGIN PGP SIGNATURE-----", 1)[0]
+    return json.loads(content)
+
+
+def load_products(path):
+    """Return the products document at path, or None if it is not one."""
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(data, dict) or not isinstance(data.get("products"), dict):
+        return None
+    return data
+
+
+def data_files(data_dir):
+    """Return the paths of all files under data_dir in a stable order."""
+    paths = []
+    for root, dirs, files in os.walk(data_dir):
+        dirs.sort()
+        paths.extend(os.path.join(root, name) for name in sorted(files))
+    return paths
+
+
+def _own_fields(data, skip):
+    return {key: value for key, value in data.items() if key != skip}
+
+
+def items_of(data):
+    """Yield every item of one products document as a flat dictionary.
+
+    ``fields`` holds the item's attributes merged with those inherited from
+    its version, product and the document, as simplestreams filters see them.
+    """
+    top = _own_fields(data, "products")
+    for product_name, product in data["products"].items():
+        product_fields = dict(top, **_own_fields(product, "versions"))
+        for version_name, version in (product.get("versions") or {}).items():
+            version_fields = dict(product_fields, **_own_fields(version, "items"))
+            for item_name, item in (version.get("items") or {}).items():
+                if "path" not in item:
+                    continue
+                fields = dict(version_fields, **item)
+                fields.update(
+                    product_name=product_name, version_name=version_name, item_name=item_name
+                )
+                yield {
+                    "content_id": data.get("content_id"),
+                    "product": product_name,
+                    "version": version_name,
+                    "item": item_name,
+                    "path": item["path"],
+                    "size": int(item.get("size") or 0),
+                    "sha256": item.get("sha256"),
+                    "fields": fields,
+                }
+
+
+def iter_items(data_dir):
+    """Yield the items of every products document under data_dir.
+
+    Documents are loaded one at a time so memory use is bounded by the
+    largest products file rather than by the whole tree.
+    """
+    for path in data_files(data_dir):
+        data = load_products(path)
+        if data is not None:
+            yield from items_of(data)
+
+
+def item_digests(data_dir):
+    """Map the relative path of each item to its sha256."""
+    return {item["path"]: item["sha256"] for item in iter_items(data_dir) if item["sha256"]}
+
+
+def parse_selector(selector):
+    """Parse a selector line such as ``arch=amd64 release~(jammy)``.
+
+    Returns a list of (key, negate, match) tuples following the simplestreams
+    filter syntax: ``=`` compares for equality and ``~`` searches a regular
+    expression, either of them negated with a leading ``!``.
+    """
+    terms = []
+    for term in selector.split():
+        parsed = SELECTOR_RE.match(term)
+        if not parsed:
+            raise ValueError("Unable to parse selector term: {}".format(term))
+        key, op, value = parsed.groups()
+        match = value.__eq__ if op.endswith("=") else re.compile(value).search
+        terms.append((key, op.startswith("!"), match))
+    return terms
+
+
+def matches(terms, fields):
+    """Return True if the item fields satisfy every term of a selector."""
+    return all(negate != bool(match(str(fields.get(key, "")))) for key, negate, match in terms)
+
+
+def select(items, selector, max_items=None):
+    """Return the items a selector picks, limited to max_items versions per product."""
+    terms = parse_selector(selector)
+    versions = {}
+    for item in items:
+        if matches(terms, item["fields"]):
+            key = (item["content_id"], item["product"])
+            versions.setdefault(key, {}).setdefault(item["version"], []).append(item)
+    selected = []
+    for product_versions in versions.values():
+        newest = sorted(product_versions, reverse=True)[: max_items or None]
+        for version in newest:
+            selected.extend(product_versions[version])
+    return selected
+
+
+def matching_items(data_dir, selector):
+    """Yield the items under data_dir that a selector line selects."""
+    terms = parse_selector(selector)
+    for item in iter_items(data_dir):
+        if matches(terms, item["fields"]):
+            yield item
@@ -0,0 +1,771 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Run image synchronization as a job detached from the Juju hook.
+
+The charm writes the sync configuration to ``config.json`` in a state
+directory and starts this module in its own session, or schedules it from
+cron with ``--scheduled``.  The job holds ``sync.lock`` for its whole
+lifetime, so a scheduled run that finds a job still running skips its tick.
+Within a job, sstream-mirror runs for one selector at a time, since every
+run rewrites the shared ``.data`` metadata of the download directory.
+Once upstream reports a change, the bytes still to fetch are worked out
+from the upstream metadata and compared with the free space of the
+download directory, and free space is watched during the run: a job that
+would eat into ``disk-reserve`` stops early in the ``blocked`` phase.
+``status.json`` is kept up to date with the phase, current selector, bytes
+done and ETA so that later hooks and actions can report on the job or
+cancel it, and ``last-run.json`` summarizes the last finished job.  Outside
+the configured sync windows the job pauses between items (or, with
+sstream-mirror, between selectors) until the next window opens.  The
+manifest and compressed metadata of the download directory are rebuilt,
+and the disk usage of the trees measured, at the end of every run that
+synced something.  Only the standard library (and the simplestreams
+library for the in-process engine) is used so the job runs under the
+system python3::
+
+    python3 syncjob.py --state-dir DIR [--job-id ID] [--force] [--scheduled]
+"""
+
+import argparse
+import fcntl
+import logging
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+import capacity
+import download
+import manifest
+import metrics
+import mirror
+import peers
+import planner
+import precompress
+import reclaim
+import sources
+import state
+import throttle
+import trim
+import upstream
+
+logger = logging.getLogger(__name__)
+
+CONFIG_FILE = "config.json"
+STATUS_FILE = "status.json"
+LOCK_FILE = "sync.lock"
+LOG_FILE = "sync.log"
+LAST_RUN_FILE = "last-run.json"
+TERMINAL_PHASES = ("done", "failed", "cancelled", "blocked")
+PROGRESS_INTERVAL = 5
+
+
+class Cancelled(Exception):
+    """The job was asked to stop."""
+
+
+class AlreadyRunning(Exception):
+    """Another job holds the sync lock."""
+
+
+def read_status(state_dir):
+    return state.read_json(os.path.join(state_dir, STATUS_FILE))
+
+
+def read_last_run(state_dir):
+    return state.read_json(os.path.join(state_dir, LAST_RUN_FILE))
+
+
+def is_running(state_dir):
+    """Return True while a job holds the sync lock in state_dir."""
+    try:
+        lock = open(os.path.join(state_dir, LOCK_FILE), "a")
+    except OSError:
+        return False
+    with lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+    return False
+
+
+def describe(status):
+    """Return a one-line summary of a running job for the unit status."""
+    if status.get("phase") == "paused" and status.get("resumes"):
+        return "Sync paused until {}".format(time.ctime(status["resumes"]))
+    message = "Syncing"
+    if status.get("current"):
+        message += " {}".format(status["current"])
+    if status.get("selectors-total"):
+        message += " ({}/{} selectors)".format(
+            status.get("selectors-done", 0), status["selectors-total"]
+        )
+    message += ", {}".format(state.format_bytes(status.get("bytes-done", 0)))
+    if status.get("eta") is not None:
+        message += ", ETA {}m".format(int(status["eta"] // 60))
+    return message
+
+
+def sync_selector_cmd(config, target, selector):
+    """Build the sstream-mirror command line for one selector."""
+    cmd = [
+        "sstream-mirror",
+    ]
+    if "keep" not in config or config["keep"]:
+        cmd.append("--keep")
+    if "keyring-file" not in config or not config["keyring-file"]:
+        cmd.append("--no-verify")
+    else:
+        cmd.append("--keyring={}".format(config["keyring-file"]))
+    if config["verbose"]:
+        cmd.append("--verbose")
+    if "path" in config and config["path"]:
+        cmd.append("--path={}".format(config["path"]))
+    if "log-file" in config and config["log-file"]:
+        cmd.append("--log-file={}".format(config["log-file"]))
+    if config["image-max"]:
+        cmd.append("--max={}".format(config["image-max"]))
+    cmd.append(config["image-source"])
+    cmd.append(target)
+    cmd.extend(selector.split())
+    return cmd
+
+
+def _used_bytes(path):
+    try:
+        stat = os.statvfs(path)
+    except OSError:
+        return 0
+    return (stat.f_blocks - stat.f_bfree) * stat.f_frsize
+
+
+def start(state_dir, config, force=False, python="python3", env=None):
+    """Write the job configuration and start a detached job; return its id."""
+    os.makedirs(state_dir, exist_ok=True)
+    job_id = "sync-{}".format(uuid.uuid4().hex[:8])
+    state.write_json(os.path.join(state_dir, CONFIG_FILE), config)
+    state.write_json(
+        os.path.join(state_dir, STATUS_FILE),
+        {"job-id": job_id, "phase": "queued", "started": time.time()},
+    )
+    cmd = [python, os.path.abspath(__file__), "--state-dir", state_dir, "--job-id", job_id]
+    if force:
+        cmd.append("--force")
+    with open(os.path.join(state_dir, LOG_FILE), "ab") as log:
+        subprocess.Popen(
+            cmd,
+            stdin=subprocess.DEVNULL,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            env=env,
+            close_fds=True,
+            start_new_session=True,
+        )
+    logger.info("Started sync job {}".format(job_id))
+    return job_id
+
+
+def _children(pid):
+    """Return the ids of the child processes of pid."""
+    try:
+        with open("/proc/{0}/task/{0}/children".format(pid)) as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def cancel(state_dir):
+    """Ask the running job to stop; return False if no job is running."""
+    status = read_status(state_dir)
+    if not is_running(state_dir) or not status.get("pid"):
+        return False
+    try:
+        if os.getpgid(status["pid"]) == status["pid"]:
+            # a detached job leads its own process group, which includes sstream-mirror
+            os.killpg(status["pid"], signal.SIGTERM)
+        else:
+            # a job run by the hook with wait=true shares the group of the hook,
+            # so the sstream-mirror it runs is stopped on its own
+            for child in _children(status["pid"]):
+                try:
+                    os.kill(child, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+            os.kill(status["pid"], signal.SIGTERM)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+class SyncJob:
+    """One synchronization run over all configured selectors."""
+
+    def __init__(self, state_dir, job_id=None, force=False, trigger="action"):
+        self.state_dir = state_dir
+        self.trigger = trigger
+        self.config = state.read_json(os.path.join(state_dir, CONFIG_FILE))
+        self.force = force
+        self.cancelled = False
+        self.blocked = None
+        self.changed = False
+        self._lock = threading.Lock()
+        self._changed_lock = threading.Lock()
+        self._space_ok = True
+        self._used_at_start = 0
+        self._sizes = None
+        self._before = {}
+        self.metrics = {}
+        self.sources = sources.parse(self.config.get("image-source"))
+        self.windows = []
+        self.limiter = None
+        self.status = {
+            "job-id": job_id or "sync-{}".format(uuid.uuid4().hex[:8]),
+            "pid": os.getpid(),
+            "phase": "starting",
+            "trigger": trigger,
+            "started": time.time(),
+            "bytes-done": 0,
+            "selectors-done": 0,
+            "results": {},
+        }
+
+    def run(self):
+        """Run the job to completion and return its final status."""
+        with open(os.path.join(self.state_dir, LOCK_FILE), "a") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise AlreadyRunning(read_status(self.state_dir).get("job-id"))
+            previous_handler = signal.signal(signal.SIGTERM, self._on_sigterm)
+            try:
+                self._run()
+            finally:
+                signal.signal(signal.SIGTERM, previous_handler)
+        return self.status
+
+    def _on_sigterm(self, signum, frame):
+        logger.info("Cancelling sync job {}".format(self.status["job-id"]))
+        self.cancelled = True
+
+    def _run(self):
+        selectors = self.config["image-selectors"].splitlines()
+        self._used_at_start = _used_bytes(self.config["target"])
+        self._update(phase="syncing", **{"selectors-total": len(selectors)})
+        ticker = threading.Event()
+        threading.Thread(target=self._tick, args=(ticker,), daemon=True).start()
+        error = None
+        try:
+            self.windows = throttle.parse_windows(self.config.get("sync-windows"))
+            schedule = throttle.parse_bandwidth(self.config.get("max-bandwidth"))
+            if schedule != (0, []) and self.config.get("sync-engine") != "simplestreams":
+                logger.info("max-bandwidth is only enforced by the simplestreams engine")
+            self.limiter = throttle.Limiter(schedule)
+            self._wait_for_window()
+            self._rank_sources()
+            if self.config.get("sync-engine") == "simplestreams":
+                self._sync_single_pass(selectors)
+            else:
+                self._sync_selectors(selectors)
+        except (Cancelled, download.Interrupted):
+            pass
+        except Exception as e:  # keep the failure in the status for sync-status
+            logger.exception("Sync job failed")
+            error = str(e)
+        finally:
+            ticker.set()
+        failed = [
+            result
+            for result in self.status["results"].values()
+            if isinstance(result, dict) and result.get("status") == "failed"
+        ]
+        if self.blocked:
+            phase = "blocked"
+            self.status["message"] = self.blocked
+        elif self.cancelled:
+            phase = "cancelled"
+        elif error or failed:
+            phase = "failed"
+        else:
+            phase = "done"
+        if error:
+            self.status["message"] = "Sync failed: {}".format(error)
+        elif failed:
+            self.status["message"] = "Failed to sync {} of {} selectors".format(
+                len(failed), len(selectors)
+            )
+        # with nothing new upstream the trees are as the last run left them
+        metadata_config = self._metadata_config()
+        if self.changed or read_last_run(self.state_dir).get("metadata-config") != metadata_config:
+            self._refresh_metadata()
+        freed = 0
+        if phase == "done" and self.config.get("gc-after-sync"):
+            freed = self._collect_garbage()
+        self._update(phase=phase, current=None, eta=None, finished=time.time())
+        self._write_last_run(metadata_config)
+        self._write_metrics()
+        if self.changed or freed:
+            self._measure_usage()
+
+    def _metadata_config(self):
+        """Return the settings the trimmed and compressed metadata depend on."""
+        return [
+            self.config["image-selectors"],
+            self.config.get("image-max"),
+            bool(self.config.get("trimmed-streams")),
+            self.config.get("metadata-compression") or "",
+        ]
+
+    def _write_last_run(self, metadata_config=None):
+        results = [r for r in self.status["results"].values() if isinstance(r, dict)]
+        last_run = {
+            key: self.status.get(key)
+            for key in (
+                "job-id",
+                "trigger",
+                "phase",
+                "started",
+                "finished",
+                "bytes-done",
+                "message",
+            )
+        }
+        last_run["duration"] = round(self.status["finished"] - self.status["started"], 3)
+        last_run["metadata-config"] = metadata_config
+        for outcome in ("ok", "unchanged", "failed"):
+            last_run["selectors-{}".format(outcome)] = len(
+                [r for r in results if r.get("status") == outcome]
+            )
+        state.write_json(os.path.join(self.state_dir, LAST_RUN_FILE), last_run)
+
+    def _refresh_metadata(self):
+        try:
+            manifest.update(self.config["target"])
+            selectors = self.config["image-selectors"].splitlines()
+            trim.update(
+                self.config["target"],
+                selectors if self.config.get("trimmed-streams") else [],
+                self.config.get("image-max"),
+            )
+            encodings = precompress.available(self.config.get("metadata-compression"))
+            if encodings:
+                precompress.compress_tree(self.config["target"], encodings)
+        except (OSError, subprocess.CalledProcessError) as e:
+            logger.info("Error refreshing metadata: {}".format(e))
+
+    def _collect_garbage(self):
+        self._update(phase="collecting", current=None)
+        try:
+            summary = reclaim.collect(
+                self.config["image-dir"],
+                keep_count=self.config.get("snapshot-keep-count") or 0,
+                keep_days=self.config.get("snapshot-keep-days") or 0,
+            )
+        except (OSError, ValueError) as e:
+            logger.info("Error collecting garbage: {}".format(e))
+            return 0
+        self.status["gc-bytes-freed"] = summary["bytes-freed"]
+        return summary["bytes-freed"]
+
+    def _write_metrics(self):
+        if not self.metrics:
+            return
+        try:
+            records = metrics.record(self.state_dir, self.metrics)
+            metrics.write_textfile(
+                self.config.get("metrics-textfile-dir"), self.config.get("app"), records
+            )
+        except OSError as e:
+            logger.info("Error writing metrics: {}".format(e))
+
+    def _tick(self, stop):
+        while not stop.wait(PROGRESS_INTERVAL):
+            self._watch_space()
+            self._update()
+
+    def _reserve(self):
+        return (self.config.get("disk-reserve") or 0) * 1024 * 1024
+
+    def _block(self, message):
+        """Stop the job for lack of disk space."""
+        logger.info(message)
+        self.blocked = message
+        self.cancelled = True
+
+    def _sync_changed(self):
+        """Note that upstream changed; return False if the sync cannot fit in the free space.
+
+        The sync is planned when the first change is found, so that runs
+        with nothing new do not fetch the products metadata to plan.
+        """
+        with self._changed_lock:
+            if not self.changed:
+                self.changed = True
+                self._space_ok = self._check_space()
+        return self._space_ok
+
+    def _check_space(self):
+        """Plan the sync; return False, blocking the job, if it cannot fit in the free space.
+
+        The planned bytes are kept as ``bytes-needed`` for the ETA.
+        """
+        try:
+            plan = planner.plan(
+                dict(self.config, **{"image-source": self.sources[0]}), self.state_dir
+            )
+        except (OSError, ValueError) as e:
+            logger.info("Cannot work out the bytes the sync needs: {}".format(e))
+            return True
+        self._update(**{"bytes-needed": plan["add-bytes"]})
+        if not self._reserve():
+            return True
+        free = capacity.free_bytes(self.config["target"])
+        self._update(**{"bytes-free": free})
+        if plan["add-bytes"] + self._reserve() > free:
+            self._block(
+                "Not enough disk space: sync needs {}, {} free".format(
+                    state.format_bytes(plan["add-bytes"] + self._reserve()),
+                    state.format_bytes(free),
+                )
+            )
+            return False
+        return True
+
+    def _watch_space(self):
+        """Stop the job at the next item or selector if free space runs low."""
+        if not self._reserve() or self.blocked:
+            return
+        try:
+            free = capacity.free_bytes(self.config["target"])
+        except OSError:
+            return
+        self.status["bytes-free"] = free
+        if free < self._reserve():
+            self._block("Out of disk space: {} free".format(state.format_bytes(free)))
+
+    def _measure_usage(self):
+        if not self.config.get("image-dir"):
+            return
+        try:
+            capacity.update(self.state_dir, self.config["image-dir"])
+        except OSError as e:
+            logger.info("Error measuring disk usage: {}".format(e))
+
+    def _update(self, **fields):
+        with self._lock:
+            self.status.update(fields)
+            now = time.time()
+            self.status["updated"] = now
+            if self.config.get("sync-engine") != "simplestreams":
+                used = _used_bytes(self.config["target"]) - self._used_at_start
+                self.status["bytes-done"] = max(self.status["bytes-done"], used)
+            self.status["eta"] = self._eta(now)
+            state.write_json(os.path.join(self.state_dir, STATUS_FILE), self.status)
+
+    def _eta(self, now):
+        if self.status["phase"] != "syncing":
+            return None
+        elapsed = now - self.status["started"]
+        needed = self.status.get("bytes-needed") or 0
+        fetched = self.status.get("bytes-done", 0)
+        if needed and 0 < fetched < needed:
+            return elapsed * (needed - fetched) / fetched
+        total = self.status.get("selectors-total") or 0
+        done = self.status.get("selectors-done", 0)
+        if not total or not done or done >= total:
+            return None
+        return elapsed * (total - done) / done
+
+    def _sync_selectors(self, selectors):
+        # each sstream-mirror run rewrites the .data products of the target,
+        # so concurrent runs would drop each other's new items
+        for i, selector in enumerate(selectors, start=1):
+            self.status["results"]["selector-{}".format(i)] = self._sync_selector(selector)
+
+    def _sync_selector(self, selector):
+        """Run sstream-mirror for one selector and capture its outcome.
+
+        A selector owned by a peer is mirrored from that peer first and from
+        upstream if the peer fails or does not have its items yet.
+        """
+        result = {"selector": selector}
+        if self.cancelled:
+            return dict(result, status="cancelled", returncode="", output="")
+        self._wait_for_window()
+        source, owner = peers.source_for(self.config, selector)
+        started = time.monotonic()
+        if owner:
+            result.update(self._run_sstream_mirror(selector, source), source=owner)
+            if result["status"] == "failed" or not self._item_sizes(selector):
+                logger.info("Peer {} cannot serve {}, using upstream".format(owner, selector))
+                owner = None
+        if not owner:
+            for source in list(self.sources):
+                result.update(self._run_sstream_mirror(selector, source), source="upstream")
+                result["mirror"] = source
+                if result["status"] != "failed" or self.cancelled:
+                    break
+                logger.info("Syncing {} from {} failed".format(selector, source))
+                self._demote(source)
+        if result["status"] == "cancelled":
+            return result
+        if result["status"] == "unchanged":
+            # nothing was fetched, so there is nothing to measure
+            with self._lock:
+                self.status["selectors-done"] += 1
+            self._update()
+            return result
+        return self._selector_done(result, self._before.pop(selector, {}), started)
+
+    def _item_sizes(self, selector):
+        """Return the sizes of the mirrored items of selector.
+
+        The products under ``.data`` are parsed for all selectors at once,
+        and again only once a sync has changed them.
+        """
+        if self._sizes is None:
+            self._sizes = metrics.selector_sizes(
+                self.config["target"], self.config["image-selectors"].splitlines()
+            )
+        return self._sizes.get(selector, {})
+
+    def _run_sstream_mirror(self, selector, source):
+        config = dict(self.config, **{"image-source": source})
+        cmd = sync_selector_cmd(config, config["target"], selector)
+        # equivalent upstream mirrors share the state of the configured sources
+        key_config = self.config if source in self.sources else config
+        key = upstream.state_key(*sync_selector_cmd(key_config, config["target"], selector))
+        state_path = os.path.join(config["target"], upstream.STATE_FILE)
+        index_url = upstream.index_url(source, config.get("path"))
+        fingerprint = {} if self.force else upstream.check(index_url, state_path, key)
+        if fingerprint is None:
+            return {"status": "unchanged", "returncode": "0", "output": "No changes upstream"}
+        if not self._sync_changed():
+            return {"status": "cancelled", "returncode": "", "output": self.blocked}
+        if selector not in self._before:
+            self._before[selector] = self._item_sizes(selector)
+        self._sizes = None
+        logger.info("Syncing {} from {}".format(selector, source))
+        self._update(current=selector)
+        try:
+            output = subprocess.check_output(cmd, env=os.environ.copy(), stderr=subprocess.STDOUT)
+            returncode = 0
+            upstream.record(state_path, key, fingerprint)
+            logger.info("Syncing {} complete".format(selector))
+        except subprocess.CalledProcessError as e:
+            output = e.output
+            returncode = e.returncode
+            logger.info("Error syncing {}: {}".format(selector, e.output))
+        if isinstance(output, bytes):
+            output = output.decode(errors="replace")
+        return {
+            "status": "ok" if returncode == 0 else "failed",
+            "returncode": str(returncode),
+            "output": output,
+        }
+
+    def _selector_done(self, result, before, started):
+        values = metrics.selector_metrics(
+            before,
+            self._item_sizes(result["selector"]),
+            time.monotonic() - started,
+            result["status"] != "failed",
+        )
+        result.update({key: str(value) for key, value in values.items()})
+        if (
+            result.get("mirror")
+            and values["bytes-downloaded"]  # noqa: W503
+            and values["throughput-bytes-per-second"] < self._min_rate()  # noqa: W503
+        ):
+            logger.info("{} is below the throughput floor".format(result["mirror"]))
+            self._demote(result["mirror"])
+        with self._lock:
+            self.metrics[result["selector"]] = values
+            self.status["selectors-done"] += 1
+        self._update()
+        return result
+
+    def _sync_single_pass(self, selectors):
+        """Mirror all selectors in-process with one metadata fetch per source.
+
+        Selectors owned by a peer are mirrored from it in a pass of their
+        own, falling back to upstream if the peer fails or lacks their items.
+        """
+        shards = {}
+        for i, selector in enumerate(selectors, start=1):
+            source, owner = peers.source_for(self.config, selector)
+            shards.setdefault((source, owner), []).append((i, selector))
+        changed = False
+        for (source, owner), shard in sorted(shards.items(), key=lambda s: s[0][1] or ""):
+            if owner:
+                try:
+                    changed |= self._mirror_pass(source, shard, owner)
+                    if all(self._item_sizes(s) for _, s in shard):
+                        continue
+                except (Cancelled, download.Interrupted):
+                    raise
+                except Exception as e:
+                    logger.info("Error syncing from peer {}: {}".format(owner, e))
+                logger.info("Peer {} cannot serve its selectors, using upstream".format(owner))
+            changed |= self._upstream_pass(shard)
+        if not changed:
+            self.status["results"]["status"] = "no changes"
+        self._update(**{"selectors-done": len(selectors)})
+
+    def _upstream_pass(self, shard):
+        """Mirror a shard from the best upstream source that serves it."""
+        ranked = list(self.sources)
+        for i, source in enumerate(ranked):
+            try:
+                return self._mirror_pass(
+                    source, shard, "upstream", fallbacks=ranked[:i] + ranked[i + 1 :]  # noqa: E203
+                )
+            except (Cancelled, download.Interrupted):
+                raise
+            except Exception as e:
+                if i == len(ranked) - 1:
+                    raise
+                logger.info("Error syncing from {}: {}".format(source, e))
+                self._demote(source)
+
+    def _mirror_pass(self, source, shard, origin, fallbacks=()):
+        config = self.config
+        selectors = [selector for _, selector in shard]
+        key = upstream.state_key(
+            "simplestreams",
+            self.config["image-source"] if origin == "upstream" else source,
+            config.get("path"),
+            config.get("keyring-file"),
+            config["image-max"],
+            config.get("keep", True),
+            *selectors,
+        )
+        state_path = os.path.join(config["target"], upstream.STATE_FILE)
+        index_url = upstream.index_url(source, config.get("path"))
+        fingerprint = {} if self.force else upstream.check(index_url, state_path, key)
+        if fingerprint is None:
+            logger.info("No changes in {} for {}".format(source, selectors))
+            for i, selector in shard:
+                self.status["results"]["selector-{}".format(i)] = {
+                    "selector": selector,
+                    "status": "unchanged",
+                    "source": origin,
+                }
+            return False
+        if not self._sync_changed():
+            raise Cancelled()
+        started = time.monotonic()
+        self._sizes = None
+        summary = mirror.sync(
+            source,
+            config["target"],
+            selectors,
+            keyring=config.get("keyring-file") or None,
+            path=config.get("path") or None,
+            max_items=config["image-max"],
+            keep=config.get("keep", True),
+            progress=self._item_done,
+            segments=config.get("download-segments") or 1,
+            stop=lambda: self.cancelled,
+            fallbacks=fallbacks,
+            min_rate=self._min_rate(),
+            workers=config.get("sync-concurrency") or 1,
+            # peers are expected to share a local network, only upstream is paced
+            throttle=self.limiter if origin == "upstream" else None,
+        )
+        duration = time.monotonic() - started
+        logger.info("Syncing from {} complete: {}".format(source, summary))
+        upstream.record(state_path, key, fingerprint)
+        for (i, selector), stats in zip(shard, summary["selectors"]):
+            values = {
+                "duration-seconds": round(duration, 3),
+                "bytes-downloaded": stats["bytes"],
+                "files-fetched": stats["fetched"],
+                "files-skipped": max(0, stats["matched"] - stats["fetched"]),
+                "throughput-bytes-per-second": round(stats["bytes"] / duration) if duration else 0,
+                "success": 1,
+                "timestamp": round(time.time()),
+            }
+            self.metrics[selector] = values
+            self.status["results"]["selector-{}".format(i)] = dict(
+                {key: str(value) for key, value in values.items()},
+                selector=selector,
+                status="ok",
+                source=origin,
+            )
+        results = self.status["results"]
+        results["items"] = str(int(results.get("items", 0)) + summary["items"])
+        results["bytes"] = str(int(results.get("bytes", 0)) + summary["bytes"])
+        return True
+
+    def _item_done(self, path, size):
+        if self.cancelled:
+            raise Cancelled()
+        with self._lock:
+            self.status["bytes-done"] += size
+        self._update(current=path)
+        self._wait_for_window()
+
+    def _wait_for_window(self):
+        """Pause until a sync window is open."""
+        if throttle.in_window(self.windows):
+            return
+        resumes = throttle.next_opening(self.windows)
+        logger.info("Outside the sync windows, pausing until {}".format(time.ctime(resumes)))
+        self._update(phase="paused", resumes=resumes)
+        while not throttle.in_window(self.windows):
+            if self.cancelled:
+                raise Cancelled()
+            time.sleep(PROGRESS_INTERVAL)
+        logger.info("Sync window open, resuming")
+        self._update(phase="syncing", resumes=None)
+
+    def _rank_sources(self):
+        """Order the upstream mirrors by probed speed for this run."""
+        ranked, probes = sources.rank(
+            self.sources, self.config.get("path"), self.config.get("keyring-file")
+        )
+        if not ranked:
+            raise ValueError("No image source passed signature verification")
+        self.sources = ranked
+        if probes:
+            self._update(sources=" ".join(ranked))
+
+    def _demote(self, source):
+        """Move a failing or slow mirror behind the others."""
+        with self._lock:
+            if source in self.sources and len(self.sources) > 1:
+                self.sources.remove(source)
+                self.sources.append(source)
+
+    def _min_rate(self):
+        return (self.config.get("min-throughput") or 0) * 1024
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a simple-streams sync job.")
+    parser.add_argument("--state-dir", required=True)
+    parser.add_argument("--job-id")
+    parser.add_argument("--force", action="store_true")
+    parser.add_argument(
+        "--scheduled", action="store_true", help="started by cron rather than an action"
+    )
+    args = parser.parse_args(argv)
+    if os.getpgrp() != os.getpid():
+        os.setpgid(0, 0)
+    trigger = "cron" if args.scheduled else "action"
+    try:
+        status = SyncJob(args.state_dir, args.job_id, args.force, trigger).run()
+    except AlreadyRunning as e:
+        logger.info("Sync job {} is still running, skipping this {} run".format(e, trigger))
+        return 0
+    return 0 if status["phase"] == "done" else 1
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    sys.exit(main())
@@ -0,0 +1,120 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Limit when, and how fast, a sync may use the network.
+
+``sync-windows`` lists the local times at which a sync may transfer, as
+``HH:MM-HH:MM`` ranges separated by spaces; a range may wrap past midnight,
+and an empty value allows any time.  ``max-bandwidth`` is a default limit in
+KiB/s optionally followed by ``HH:MM-HH:MM=KiB/s`` overrides for parts of
+the day, e.g. ``8192 08:00-18:00=2048``; 0 means no limit.  The limit is
+shared by all concurrent downloads of a job through a Limiter.
+"""
+
+import threading
+import time
+
+DAY = 24 * 60
+
+
+def _minutes(value):
+    hours, _, minutes = value.partition(":")
+    if not (hours.isdigit() and minutes.isdigit()):
+        raise ValueError("Invalid time of day: {}".format(value))
+    minute = int(hours) * 60 + int(minutes)
+    # 24:00 is accepted as the end of the day
+    if int(minutes) > 59 or minute > DAY:
+        raise ValueError("Invalid time of day: {}".format(value))
+    return minute % DAY
+
+
+def _range(value):
+    start, sep, end = value.partition("-")
+    if not sep:
+        raise ValueError("Invalid time range: {}".format(value))
+    return _minutes(start), _minutes(end)
+
+
+def parse_windows(value):
+    """Return the (start, end) minutes of day of each window in value."""
+    return [_range(window) for window in (value or "").split()]
+
+
+def parse_bandwidth(value):
+    """Return (default, [(start, end, limit), ...]) with limits in bytes per second."""
+    default, ranges = 0, []
+    for term in (value or "").split():
+        window, sep, limit = term.rpartition("=")
+        if not limit.isdigit():
+            raise ValueError("Invalid bandwidth: {}".format(term))
+        if sep:
+            ranges.append(_range(window) + (int(limit) * 1024,))
+        else:
+            default = int(limit) * 1024
+    return default, ranges
+
+
+def _minute_of_day(now):
+    local = time.localtime(now)
+    return local.tm_hour * 60 + local.tm_min + local.tm_sec / 60
+
+
+def _contains(start, end, minute):
+    if start <= end:
+        return start <= minute < end
+    return minute >= start or minute < end
+
+
+def in_window(windows, now=None):
+    """Return True if a sync may run at now; always with no windows."""
+    minute = _minute_of_day(time.time() if now is None else now)
+    return not windows or any(_contains(start, end, minute) for start, end in windows)
+
+
+def next_opening(windows, now=None):
+    """Return the time the next window opens, or now if one is open."""
+    now = time.time() if now is None else now
+    if in_window(windows, now):
+        return now
+    minute = _minute_of_day(now)
+    wait = min((start - minute) % DAY for start, _ in windows)
+    return now + wait * 60
+
+
+def limit_at(schedule, now=None):
+    """Return the bandwidth limit in bytes per second at now; 0 for none."""
+    default, ranges = schedule
+    minute = _minute_of_day(time.time() if now is None else now)
+    for start, end, limit in ranges:
+        if _contains(start, end, minute):
+            return limit
+    return default
+
+
+class Limiter:
+    """Pace callers so that together they stay under a bandwidth schedule.
+
+    Each call accounts for bytes already transferred and sleeps as long as
+    needed for the total to fit the limit in force, allowing bursts of up
+    to BURST seconds of transfer.  Returns the seconds slept.
+    """
+
+    BURST = 1.0
+
+    def __init__(self, schedule):
+        self.schedule = schedule
+        self._lock = threading.Lock()
+        self._free_at = 0.0
+
+    def __call__(self, size):
+        limit = limit_at(self.schedule)
+        if not limit:
+            return 0
+        with self._lock:
+            now = time.monotonic()
+            self._free_at = max(self._free_at, now - self.BURST) + size / limit
+            delay = self._free_at - now
+        if delay <= 0:
+            return 0
+        time.sleep(delay)
+        return delay
@@ -0,0 +1,106 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Publish a stream trimmed to the products the image selectors pick.
+
+With ``keep`` the mirrored metadata lists every product ever retained, so
+clients parse far more than they use.  Next to the full stream, under
+``streams/v1/trimmed``, a products document is written for each content id
+holding only the versions that ``image-selectors`` and ``image-max`` select,
+with an ``index.json`` listing them.  Item paths are unchanged, so the
+trimmed index can be used in place of the full one.  The documents under
+``.data`` are read one at a time, and a trimmed document is rewritten only
+when its content changes.  The trimmed stream is not signed.
+"""
+
+import email.utils
+import logging
+import os
+import shutil
+
+import state
+import streams
+
+logger = logging.getLogger(__name__)
+
+TRIMMED_DIR = "streams/v1/trimmed"
+INDEX_FILE = "index.json"
+
+
+def trim(data, selectors, max_items=None):
+    """Return a copy of a products document limited to what selectors select."""
+    items = list(streams.items_of(data))
+    wanted = set()
+    for selector in selectors:
+        for item in streams.select(items, selector, max_items):
+            wanted.add((item["product"], item["version"], item["item"]))
+    trimmed = {key: value for key, value in data.items() if key != "products"}
+    trimmed["products"] = {}
+    for product, version, item in sorted(wanted):
+        source = data["products"][product]
+        target = trimmed["products"].setdefault(product, dict(source, versions={}))
+        versions = target["versions"]
+        if version not in versions:
+            versions[version] = dict(source["versions"][version], items={})
+        versions[version]["items"][item] = source["versions"][version]["items"][item]
+    return trimmed
+
+
+def _timestamp(updated):
+    try:
+        return email.utils.parsedate_to_datetime(updated).timestamp()
+    except (TypeError, ValueError):
+        return 0
+
+
+def _write(path, document):
+    """Write document to path unless it already holds it; return the size."""
+    if state.read_json(path) == document:
+        return os.path.getsize(path)
+    return state.write_json(path, document, indent=1)
+
+
+def update(root, selectors, max_items=None):
+    """Regenerate the trimmed stream of the tree at root.
+
+    Without selectors the trimmed stream is removed.  Returns a summary of
+    the products and items kept and the bytes of the full and trimmed
+    products documents.
+    """
+    out_dir = os.path.join(root, TRIMMED_DIR)
+    selectors = [selector for selector in selectors if selector.strip()]
+    if not selectors:
+        shutil.rmtree(out_dir, ignore_errors=True)
+        return None
+    os.makedirs(out_dir, exist_ok=True)
+    summary = {"products": 0, "items": 0, "bytes-in": 0, "bytes-out": 0}
+    index = {}
+    for path in streams.data_files(os.path.join(root, ".data")):
+        data = streams.load_products(path)
+        if data is None or not data.get("content_id"):
+            continue
+        trimmed = trim(data, selectors, max_items)
+        if not trimmed["products"]:
+            continue
+        name = "{}.json".format(data["content_id"])
+        summary["bytes-in"] += os.path.getsize(path)
+        summary["bytes-out"] += _write(os.path.join(out_dir, name), trimmed)
+        summary["products"] += len(trimmed["products"])
+        summary["items"] += len(list(streams.items_of(trimmed)))
+        entry = {key: value for key, value in data.items() if key in ("datatype", "format")}
+        entry.update(path="{}/{}".format(TRIMMED_DIR, name), products=sorted(trimmed["products"]))
+        if "updated" in data:
+            entry["updated"] = data["updated"]
+        index[data["content_id"]] = entry
+    document = {"format": "index:1.0", "index": index}
+    updated = [entry["updated"] for entry in index.values() if "updated" in entry]
+    if updated:
+        document["updated"] = max(updated, key=_timestamp)
+    _write(os.path.join(out_dir, INDEX_FILE), document)
+    wanted = {os.path.basename(entry["path"]) for entry in index.values()} | {INDEX_FILE}
+    for name in os.listdir(out_dir):
+        # compressed copies are looked after by precompress
+        if name.endswith(".json") and name not in wanted:
+            os.unlink(os.path.join(out_dir, name))
+    logger.info("Trimmed stream of {}: {}".format(root, summary))
+    return summary
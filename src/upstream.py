@@ -0,0 +1,81 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Detect whether the upstream stream index changed since the last sync.
+
+The validators (ETag, Last-Modified and a sha256 of the index body) seen at
+the last successful sync are kept in a small JSON file next to ``.data`` in
+the download directory, keyed by the sync they belong to.
+"""
+
+import hashlib
+import logging
+import re
+import urllib.error
+import urllib.request
+
+import state
+
+logger = logging.getLogger(__name__)
+
+STATE_FILE = ".upstream.json"
+DEFAULT_INDEX = "streams/v1/index.sjson"
+TIMEOUT = 30
+
+
+def index_url(source, path=None):
+    """Return the URL of the index (or products) file a sync starts from."""
+    if not path:
+        match = re.search("streams/v1/.*[.](sjson|json)$", source)
+        if match:
+            return source
+        path = DEFAULT_INDEX
+    return "{}/{}".format(source.rstrip("/"), path.lstrip("/"))
+
+
+def state_key(*parts):
+    """Return a short stable key identifying one sync configuration."""
+    return hashlib.sha256("\0".join(str(p) for p in parts).encode()).hexdigest()[:16]
+
+
+def check(url, state_path, key):
+    """Return the upstream fingerprint, or None when nothing changed upstream.
+
+    A conditional request is sent with the stored validators; a 304 or an
+    identical body hash means the last successful sync is still current.
+    Network errors are logged and reported as a change so that the real sync
+    runs and surfaces them.
+    """
+    previous = state.read_json(state_path).get(key, {})
+    request = urllib.request.Request(url)
+    if previous.get("etag"):
+        request.add_header("If-None-Match", previous["etag"])
+    if previous.get("last-modified"):
+        request.add_header("If-Modified-Since", previous["last-modified"])
+    try:
+        with urllib.request.urlopen(request, timeout=TIMEOUT) as response:
+            fingerprint = {
+                "etag": response.headers.get("ETag"),
+                "last-modified": response.headers.get("Last-Modified"),
+                "sha256": hashlib.sha256(response.read()).hexdigest(),
+            }
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            logger.info("Upstream {} not modified".format(url))
+            return None
+        logger.info("Error checking upstream {}: {}".format(url, e))
+        return {}
+    except (OSError, ValueError) as e:
+        logger.info("Error checking upstream {}: {}".format(url, e))
+        return {}
+    if previous.get("sha256") and previous["sha256"] == fingerprint["sha256"]:
+        logger.info("Upstream {} unchanged".format(url))
+        return None
+    return fingerprint
+
+
+def record(state_path, key, fingerprint):
+    """Store the fingerprint of a successful sync."""
+    if not fingerprint:
+        return
+    state.update_json(state_path, lambda fingerprints: dict(fingerprints, **{key: fingerprint}))
@@ -0,0 +1,84 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Check the item files of a tree against the sha256 in its metadata.
+
+Files are hashed in chunks on a thread per core; hashlib releases the GIL
+while it digests, so the threads run in parallel.  Computed digests are
+cached by real path together with the size, modification time and inode
+they were computed for, so a repeated verification only hashes files that
+changed since.
+"""
+
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import download
+import state
+import streams
+
+logger = logging.getLogger(__name__)
+
+CACHE_FILE = "verify-cache.json"
+
+
+def _signature(stat):
+    return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+
+def verify(root, cache_path=None, workers=None):
+    """Verify every item listed under root/.data; return a report.
+
+    The report counts the items checked, hashed and answered from the
+    cache, the bytes hashed, and lists the relative paths of the items
+    that are missing or whose content does not match their metadata.
+    """
+    cache = state.read_json(cache_path) if cache_path else {}
+    expected = {}
+    for item in streams.iter_items(os.path.join(root, ".data")):
+        if item["sha256"]:
+            expected[item["path"]] = item
+    report = {"items": len(expected), "hashed": 0, "cached": 0, "bytes-hashed": 0}
+    missing, corrupt, pending = [], [], []
+    for path, item in sorted(expected.items()):
+        real_path = os.path.realpath(os.path.join(root, path))
+        try:
+            stat = os.stat(real_path)
+        except OSError:
+            missing.append(path)
+            continue
+        if item["size"] and stat.st_size != item["size"]:
+            corrupt.append(path)
+            continue
+        cached = cache.get(real_path)
+        if cached and cached[:3] == _signature(stat):
+            report["cached"] += 1
+            if cached[3] != item["sha256"]:
+                corrupt.append(path)
+            continue
+        pending.append((path, real_path, stat))
+
+    def hash_file(entry):
+        path, real_path, stat = entry
+        return path, real_path, stat, download.sha256sum(real_path)
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        for path, real_path, stat, digest in executor.map(hash_file, pending):
+            report["hashed"] += 1
+            report["bytes-hashed"] += stat.st_size
+            cache[real_path] = _signature(stat) + [digest]
+            if digest != expected[path]["sha256"]:
+                corrupt.append(path)
+    if cache_path:
+        state.write_json(
+            cache_path, {path: entry for path, entry in cache.items() if os.path.exists(path)}
+        )
+    report["missing"] = missing
+    report["corrupt"] = sorted(corrupt)
+    logger.info(
+        "Verified {}: {} items, {} hashed, {} missing, {} corrupt".format(
+            root, report["items"], report["hashed"], len(missing), len(corrupt)
+        )
+    )
+    return report
@@ -0,0 +1,251 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Fixtures for benchmarking the charm against a local stand-in simplestreams server.
+
+A synthetic stream of ``--bench-products`` products with one item of
+``--bench-file-size`` bytes each is generated, clearsigned with a throwaway
+key when gpg is available, and served over HTTP with ``--bench-latency``
+milliseconds of delay per request and at most ``--bench-bandwidth`` KiB/s
+per response.  Timings are written as JSON to ``--bench-results``::
+
+    PYTHONPATH=src pytest tests/benchmark --bench-results=benchmark.json
+"""
+
+import hashlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+CONTENT_ID = "com.example.bench:v1:download"
+PRODUCTS_PATH = "streams/v1/{}.json".format(CONTENT_ID)
+CHUNK_SIZE = 64 * 1024
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("bench", "charm benchmarks")
+    group.addoption("--bench-products", type=int, default=20, help="Products in the stream")
+    group.addoption("--bench-file-size", type=int, default=1024 * 1024, help="Bytes of each item")
+    group.addoption(
+        "--bench-latency", type=float, default=0, help="Milliseconds of delay per request"
+    )
+    group.addoption(
+        "--bench-bandwidth", type=int, default=0, help="KiB/s per response, 0 for no limit"
+    )
+    group.addoption("--bench-results", default="", help="Path of the JSON results file")
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(content)
+
+
+def build_tree(root, products, file_size):
+    """Write a synthetic unsigned stream to root; return the products document."""
+    document = {
+        "content_id": CONTENT_ID,
+        "datatype": "image-downloads",
+        "format": "products:1.0",
+        "updated": "Thu, 01 Jan 2026 00:00:00 +0000",
+        "products": {},
+    }
+    for i in range(products):
+        name = "com.example.bench:v1:product-{:04d}".format(i)
+        path = "bench/product-{:04d}/20260101/root.tar.xz".format(i)
+        # distinct content per item, so dedup has nothing to share
+        content = i.to_bytes(4, "big") * (file_size // 4) + b"\0" * (file_size % 4)
+        _write(os.path.join(root, path), content)
+        document["products"][name] = {
+            "arch": "amd64",
+            "os": "ubuntu",
+            "release": "bench",
+            "versions": {
+                "20260101": {
+                    "items": {
+                        "root.tar.xz": {
+                            "ftype": "root.tar.xz",
+                            "path": path,
+                            "size": file_size,
+                            "sha256": hashlib.sha256(content).hexdigest(),
+                        }
+                    }
+                }
+            },
+        }
+    index = {
+        "format": "index:1.0",
+        "updated": document["updated"],
+        "index": {
+            CONTENT_ID: {
+                "datatype": "image-downloads",
+                "format": "products:1.0",
+                "path": PRODUCTS_PATH,
+                "products": sorted(document["products"]),
+            }
+        },
+    }
+    _write(os.path.join(root, "streams/v1/index.json"), json.dumps(index).encode())
+    _write(os.path.join(root, PRODUCTS_PATH), json.dumps(document).encode())
+    return document
+
+
+def sign_tree(root, home):
+    """Clearsign the stream documents with a new key; return the keyring path, or None.
+
+    The signed index lists the signed products document, as upstream does.
+    """
+    if not shutil.which("gpg"):
+        return None
+    gpg = ["gpg", "--homedir", home, "--batch", "--pinentry-mode", "loopback", "--passphrase", ""]
+    index_path = os.path.join(root, "streams/v1/index.json")
+    with open(index_path) as f:
+        index = json.load(f)
+    signed_path = PRODUCTS_PATH[: -len("json")] + "sjson"
+    index["index"][CONTENT_ID]["path"] = signed_path
+    unsigned_index = os.path.join(home, "index.json")
+    with open(unsigned_index, "w") as f:
+        json.dump(index, f)
+    keyring = os.path.join(home, "bench-keyring.gpg")
+    try:
+        subprocess.run(
+            gpg + ["--quick-gen-key", "bench <bench@example.com>", "ed25519", "sign", "never"],
+            check=True,
+            capture_output=True,
+        )
+        for source, target in (
+            (os.path.join(root, PRODUCTS_PATH), os.path.join(root, signed_path)),
+            (unsigned_index, os.path.join(root, "streams/v1/index.sjson")),
+        ):
+            subprocess.run(
+                gpg + ["--yes", "--clearsign", "-o", target, source],
+                check=True,
+                capture_output=True,
+            )
+        subprocess.run(gpg + ["--output", keyring, "--export"], check=True, capture_output=True)
+    except subprocess.CalledProcessError:
+        return None
+    return keyring
+
+
+class StreamHandler(BaseHTTPRequestHandler):
+    """Serve files of a directory with optional latency, bandwidth and Range support."""
+
+    root = None
+    latency = 0
+    bandwidth = 0
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):  # noqa: N802
+        time.sleep(self.latency)
+        path = os.path.join(self.root, self.path.split("?", 1)[0].lstrip("/"))
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        stat = os.stat(path)
+        etag = '"{:x}-{:x}"'.format(stat.st_size, stat.st_mtime_ns)
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        start, end = 0, stat.st_size
+        ranges = self.headers.get("Range", "")
+        if ranges.startswith("bytes="):
+            first, _, last = ranges[len("bytes=") :].partition("-")  # noqa: E203
+            start, end = int(first), int(last) + 1 if last else stat.st_size
+            self.send_response(206)
+            self.send_header(
+                "Content-Range", "bytes {}-{}/{}".format(start, end - 1, stat.st_size)
+            )
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(end - start))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        with open(path, "rb") as f:
+            f.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+                if self.bandwidth:
+                    time.sleep(len(chunk) / self.bandwidth)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="session")
+def stream_server(request):
+    """Serve a synthetic stream; yield its URL, index path, keyring and size."""
+    options = request.config.option
+    tmp = tempfile.TemporaryDirectory()
+    root = os.path.join(tmp.name, "stream")
+    document = build_tree(root, options.bench_products, options.bench_file_size)
+    home = os.path.join(tmp.name, "gnupg")
+    os.makedirs(home, mode=0o700)
+    keyring = sign_tree(root, home)
+    handler = type(
+        "BenchStreamHandler",
+        (StreamHandler,),
+        {
+            "root": root,
+            "latency": options.bench_latency / 1000,
+            "bandwidth": options.bench_bandwidth * 1024,
+        },
+    )
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield {
+        "root": root,
+        "url": "http://127.0.0.1:{}/".format(server.server_port),
+        "path": "streams/v1/index.{}".format("sjson" if keyring else "json"),
+        "keyring": keyring or "",
+        "document": document,
+        "items": options.bench_products,
+        "bytes": options.bench_products * options.bench_file_size,
+    }
+    server.shutdown()
+    server.server_close()
+    if keyring:
+        subprocess.run(["gpgconf", "--homedir", home, "--kill", "gpg-agent"], capture_output=True)
+    tmp.cleanup()
+
+
+@pytest.fixture(scope="session")
+def results(request, stream_server):
+    """Collect timings and write them to --bench-results at the end of the session."""
+    options = request.config.option
+    collected = {}
+    yield collected
+    if not options.bench_results:
+        return
+    report = {
+        "parameters": {
+            "products": options.bench_products,
+            "file-size": options.bench_file_size,
+            "latency-ms": options.bench_latency,
+            "bandwidth-kib": options.bench_bandwidth,
+            "signed": bool(stream_server["keyring"]),
+        },
+        "environment": {
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "timestamp": round(time.time()),
+        "results": collected,
+    }
+    with open(options.bench_results, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
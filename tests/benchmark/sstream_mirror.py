@@ -0,0 +1,119 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""A pure-Python stand-in for sstream-mirror, for benchmarking without simplestreams.
+
+It takes the options the charm passes to sstream-mirror, checks signed
+documents against the keyring, selects items with the charm's selector
+parser and fetches the missing ones one after the other.  Like the
+simplestreams object store mirror, it writes the products of the mirrored
+items to ``.data/<content_id>`` and ``streams/v1``, merging them with what
+earlier runs for other selectors left there.  Without ``--keep``, items
+that are no longer selected are dropped from the metadata but left on disk.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "src"))
+
+import planner  # noqa: E402
+import streams  # noqa: E402
+import upstream  # noqa: E402
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = "{}.tmp".format(path)
+    with open(tmp, "w") as f:
+        f.write(content)
+    os.replace(tmp, path)
+
+
+def _fetch(url, dest, item):
+    if os.path.isfile(dest) and os.path.getsize(dest) == item["size"]:
+        return 0
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    digest = hashlib.sha256()
+    tmp = "{}.tmp".format(dest)
+    with urllib.request.urlopen(url, timeout=planner.TIMEOUT) as response, open(tmp, "wb") as f:
+        for chunk in iter(lambda: response.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+            f.write(chunk)
+    if item["sha256"] and digest.hexdigest() != item["sha256"]:
+        os.unlink(tmp)
+        raise ValueError("Checksum mismatch for {}".format(url))
+    os.replace(tmp, dest)
+    return item["size"]
+
+
+def _mirrored(document, selected, existing):
+    """Return the products tree of the selected items, on top of existing."""
+    tree = existing or dict(
+        {key: value for key, value in document.items() if key != "products"}, products={}
+    )
+    for item in selected:
+        product = document["products"][item["product"]]
+        version = product["versions"][item["version"]]
+        versions = tree["products"].setdefault(
+            item["product"],
+            dict({k: v for k, v in product.items() if k != "versions"}, versions={}),
+        )["versions"]
+        items = versions.setdefault(
+            item["version"], dict({k: v for k, v in version.items() if k != "items"}, items={})
+        )["items"]
+        items[item["item"]] = version["items"][item["item"]]
+    return tree
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stand-in for sstream-mirror.")
+    parser.add_argument("--keep", action="store_true")
+    parser.add_argument("--no-verify", action="store_true")
+    parser.add_argument("--keyring")
+    parser.add_argument("--verbose", action="store_true")
+    parser.add_argument("--path")
+    parser.add_argument("--log-file")
+    parser.add_argument("--max", type=int)
+    parser.add_argument("source")
+    parser.add_argument("target")
+    parser.add_argument("filters", nargs="*")
+    args = parser.parse_args(argv)
+    keyring = None if args.no_verify else args.keyring
+    index_url = upstream.index_url(args.source, args.path)
+    base = index_url.split("streams/v1/", 1)[0]
+    index = planner.fetch_document(index_url, keyring)
+    index_path = os.path.join(args.target, "streams", "v1", "index.json")
+    out_index = streams.load_products(index_path) or {}
+    out_index = {
+        "format": "index:1.0",
+        "updated": index.get("updated"),
+        "index": out_index.get("index", {}),
+    }
+    fetched = 0
+    for content_id, entry in sorted(index.get("index", {}).items()):
+        document = planner.fetch_document(base + entry["path"], keyring)
+        selected = streams.select(streams.items_of(document), " ".join(args.filters), args.max)
+        for item in selected:
+            fetched += _fetch(base + item["path"], os.path.join(args.target, item["path"]), item)
+        data_path = os.path.join(args.target, ".data", content_id)
+        existing = streams.load_products(data_path) if args.keep else None
+        content = json.dumps(_mirrored(document, selected, existing), indent=1, sort_keys=True)
+        _write(data_path, content)
+        products_path = "streams/v1/{}.json".format(content_id)
+        _write(os.path.join(args.target, products_path), content)
+        out_index["index"][content_id] = dict(entry, path=products_path)
+    _write(index_path, json.dumps(out_index, indent=1, sort_keys=True))
+    if args.verbose:
+        print("Fetched {} bytes into {}".format(fetched, args.target))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
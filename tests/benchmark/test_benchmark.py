@@ -0,0 +1,180 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import importlib.util
+import itertools
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from unittest.mock import Mock, patch
+
+import pytest
+from ops.testing import Harness
+
+import syncjob
+from charm import SimpleStreamsCharm
+
+ENGINES = {
+    "sstream-mirror": lambda: shutil.which("sstream-mirror") is not None,
+    "simplestreams": lambda: importlib.util.find_spec("simplestreams") is not None,
+}
+REPEAT = 5
+STAND_IN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sstream_mirror.py")
+
+
+@pytest.fixture(scope="module")
+def engine_path(tmp_path_factory):
+    """Return a PATH with sstream-mirror on it, the pure-Python stand-in if it is not installed."""
+    if ENGINES["sstream-mirror"]():
+        return os.environ["PATH"]
+    bin_dir = tmp_path_factory.mktemp("bin")
+    wrapper = bin_dir / "sstream-mirror"
+    wrapper.write_text('#!/bin/sh\nexec "{}" "{}" "$@"\n'.format(sys.executable, STAND_IN))
+    wrapper.chmod(0o755)
+    return "{}{}{}".format(bin_dir, os.pathsep, os.environ["PATH"])
+
+
+@pytest.fixture(scope="module")
+def charm(stream_server, engine_path):
+    """Yield a charm with its image-dir and state directory in a temporary directory."""
+    tmp = tempfile.TemporaryDirectory()
+    names = ("snapshot-{:06d}".format(i) for i in itertools.count())
+    environ = {"PATH": engine_path, "no_proxy": "127.0.0.1"}
+    with patch.dict(os.environ, environ), patch.object(
+        SimpleStreamsCharm, "_sync_state_dir", return_value=os.path.join(tmp.name, "state")
+    ), patch.object(SimpleStreamsCharm, "_get_snapshot_name", side_effect=lambda: next(names)):
+        harness = Harness(SimpleStreamsCharm)
+        harness.begin()
+        harness.update_config(
+            {
+                "image-dir": os.path.join(tmp.name, "images"),
+                "image-source": stream_server["url"],
+                "path": stream_server["path"],
+                "keyring-file": stream_server["keyring"],
+                "image-selectors": "arch=amd64",
+                "sync-engine": "sstream-mirror",
+                "metrics-textfile-dir": "",
+            }
+        )
+        yield harness.charm
+        harness.cleanup()
+    tmp.cleanup()
+
+
+def run_action(handler, **params):
+    """Run an action handler and return its results, failing the test if the action fails."""
+    event = Mock(params=params)
+    handler(event)
+    assert not event.fail.called, event.fail.call_args
+    return event.set_results.call_args[0][0] if event.set_results.called else {}
+
+
+def measure(results, name, function, repeat=1, **extra):
+    """Time function, repeat times, and record the median and best wall time under name."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        value = function()
+        timings.append(time.perf_counter() - started)
+    results[name] = dict(
+        extra,
+        seconds=round(statistics.median(timings), 6),
+        best=round(min(timings), 6),
+        runs=repeat,
+    )
+    return value
+
+
+def sync(charm, engine="sstream-mirror"):
+    """Sync latest from scratch with engine, waiting for it to finish."""
+    latest = charm._image_download_dir()
+    shutil.rmtree(latest, ignore_errors=True)
+    os.makedirs(latest)
+    charm._stored.config["sync-engine"] = engine
+    return run_action(charm._on_synchronize_action, wait=True)
+
+
+@pytest.fixture
+def synced(charm):
+    """Make sure latest holds the stream, syncing it untimed if no test has yet."""
+    if not os.path.isdir(os.path.join(charm._image_download_dir(), ".data")):
+        sync(charm)
+    return charm
+
+
+@pytest.fixture
+def snapshot(synced):
+    """Return the name of the newest snapshot, creating one untimed if there is none."""
+    image_dir = synced._stored.config["image-dir"]
+    names = sorted(d for d in os.listdir(image_dir) if d.startswith("snapshot-"))
+    if not names:
+        return run_action(synced._on_create_snapshot_action)["name"]
+    return names[-1]
+
+
+@pytest.mark.parametrize("engine", sorted(ENGINES))
+def test_synchronize(charm, stream_server, results, engine):
+    if engine != "sstream-mirror" and not ENGINES[engine]():
+        pytest.skip("{} is not installed".format(engine))
+    measure(
+        results,
+        "synchronize[{}]".format(engine),
+        lambda: sync(charm, engine),
+        items=stream_server["items"],
+        bytes=stream_server["bytes"],
+        stand_in=engine == "sstream-mirror" and not ENGINES[engine](),
+    )
+    selectors = len(charm._stored.config["image-selectors"].splitlines())
+    last_run = syncjob.read_last_run(charm._sync_state_dir())
+    assert last_run["phase"] == "done"
+    assert last_run["selectors-ok"] == selectors
+    measure(
+        results,
+        "resync-noop[{}]".format(engine),
+        lambda: run_action(charm._on_synchronize_action, wait=True),
+        repeat=REPEAT,
+    )
+    last_run = syncjob.read_last_run(charm._sync_state_dir())
+    assert last_run["selectors-unchanged"] == selectors
+    assert last_run["selectors-ok"] == 0
+
+
+@pytest.mark.parametrize("mode", ["symlink", "copy", "dedup"])
+def test_create_snapshot(synced, stream_server, results, mode):
+    charm = synced
+    charm._stored.config["copy-on-snapshot"] = mode != "symlink"
+    charm._stored.config["snapshot-copy-mode"] = "dedup" if mode == "dedup" else "copy"
+    snapshot = measure(
+        results,
+        "create-snapshot[{}]".format(mode),
+        lambda: run_action(charm._on_create_snapshot_action),
+        items=stream_server["items"],
+    )
+    assert int(snapshot["items"]) == stream_server["items"]
+
+
+def test_list_snapshots(charm, snapshot, results):
+    listed = measure(
+        results,
+        "list-snapshots",
+        lambda: run_action(charm._on_list_snapshots_action),
+        repeat=REPEAT,
+    )
+    results["list-snapshots"]["snapshots"] = len(listed["snapshots"])
+    assert listed["snapshots"]
+
+
+@pytest.mark.parametrize("verify", [False, True])
+def test_publish_snapshot(charm, snapshot, stream_server, results, verify):
+    name = snapshot
+    measure(
+        results,
+        "publish-snapshot[{}]".format("verify" if verify else "plain"),
+        lambda: run_action(charm._on_publish_snapshot_action, name=name, verify=verify),
+        repeat=1 if verify else REPEAT,
+        bytes=stream_server["bytes"] if verify else 0,
+    )
+    assert os.path.realpath(charm._image_publish_dir()).endswith(name)
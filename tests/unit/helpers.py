@@ -0,0 +1,92 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Build simplestreams metadata and image trees, and serve them, for the unit tests."""
+
+import json
+import os
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+CONTENT_ID = "com.ubuntu.maas:stable:v3:download"
+
+
+def temp_dir(test):
+    """Return a temporary directory removed when test finishes."""
+    tmp = tempfile.TemporaryDirectory()
+    test.addCleanup(tmp.cleanup)
+    return tmp.name
+
+
+def write(path, content):
+    """Write str or bytes content to path, creating its directories."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb" if isinstance(content, bytes) else "w") as f:
+        f.write(content)
+    return path
+
+
+def item(path, size=100, sha256="a" * 64):
+    return {"path": path, "size": size, "sha256": sha256}
+
+
+def version(release, serial, size=100, sha256="a" * 64):
+    """Return a version holding the squashfs of release at serial."""
+    path = "{}/amd64/{}/squashfs".format(release, serial)
+    return {"items": {"squashfs": item(path, size, sha256)}}
+
+
+def products(releases, content_id=CONTENT_ID):
+    """Return a products document with one amd64 product per release.
+
+    releases maps each release to its serials, or to its versions by serial.
+    """
+    document = {
+        "content_id": content_id,
+        "datatype": "image-downloads",
+        "format": "products:1.0",
+        "updated": "Mon, 01 Jan 2024 00:00:00 +0000",
+        "products": {},
+    }
+    for release, versions in releases.items():
+        if not isinstance(versions, dict):
+            versions = {serial: version(release, serial) for serial in versions}
+        document["products"][release] = {"release": release, "arch": "amd64", "versions": versions}
+    return document
+
+
+def write_products(root, document, name=None):
+    """Write document under root/.data, named after its content id as simplestreams does."""
+    return write(os.path.join(root, ".data", name or document["content_id"]), json.dumps(document))
+
+
+class QuietHandler(BaseHTTPRequestHandler):
+    """A request handler that does not log; subclasses implement do_GET."""
+
+    def send_body(self, body, headers=None):
+        self.send_response(200)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(test, handler):
+    """Serve handler on a local port until test finishes; return the base URL.
+
+    Requests to it bypass any proxy set in the environment.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    test.addCleanup(server.server_close)
+    test.addCleanup(server.shutdown)
+    proxy = patch.dict(os.environ, {"no_proxy": "*"})
+    proxy.start()
+    test.addCleanup(proxy.stop)
+    return "http://127.0.0.1:{}".format(server.server_port)
@@ -0,0 +1,68 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import os
+import tempfile
+import unittest
+
+import capacity
+import manifest
+
+
+class TestCapacity(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.image_dir = self.tmp.name
+
+    def write(self, path, size):
+        path = os.path.join(self.image_dir, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(b"x" * size)
+        return path
+
+    def test_measure(self):
+        shared = self.write("snapshot-20260101000000/jammy/squashfs", 64 * 1024)
+        self.write("snapshot-20260102000000/.data/products.json", 4096)
+        os.makedirs(os.path.join(self.image_dir, "latest", "jammy"))
+        os.link(shared, os.path.join(self.image_dir, "latest", "jammy", "squashfs"))
+        self.write("latest/jammy/kernel", 8192)
+        # the creation time in the manifest decides the order, not the name
+        manifest.write(os.path.join(self.image_dir, "snapshot-20260102000000"), {"created": 0})
+        usage = capacity.measure(self.image_dir)
+        trees = usage["trees"]
+        assert list(trees) == ["snapshot-20260102000000", "snapshot-20260101000000", "latest"]
+        old = trees["snapshot-20260101000000"]
+        assert old["bytes"] == old["new-bytes"] >= 64 * 1024
+        latest = trees["latest"]
+        assert latest["bytes"] >= 72 * 1024
+        assert latest["new-bytes"] == latest["bytes"] - old["bytes"]
+        assert usage["size"] >= usage["free"] > 0
+
+    def test_update_and_summary(self):
+        self.write("latest/jammy/kernel", 4096)
+        self.write("snapshot-20260101000000/jammy/kernel", 4096)
+        state_dir = os.path.join(self.image_dir, "state")
+        os.makedirs(state_dir)
+        assert capacity.summary(capacity.load(state_dir)) == ""
+        usage = capacity.update(state_dir, self.image_dir)
+        assert capacity.load(state_dir) == usage
+        usage.update({"free": 1024**3})
+        usage["trees"]["latest"]["bytes"] = 2048
+        usage["trees"]["snapshot-20260101000000"]["new-bytes"] = 1024
+        assert capacity.summary(usage) == "latest 2.0 KiB, 1 snapshots +1.0 KiB, 1.0 GiB free"
+
+    def test_adjust(self):
+        state_dir = os.path.join(self.image_dir, "state")
+        os.makedirs(state_dir)
+        self.write("latest/jammy/kernel", 4096)
+        capacity.update(state_dir, self.image_dir)
+        usage = capacity.adjust(
+            state_dir, self.image_dir, {"snapshot-1": {"bytes": 10, "new-bytes": 2}}
+        )
+        assert usage["trees"]["snapshot-1"] == {"bytes": 10, "new-bytes": 2}
+        assert "latest" in usage["trees"]
+        usage = capacity.adjust(state_dir, self.image_dir, {"snapshot-1": None, "gone": None})
+        assert list(usage["trees"]) == ["latest"]
+        assert capacity.load(state_dir) == usage
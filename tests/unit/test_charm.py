@@ -1,14 +1,27 @@
 # Copyright 2020 Ubuntu
 # See LICENSE file for licensing details.
 
+import fcntl
 import os
 import random
+import subprocess
+import sys
+import tempfile
+import time
 import unittest
-from unittest.mock import Mock, call, mock_open, patch
+from unittest.mock import ANY, Mock, call, mock_open, patch
 from uuid import uuid4
 
+from ops.model import ActiveStatus, BlockedStatus, MaintenanceStatus
 from ops.testing import Harness
 
+import capacity
+import manifest
+import metrics
+import state
+import syncjob
+import upstream
+import verify
 from charm import SimpleStreamsCharm, _get_env
 
 
@@ -31,6 +44,15 @@ def test_get_env():
 
 
 class TestCharm(unittest.TestCase):
+    def setUp(self):
+        self.state_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.state_dir.cleanup)
+        patcher = patch.object(
+            SimpleStreamsCharm, "_sync_state_dir", return_value=self.state_dir.name
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     def default_config(self):
         return {
             "image-selectors": str(uuid4()),
@@ -44,6 +66,21 @@ class TestCharm(unittest.TestCase):
             "cron-schedule": "None",
             "copy-on-snapshot": False,
             "keep": True,
+            "sync-concurrency": 1,
+            "sync-engine": "sstream-mirror",
+            "snapshot-copy-mode": "copy",
+            "metrics-textfile-dir": str(uuid4()),
+            "download-segments": 1,
+            "snapshot-keep-count": 0,
+            "snapshot-keep-days": 0,
+            "gc-after-sync": False,
+            "peer-mirror-url": "",
+            "min-throughput": 0,
+            "metadata-compression": "",
+            "trimmed-streams": False,
+            "max-bandwidth": "",
+            "sync-windows": "",
+            "disk-reserve": 0,
         }
 
     @patch("subprocess.check_output")
@@ -76,8 +113,145 @@ class TestCharm(unittest.TestCase):
     @patch("os.symlink")
     @patch("os.makedirs")
     @patch("os.path.isdir")
+    def test_config_changed_invalid_throttle(self, os_path_isdir, os_makedirs, os_symlink):
+        harness = Harness(SimpleStreamsCharm)
+        self.addCleanup(harness.cleanup)
+        os_path_isdir.return_value = False
+        harness.begin()
+        harness.update_config(dict(self.default_config(), **{"sync-windows": "22:00-24:30"}))
+        assert harness.charm.unit.status == BlockedStatus(
+            "Invalid sync-windows: Invalid time of day: 24:30"
+        )
+        self.assertFalse(os_makedirs.called)
+        harness.charm.on.update_status.emit()
+        assert harness.charm.unit.status.message.startswith("Invalid sync-windows")
+        harness.update_config({"sync-windows": "", "max-bandwidth": "fast"})
+        assert harness.charm.unit.status == BlockedStatus(
+            "Invalid max-bandwidth: Invalid bandwidth: fast"
+        )
+        harness.update_config({"max-bandwidth": "8192"})
+        self.assertTrue(os_makedirs.called)
+        assert harness.charm.unit.status == BlockedStatus("Images not synchronized")
+
+    @patch("os.symlink")
+    @patch("os.makedirs")
+    @patch("os.path.isdir")
+    def test_peer_mirrors(self, os_path_isdir, os_makedirs, os_symlink):
+        harness = Harness(SimpleStreamsCharm)
+        self.addCleanup(harness.cleanup)
+        relation_id = harness.add_relation("replicas", "simple-streams")
+        harness.add_relation_unit(relation_id, "simple-streams/1")
+        harness.begin()
+        default_config = self.default_config()
+        default_config["peer-mirror-url"] = "http://{address}/images/latest"
+        harness.update_config(default_config)
+        assert harness.get_relation_data(relation_id, harness.charm.unit.name) == {
+            "mirror-url": "http://10.0.0.10/images/latest"
+        }
+        assert harness.charm._peer_mirrors() == {
+            harness.charm.unit.name: "http://10.0.0.10/images/latest"
+        }
+        harness.update_relation_data(
+            relation_id, "simple-streams/1", {"mirror-url": "http://10.0.0.6/images/latest"}
+        )
+        assert harness.charm._sync_config()["peers"] == {
+            harness.charm.unit.name: "http://10.0.0.10/images/latest",
+            "simple-streams/1": "http://10.0.0.6/images/latest",
+        }
+        harness.update_config({"peer-mirror-url": ""})
+        assert harness.get_relation_data(relation_id, harness.charm.unit.name) == {}
+
+    @patch("os.symlink")
+    @patch("os.makedirs")
+    @patch("os.path.isdir")
+    def test_config_changed_unchanged(self, os_path_isdir, os_makedirs, os_symlink):
+        harness = Harness(SimpleStreamsCharm)
+        self.addCleanup(harness.cleanup)
+        os_path_isdir.return_value = False
+        harness.begin()
+        default_config = self.default_config()
+        harness.update_config(default_config)
+        assert os_makedirs.call_count == 1
+        harness.charm.on.config_changed.emit()
+        assert os_makedirs.call_count == 1
+        harness.update_config({"image-max": default_config["image-max"] + 1})
+        assert os_makedirs.call_count == 2
+
+    @patch("state.write_json")
+    @patch("os.path.exists")
+    @patch("os.makedirs")
+    @patch("builtins.open", new_callable=mock_open)
+    def test_cron_job_unchanged(self, mock_open_call, os_makedirs, os_path_exists, write_json):
+        harness = Harness(SimpleStreamsCharm)
+        self.addCleanup(harness.cleanup)
+        harness.begin()
+        config = dict(self.default_config(), **{"cron-schedule": "0 * * * *"})
+        harness.charm._stored.config = config
+        os_path_exists.return_value = True
+        harness.charm._refresh_cron_job()
+        assert write_json.call_count == 1
+        harness.charm._refresh_cron_job()
+        assert write_json.call_count == 1
+        assert mock_open_call.return_value.write.call_count == 1
+        os_path_exists.return_value = False
+        harness.charm._refresh_cron_job()
+        assert write_json.call_count == 2
+
+    @patch("state.write_json")
+    @patch("os.path.exists")
+    @patch("os.path.isdir")
     @patch("builtins.open", new_callable=mock_open)
-    def test_cron_schedule_set(self, mock_open_call, os_path_isdir, os_makedirs, os_symlink):
+    def test_config_changed_restores_cron_job(
+        self, mock_open_call, os_path_isdir, os_path_exists, write_json
+    ):
+        harness = Harness(SimpleStreamsCharm)
+        self.addCleanup(harness.cleanup)
+        harness.begin()
+        os_path_isdir.return_value = True
+        os_path_exists.return_value = True
+        harness.update_config(dict(self.default_config(), **{"cron-schedule": "0 * * * *"}))
+        cron_file = mock_open_call.return_value
+        assert cron_file.write.call_count == 1
+        harness.charm.on.config_changed.emit()
+        assert cron_file.write.call_count == 1
+        # the cron file was deleted behind the charm's back
+        os_path_exists.return_value = False
+        harness.charm.on.config_changed.emit()
+        assert cron_file.write.call_count == 2
+        # a refresh may change the entry, so nothing is taken as unchanged
+        os_path_exists.return_value = True
+        harness.charm.on.upgrade_charm.emit()
+        assert harness.charm._stored.config_hash == harness.charm._stored.cron_hash == ""
+        harness.charm.on.config_changed.emit()
+        assert cron_file.write.call_count == 3
+
+    def test_hook_timing(self):
+        textfile_dir = os.path.join(self.state_dir.name, "textfile")
+        os.makedirs(textfile_dir)
+        harness = Harness(SimpleStreamsCharm)
+        self.addCleanup(harness.cleanup)
+        harness.begin()
+        harness.charm._stored.config = dict(
+            self.default_config(), **{"metrics-textfile-dir": textfile_dir}
+        )
+        with patch.dict(os.environ, {"JUJU_DISPATCH_PATH": "hooks/update-status"}):
+            harness.charm.framework.on.commit.emit()
+            harness.charm.framework.on.commit.emit()
+        records = state.read_json(os.path.join(self.state_dir.name, metrics.HOOK_METRICS_FILE))
+        assert records["hooks/update-status"]["count"] == 2
+        assert records["hooks/update-status"]["duration-seconds"] >= 0
+        assert os.listdir(textfile_dir) == [
+            "simple-streams-{}-hooks.prom".format(harness.model.app.name)
+        ]
+
+    @patch("state.write_json")
+    @patch("os.symlink")
+    @patch("os.makedirs")
+    @patch("os.path.isdir")
+    @patch("builtins.open", new_callable=mock_open)
+    def test_cron_schedule_set(
+        self, mock_open_call, os_path_isdir, os_makedirs, os_symlink, write_json
+    ):
         harness = Harness(SimpleStreamsCharm)
         self.addCleanup(harness.cleanup)
         harness.begin()
@@ -90,27 +264,22 @@ class TestCharm(unittest.TestCase):
             "/etc/cron.d/{}".format(harness.charm.model.app.name), "w"
         )
         mock_open_call.return_value.write.assert_called_once_with(
-            "{} root sstream-mirror --keep"
-            " --keyring={} --path={} --log-file={} --max={} {} {} '{}'\n".format(
-                default_config["cron-schedule"],
-                default_config["keyring-file"],
-                default_config["path"],
-                default_config["log-file"],
-                default_config["image-max"],
-                default_config["image-source"],
-                "{}/latest".format(default_config["image-dir"]),
-                default_config["image-selectors"],
+            "{} root python3 {}/src/syncjob.py --state-dir={} --scheduled\n".format(
+                default_config["cron-schedule"], harness.charm.charm_dir, self.state_dir.name
             )
         )
+        config = write_json.call_args[0][1]
+        assert write_json.call_args[0][0] == "{}/config.json".format(self.state_dir.name)
+        assert config["image-selectors"] == default_config["image-selectors"]
+        assert config["target"] == "{}/latest".format(default_config["image-dir"])
         self.assertTrue(os_path_isdir.called)
-        self.assertFalse(os_makedirs.called)
+        assert os_makedirs.call_args_list == [call(self.state_dir.name, exist_ok=True)]
         self.assertFalse(os_symlink.called)
 
     @patch.dict(os.environ, {"foo": "bar"}, clear=True)
     @patch("subprocess.check_output")
     def test_synchronize_action_defaults(self, mock_subproc):
-        process_mock = Mock()
-        mock_subproc.return_value = process_mock
+        mock_subproc.return_value = b""
         harness = Harness(SimpleStreamsCharm)
         harness.begin()
         minimal_config = {
@@ -143,8 +312,7 @@ class TestCharm(unittest.TestCase):
     @patch.dict(os.environ, {"JUJU_CHARM_HTTP_PROXY": "proxy"}, clear=True)
     @patch("subprocess.check_output")
     def test_synchronize_action_all_params(self, mock_subproc):
-        process_mock = Mock()
-        mock_subproc.return_value = process_mock
+        mock_subproc.return_value = b""
         harness = Harness(SimpleStreamsCharm)
         harness.begin()
         default_config = self.default_config()
@@ -170,6 +338,472 @@ class TestCharm(unittest.TestCase):
             stderr=-2,
         )
 
+    @patch("subprocess.check_output")
+    def test_synchronize_action_concurrent(self, mock_subproc):
+        def fake_sync(cmd, **kwargs):
+            if cmd[-1] == "bad":
+                raise subprocess.CalledProcessError(1, cmd, output=b"boom")
+            return b"done"
+
+        mock_subproc.side_effect = fake_sync
+        harness = Harness(SimpleStreamsCharm)
+        harness.begin()
+        default_config = self.default_config()
+        default_config["image-selectors"] = "good\nbad\nother"
+        default_config["sync-concurrency"] = 3
+        harness.charm._stored.config = default_config
+        action_event = Mock()
+        harness.charm._on_synchronize_action(action_event)
+        self.assertEqual(mock_subproc.call_count, 3)
+        results = action_event.set_results.call_args[0][0]
+        assert results["selector-1"]["status"] == "ok"
+        assert results["selector-1"]["output"] == "done"
+        assert {key: results["selector-2"][key] for key in ("status", "returncode", "output")} == {
+            "status": "failed",
+            "returncode": "1",
+            "output": "boom",
+        }
+        assert results["selector-2"]["selector"] == "bad"
+        assert results["selector-2"]["success"] == "0"
+        assert results["selector-3"]["selector"] == "other"
+        assert action_event.fail.call_args == call("Failed to sync 1 of 3 selectors")
+
+    @patch("subprocess.check_output")
+    @patch("mirror.sync")
+    def test_synchronize_action_single_pass(self, mirror_sync, mock_subproc):
+        mirror_sync.return_value = {
+            "items": 3,
+            "bytes": 1024,
+            "selectors": [
+                {"matched": 2, "fetched": 2, "bytes": 1000},
+                {"matched": 2, "fetched": 1, "bytes": 24},
+            ],
+        }
+        harness = Harness(SimpleStreamsCharm)
+        harness.begin()
+        default_config = self.default_config()
+        default_config["image-selectors"] = "arch=amd64 release~(jammy)\nos~(grub*|pxelinux)"
+        default_config["sync-engine"] = "simplestreams"
+        harness.charm._stored.config = default_config
+        action_event = Mock()
+        harness.charm._on_synchronize_action(action_event)
+        self.assertFalse(mock_subproc.called)
+        assert mirror_sync.call_args == call(
+            default_config["image-source"],
+            "{}/latest".format(default_config["image-dir"]),
+            ["arch=amd64 release~(jammy)", "os~(grub*|pxelinux)"],
+            keyring=default_config["keyring-file"],
+            path=default_config["path"],
+            max_items=default_config["image-max"],
+            keep=True,
+            progress=ANY,
+            segments=1,
+            stop=ANY,
+            fallbacks=[],
+            min_rate=0,
+            throttle=ANY,
+            workers=1,
+        )
+        results = action_event.set_results.call_args[0][0]
+        assert results["items"] == "3"
+        assert results["bytes"] == "1024"
+        assert results["selector-2"]["selector"] == "os~(grub*|pxelinux)"
+        assert results["selector-2"]["files-fetched"] == "1"
+        assert results["selector-2"]["files-skipped"] == "1"
+        assert results["selector-2"]["bytes-downloaded"] == "24"
+
+    @patch("mirror.sync")
+    def test_synchronize_action_single_pass_fail(self, mirror_sync):
+        mirror_sync.side_effect = OSError("signature check failed")
+        harness = Harness(SimpleStreamsCharm)
+        harness.begin()
+        default_config = self.default_config()
+        default_config["sync-engine"] = "simplestreams"
+        harness.charm._stored.config = default_config
+        action_event = Mock()
+        harness.charm._on_synchronize_action(action_event)
+        assert action_event.fail.call_args == call("Sync failed: signature check failed")
+
+    @patch("upstream.record")
+    @patch("upstream.check")
+    @patch("subprocess.check_output")
+    def test_synchronize_action_unchanged_upstream(self, mock_subproc, check, record):
+        check.return_value = None
+        harness = Harness(SimpleStreamsCharm)
+        harness.begin()
+        default_config = self.default_config()
+        harness.charm._stored.config = default_config
+        action_event = Mock(params={"force": False, "wait": True})
+        harness.charm._on_synchronize_action(action_event)
+        self.assertFalse(mock_subproc.called)
+        self.assertFalse(record.called)
+        assert check.call_args[0][:2] == (
+            "{}/{}".format(default_config["image-source"], default_config["path"]),
+            "{}/latest/.upstream.json".format(default_config["image-dir"]),
+        )
+        results = action_event.set_results.call_args[0][0]
+        assert results["selector-1"]["status"] == "unchanged"
+        self.assertFalse(action_event.fail.called)
+
+    @patch("upstream.record")
+    @patch("upstream.check")
+    @patch("subprocess.check_output")
+    def test_synchronize_action_records_upstream(self, mock_subproc, check, record):
+        check.return_value = {"etag": "abc"}
+        mock_subproc.return_value = b""
+        harness = Harness(SimpleStreamsCharm)
+        harness.begin()
+        default_config = self.default_config()
+        harness.charm._stored.config = default_config
+        action_event = Mock(params={"force": False, "wait": True})
+        harness.charm._on_synchronize_action(action_event)
+        self.assertTrue(mock_subproc.called)
+        key = upstream.state_key(*mock_subproc.call_args[0][0])
+        assert check.call_args[0][2] == key
+        assert record.call_args == call(
+            "{}/latest/.upstream.json".format(default_config["image-dir"]), key, {"etag": "abc"}
+        )
+
+    @patch("upstream.check")
+    @patch("mirror.sync")
+    def test_synchronize_action_single_pass_unchanged(self, mirror_sync, check):
+        check.return_value = None
+        harness = Harness(SimpleStreamsCharm)
+        harness.begin()
+        default_config = self.default_config()
+        default_config["sync-engine"] = "simplestreams"
+        harness.charm._stored.config = default_config
+        action_event = Mock(params={"force": False, "wait": True})
+        harness.charm._on_synchronize_action(action_event)
+        self.assertFalse(mirror_sync.called)
+        results = action_event.set_results.call_args[0][0]
+        assert results["status"] == "no changes"
+        assert results["selector-1"] == {
+            "selector": default_config["image-selectors"],
+            "status": "unchanged",
+            "source": "upstream",
+        }
+
+    @patch("syncjob.start")
+    def test_synchronize_action_background(self, syncjob_start):
+        syncjob_start.return_value = "sync-1234"
+        harness = Harness(SimpleStreamsCharm)
+        harness.begin()
+        default_config = self.default_config()
+        harness.charm._stored.config = default_config
+        action_event = Mock(params={"force": True, "wait": False})
+        harness.charm._on_synchronize_action(action_event)
+        assert syncjob_start.call_args == call(
+            self.state_dir.name,
+            dict(
+                default_config,
+                target="{}/latest".format(default_config["image-dir"]),
+                app=harness.charm.model.app.name,
+                unit=harness.charm.unit.name,
+                peers={},
+            ),
+            force=True,
+            python=sys.executable,
+            env=ANY,
+        )
+        assert action_event.set_results.call_args == call({"job-id": "sync-1234"})
+
+    @patch("syncjob.start")
+    def test_synchronize_action_already_running(self, syncjob_start):
+        state.write_json(
+            os.path.join(self.state_dir.name, syncjob.STATUS_FILE), {"job-id": "sync-1"}
+        )
+        harness = Harness(SimpleStreamsCharm)
+        harness.begin()
+        harness.charm._stored.config = self.default_config()
+        action_event = Mock(params={"force": False, "wait": False})
+        with open(os.path.join(self.state_dir.name, syncjob.LOCK_FILE), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            harness.charm._on_synchronize_action(action_event)
+        self.assertFalse(syncjob_start.called)
+        assert action_event.fail.call_args == call("Sync job sync-1 is already running")
+
+    @patch("syncjob.is_running")
+    @patch("syncjob.SyncJob")
+    def test_synchronize_action_wait_loses_lock(self, sync_job, is_running):
+        # a scheduled job can take the lock between the check and the run
+        is_running.return_value = False
+        sync_job.return_value.run.side_effect = syncjob.AlreadyRunning("sync-2")
+        harness = Harness(SimpleStreamsCharm)
+        harness.begin()
+        harness.charm._stored.config = self.default_config()
+        action_event = Mock(params={"force": False, "wait": True})
+        harness.charm._on_synchronize_action(action_event)
+        self.assertFalse(action_event.set_results.called)
+        assert action_event.fail.call_args == call("Sync job sync-2 is already running")
+
+    def test_sync_status_action(self):
+        harness = Harness(SimpleStreamsCharm)
+        harness.begin()
+        action_event = Mock()
+        harness.charm._on_sync_status_action(action_event)
+        assert action_event.fail.call_args == call("No sync job has run")
+        state.write_json(
+            os.path.join(self.state_dir.name, syncjob.STATUS_FILE),
+            {
+                "job-id": "sync-1",
+                "pid": 1,
+                "phase": "syncing",
+                "bytes-done": 10,
+                "eta": None,
+                "results": {"selector-1": {"status": "ok"}},
+            },
+        )
+        action_event = Mock()
+        harness.charm._on_sync_status_action(action_event)
+        # nothing holds the lock, so the job died without finishing
+        assert action_event.set_results.call_args == call(
+            {
+                "job-id": "sync-1",
+                "phase": "lost",
+                "bytes-done": "10",
+                "results": {"selector-1": {"status": "ok"}},
+            }
+        )
+
+    @patch("syncjob.cancel")
+    def test_cancel_sync_action(self, syncjob_cancel):
+        harness = Harness(SimpleStreamsCharm)
+        harness.begin()
+        syncjob_cancel.return_value = False
+        action_event = Mock()
+        harness.charm._on_cancel_sync_action(action_event)
+        assert action_event.fail.call_args == call("No sync job is running")
+        syncjob_cancel.return_value = True
+        state.write_json(
+            os.path.join(self.state_dir.name, syncjob.STATUS_FILE), {"job-id": "sync-1"}
+        )
+        action_event = Mock()
+        harness.charm._on_cancel_sync_action(action_event)
+        assert syncjob_cancel.call_args == call(self.state_dir.name)
+        assert action_event.set_results.call_args == call({"job-id": "sync-1"})
+
+    @patch("syncjob.is_running")
+    @patch("reclaim.collect")
+    def test_gc_action(self, collect, is_running):
+        default_config = self.default_config()
+        default_config["snapshot-keep-count"] = 3
+        harness = Harness(SimpleStreamsCharm)
+        harness.begin()
+        harness.charm._stored.config = default_config
+        is_running.return_value = True
+        action_event = Mock(params={"dry-run": True})
+        harness.charm._on_gc_action(action_event)
+        assert action_event.fail.call_args == call(
+            "Cannot collect garbage while a sync job is running"
+        )
+        self.assertFalse(collect.called)
+        is_running.return_value = False
+        collect.return_value = {"bytes-freed": 10, "dry-run": True, "snapshots": ["snapshot-1"]}
+        action_event = Mock(params={"dry-run": True})
+        harness.charm._on_gc_action(action_event)
+        assert collect.call_args == call(
+            default_config["image-dir"], keep_count=3, keep_days=0, dry_run=True
+        )
+        assert action_event.set_results.call_args == call(
+            {"bytes-freed": "10", "dry-run": "True", "snapshots": ["snapshot-1"]}
+        )
+        collect.side_effect = ValueError("latest has no stream metadata")
+        action_event = Mock(params={})
+        harness.charm._on_gc_action(action_event)
+        assert action_event.fail.call_args == call("latest has no stream metadata")
+
+    def test_diff_snapshots_action(self):
+        image_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(image_dir.cleanup)
+        harness = Harness(SimpleStreamsCharm)
+        harness.begin()
+        harness.charm._stored.config = dict(self.default_config(), **{"image-dir": image_dir.name})
+        action_event = Mock(params={"from": "snapshot-1"})
+        harness.charm._on_diff_snapshots_action(action_event)
+        assert action_event.fail.call_args == call("Snapshot snapshot-1 does not exist")
+        for name in ("snapshot-1", "latest"):
+            os.makedirs(os.path.join(image_dir.name, name, ".data"))
+        os.symlink(
+            os.path.join(image_dir.name, "snapshot-1"), os.path.join(image_dir.name, "publish")
+        )
+        report = {key: [] for key in ("added", "removed", "changed")}
+        report.update({"added-bytes": 0, "removed-bytes": 0, "changed-bytes": 0})
+        report["added"] = ["p{}".format(i) for i in range(21)]
+        with patch("compare.diff", return_value=report) as diff:
+            action_event = Mock(params={})
+            harness.charm._on_diff_snapshots_action(action_event)
+        assert diff.call_args == call(
+            os.path.join(image_dir.name, "publish"), os.path.join(image_dir.name, "latest")
+        )
+        results = action_event.set_results.call_args[0][0]
+        assert results["added"] == "21"
+        assert results["added-versions"].endswith("p19\n... and 1 more")
+        assert results["removed-versions"] == ""
+
+    @patch("planner.plan")
+    def test_plan_sync_action(self, plan):
+        harness = Harness(SimpleStreamsCharm)
+        harness.begin()
+        harness.charm._stored.config = self.default_config()
+        paths = ["item-{}".format(i) for i in range(22)]
+        plan.return_value = {
+            "source": "http://example.com/",
+            "selectors": [
+                {
+                    "selector": "arch=amd64",
+                    "items": 22,
+                    "add": paths,
+                    "add-bytes": 2200,
+                    "prune": [],
+                    "prune-bytes": 0,
+                }
+            ],
+            "add": 22,
+            "add-bytes": 2200,
+            "prune": 0,
+            "prune-bytes": 0,
+            "eta-seconds": None,
+        }
+        action_event = Mock(params={"image-selectors": "arch=amd64", "image-max": 1})
+        harness.charm._on_plan_sync_action(action_event)
+        config = plan.call_args[0][0]
+        assert config["image-selectors"] == "arch=amd64"
+        assert config["image-max"] == 1
+        results = action_event.set_results.call_args[0][0]
+        assert "eta-seconds" not in results
+        assert results["add-bytes"] == "2200"
+        selector = results["selector-1"]
+        assert selector["add"] == "22"
+        assert selector["add-paths"].splitlines()[-1] == "... and 2 more"
+        assert selector["prune-paths"] == ""
+        plan.side_effect = OSError("Connection refused")
+        action_event = Mock(params={})
+        harness.charm._on_plan_sync_action(action_event)
+        assert action_event.fail.call_args == call("Cannot plan sync: Connection refused")
+
+    @patch("verify.verify")
+    def test_verify_action(self, verify_verify):
+        harness = Harness(SimpleStreamsCharm)
+        harness.begin()
+        harness.charm._stored.config = dict(self.default_config(), **{"image-dir": "/nowhere"})
+        action_event = Mock(params={"name": "snapshot-1"})
+        harness.charm._on_verify_action(action_event)
+        assert action_event.fail.call_args == call("Snapshot does not exist")
+        image_dir = os.path.join(self.state_dir.name, "images")
+        os.makedirs(os.path.join(image_dir, "latest"))
+        harness.charm._stored.config["image-dir"] = image_dir
+        verify_verify.return_value = {
+            "items": 3,
+            "hashed": 1,
+            "cached": 1,
+            "bytes-hashed": 10,
+            "missing": ["a"],
+            "corrupt": ["b", "c"],
+        }
+        action_event = Mock(params={"name": ""})
+        harness.charm._on_verify_action(action_event)
+        assert verify_verify.call_args == call(
+            "{}/latest".format(image_dir),
+            "{}/{}".format(self.state_dir.name, verify.CACHE_FILE),
+        )
+        assert action_event.set_results.call_args == call(
+            {
+                "items": "3",
+                "hashed": "1",
+                "cached": "1",
+                "bytes-hashed": "10",
+                "missing": "a",
+                "corrupt": "b\nc",
+            }
+        )
+        assert action_event.fail.call_args == call("1 missing and 2 corrupt items")
+
+    @patch("verify.verify")
+    @patch("os.path.isdir")
+    @patch("os.path.islink")
+    @patch("os.symlink")
+    @patch("os.unlink")
+    @patch("os.makedirs")
+    def test_publish_snapshot_verify(
+        self, os_makedirs, os_unlink, os_symlink, os_path_islink, os_path_isdir, verify_verify
+    ):
+        harness = Harness(SimpleStreamsCharm)
+        harness.begin()
+        harness.charm._stored.config = self.default_config()
+        verify_verify.return_value = {"items": 1, "missing": [], "corrupt": ["a"]}
+        action_event = Mock(params={"name": "snapshot-1", "verify": True})
+        harness.charm._on_publish_snapshot_action(action_event)
+        assert action_event.fail.call_args == call("Snapshot snapshot-1 failed verification")
+        self.assertFalse(os_symlink.called)
+        verify_verify.return_value = {"items": 1, "missing": [], "corrupt": []}
+        action_event = Mock(params={"name": "snapshot-1", "verify": True})
+        harness.charm._on_publish_snapshot_action(action_event)
+        self.assertFalse(action_event.fail.called)
+        self.assertTrue(os_symlink.called)
+
+    def test_update_status_last_run(self):
+        publish_dir = os.path.join(self.state_dir.name, "publish")
+        os.makedirs(os.path.join(publish_dir, ".data"))
+        os.utime(os.path.join(publish_dir, ".data"), (0, 0))
+        harness = Harness(SimpleStreamsCharm)
+        harness.begin()
+        harness.charm._stored.config = self.default_config()
+        with patch.object(SimpleStreamsCharm, "_image_publish_dir", return_value=publish_dir):
+            harness.charm._on_update_status(Mock())
+            assert harness.charm.unit.status == ActiveStatus("Publishes: {}".format(time.ctime(0)))
+            state.write_json(
+                os.path.join(self.state_dir.name, syncjob.LAST_RUN_FILE),
+                {"phase": "failed", "finished": 60},
+            )
+            harness.charm._on_update_status(Mock())
+        assert harness.charm.unit.status == ActiveStatus(
+            "Publishes: {}; last sync failed at {}".format(time.ctime(0), time.ctime(60))
+        )
+        manifest.write(publish_dir, {"items": 3, "bytes": 2048, "created": 30})
+        with patch.object(SimpleStreamsCharm, "_image_publish_dir", return_value=publish_dir):
+            harness.charm._on_update_status(Mock())
+        assert harness.charm.unit.status == ActiveStatus(
+            "Publishes: {} (3 items, 2.0 KiB); last sync failed at {}".format(
+                time.ctime(30), time.ctime(60)
+            )
+        )
+        state.write_json(
+            os.path.join(self.state_dir.name, capacity.USAGE_FILE),
+            {"trees": {"latest": {"bytes": 4096, "new-bytes": 4096}}, "free": 1024**3},
+        )
+        with patch.object(SimpleStreamsCharm, "_image_publish_dir", return_value=publish_dir):
+            harness.charm._on_update_status(Mock())
+        assert harness.charm.unit.status.message.endswith("; disk: latest 4.0 KiB, 1.0 GiB free")
+        state.write_json(
+            os.path.join(self.state_dir.name, syncjob.LAST_RUN_FILE),
+            {"phase": "blocked", "finished": 90, "message": "Out of disk space: 1.0 MiB free"},
+        )
+        harness.charm._on_update_status(Mock())
+        assert harness.charm.unit.status == BlockedStatus("Out of disk space: 1.0 MiB free")
+
+    @patch("syncjob.is_running")
+    def test_update_status_sync_running(self, is_running):
+        is_running.return_value = True
+        state.write_json(
+            os.path.join(self.state_dir.name, syncjob.STATUS_FILE),
+            {
+                "phase": "syncing",
+                "current": "os~(grub*|pxelinux)",
+                "selectors-done": 1,
+                "selectors-total": 2,
+                "bytes-done": 3 * 1024 * 1024,
+                "eta": 600,
+            },
+        )
+        harness = Harness(SimpleStreamsCharm)
+        harness.begin()
+        harness.charm._stored.config = self.default_config()
+        harness.charm._on_update_status(Mock())
+        assert harness.charm.unit.status == MaintenanceStatus(
+            "Syncing os~(grub*|pxelinux) (1/2 selectors), 3.0 MiB, ETA 10m"
+        )
+
     @patch("os.symlink")
     @patch("os.makedirs")
     @patch("os.path.isdir")
@@ -185,15 +819,46 @@ class TestCharm(unittest.TestCase):
         assert harness.get_relation_data(relation_id, harness._unit_name) == {
             "path": "{}/publish".format(default_config["image-dir"])
         }
+        with patch("shutil.which", return_value=None):
+            harness.update_config({"metadata-compression": "gzip zstd"})
+        assert harness.get_relation_data(relation_id, harness._unit_name) == {
+            "path": "{}/publish".format(default_config["image-dir"]),
+            "encodings": "gzip",
+        }
+        harness.update_config({"trimmed-streams": True})
+        assert harness.get_relation_data(relation_id, harness._unit_name)["trimmed-index"] == (
+            "streams/v1/trimmed/index.json"
+        )
 
+    @patch("precompress.compress_tree")
+    @patch("manifest.write")
+    @patch("manifest.load")
+    @patch("snapshots.previous_snapshot")
+    @patch("snapshots.incremental_copytree")
     @patch("os.walk")
-    @patch("shutil.copytree")
     @patch("os.path.exists")
     @patch("os.symlink")
     @patch("os.makedirs")
     def test_create_snapshot_action(
-        self, os_makedirs, os_symlink, os_path_exists, shutil_copytree, os_walk
+        self,
+        os_makedirs,
+        os_symlink,
+        os_path_exists,
+        os_walk,
+        incremental_copytree,
+        previous_snapshot,
+        manifest_load,
+        manifest_write,
+        compress_tree,
     ):
+        manifest_load.return_value = {"items": 2, "bytes": 10, "created": 0}
+        incremental_copytree.return_value = {
+            "files": 1,
+            "files-changed": 1,
+            "bytes-changed": 5,
+            "files-linked": 0,
+        }
+
         def a2g(x):
             return ([n, ["{}".format(n)]] for n in x)
 
@@ -201,6 +866,7 @@ class TestCharm(unittest.TestCase):
         os_walk.side_effect = iter([a2g([rand_n])])
         os_path_exists.return_value = False
         default_config = self.default_config()
+        default_config["metadata-compression"] = "gzip"
         harness = Harness(SimpleStreamsCharm)
         harness.begin()
         harness.charm._stored.config = default_config
@@ -208,24 +874,60 @@ class TestCharm(unittest.TestCase):
         snapshot_name = uuid4()
         harness.charm._get_snapshot_name.return_value = snapshot_name
         action_event = Mock()
-        harness.charm._on_create_snapshot_action(action_event)
+        with patch("capacity.adjust") as adjust:
+            harness.charm._on_create_snapshot_action(action_event)
         self.assertTrue(os_symlink.called)
         assert os_symlink.call_args == call(
             "{}/latest/{}".format(default_config["image-dir"], rand_n),
             "{}/{}/{}".format(default_config["image-dir"], snapshot_name, rand_n),
         )
-        assert shutil_copytree.call_args == call(
+        # the usage comes from the copy summary rather than a walk of the trees
+        assert adjust.call_args == call(
+            self.state_dir.name,
+            default_config["image-dir"],
+            {snapshot_name: {"bytes": 5, "new-bytes": 5}},
+        )
+        assert previous_snapshot.call_args == call(default_config["image-dir"], snapshot_name)
+        assert incremental_copytree.call_args == call(
             "{}/latest/.data".format(default_config["image-dir"]),
             "{}/{}/.data".format(default_config["image-dir"], snapshot_name),
+            "{}/.data".format(previous_snapshot.return_value),
+        )
+        assert action_event.set_results.call_args[0][0]["name"] == str(snapshot_name)
+        assert action_event.set_results.call_args[0][0]["items"] == "2"
+        assert manifest_load.call_args == call("{}/latest".format(default_config["image-dir"]))
+        assert manifest_write.call_args[0][0] == "{}/{}".format(
+            default_config["image-dir"], snapshot_name
+        )
+        assert manifest_write.call_args[0][1]["created"] > 0
+        assert compress_tree.call_args == call(
+            "{}/{}".format(default_config["image-dir"], snapshot_name),
+            ["gzip"],
+            source="{}/latest".format(default_config["image-dir"]),
         )
 
+    @patch("manifest.write")
+    @patch("manifest.load")
+    @patch("snapshots.previous_snapshot")
+    @patch("snapshots.incremental_copytree")
     @patch("os.walk")
     @patch("shutil.copytree")
     @patch("os.path.exists")
     @patch("os.makedirs")
     def test_create_snapshot_copy_action(
-        self, os_makedirs, os_path_exists, shutil_copytree, os_walk
+        self,
+        os_makedirs,
+        os_path_exists,
+        shutil_copytree,
+        os_walk,
+        incremental_copytree,
+        previous_snapshot,
+        manifest_load,
+        manifest_write,
     ):
+        manifest_load.return_value = {"items": 2, "bytes": 10, "created": 0}
+        previous_snapshot.return_value = None
+
         def a2g(x):
             return ([n, ["{}".format(n)]] for n in x)
 
@@ -246,13 +948,61 @@ class TestCharm(unittest.TestCase):
             "{}/latest/{}".format(default_config["image-dir"], rand_n),
             "{}/{}/{}".format(default_config["image-dir"], snapshot_name, rand_n),
         )
-        assert shutil_copytree.call_args_list[1] == call(
+        assert incremental_copytree.call_args == call(
             "{}/latest/.data".format(default_config["image-dir"]),
             "{}/{}/.data".format(default_config["image-dir"], snapshot_name),
+            None,
         )
 
+    @patch("manifest.write")
+    @patch("manifest.load")
+    @patch("snapshots.incremental_copytree")
+    @patch("streams.item_digests")
+    @patch("snapshots.dedup_copytree")
     @patch("os.walk")
-    def test_list_snapshots_action(self, os_walk):
+    @patch("shutil.copytree")
+    @patch("os.path.exists")
+    @patch("os.makedirs")
+    def test_create_snapshot_dedup_action(
+        self,
+        os_makedirs,
+        os_path_exists,
+        shutil_copytree,
+        os_walk,
+        dedup_copytree,
+        item_digests,
+        incremental_copytree,
+        manifest_load,
+        manifest_write,
+    ):
+        manifest_load.return_value = {"items": 2, "bytes": 10, "created": 0}
+        os_walk.side_effect = iter([iter([["latest", ["jammy", ".data"], []]])])
+        os_path_exists.return_value = False
+        item_digests.return_value = {"jammy/squashfs": "a" * 64}
+        default_config = self.default_config()
+        default_config["copy-on-snapshot"] = True
+        default_config["snapshot-copy-mode"] = "dedup"
+        harness = Harness(SimpleStreamsCharm)
+        harness.begin()
+        harness.charm._stored.config = default_config
+        harness.charm._get_snapshot_name = Mock(return_value="snapshot-1")
+        harness.charm._on_create_snapshot_action(Mock())
+        image_dir = default_config["image-dir"]
+        assert item_digests.call_args == call("{}/latest/.data".format(image_dir))
+        assert dedup_copytree.call_args_list == [
+            call(
+                "{}/latest".format(image_dir),
+                "{}/snapshot-1".format(image_dir),
+                "jammy",
+                {"jammy/squashfs": "a" * 64},
+                "{}/.objects".format(image_dir),
+            )
+        ]
+        self.assertFalse(shutil_copytree.called)
+
+    @patch("manifest.load")
+    @patch("os.walk")
+    def test_list_snapshots_action(self, os_walk, manifest_load):
         def a2g(x):
             return ([n, ["snapshot-{}".format(n)]] for n in x)
 
@@ -264,9 +1014,22 @@ class TestCharm(unittest.TestCase):
         harness.charm._stored.config = default_config
         harness.charm._get_snapshot_name = Mock()
         action_event = Mock()
+        manifest_load.return_value = {"items": 2, "bytes": 10, "created": 0, "products": {}}
         harness.charm._on_list_snapshots_action(action_event)
+        assert manifest_load.call_args == call(
+            "{}/snapshot-{}".format(default_config["image-dir"], rand_n)
+        )
         assert action_event.set_results.call_args == call(
-            {"snapshots": ["snapshot-{}".format(rand_n)]}
+            {
+                "snapshots": ["snapshot-{}".format(rand_n)],
+                "details": {
+                    "snapshot-{}".format(rand_n): {
+                        "items": "2",
+                        "bytes": "10",
+                        "created": time.ctime(0),
+                    }
+                },
+            }
         )
 
     @patch("shutil.rmtree")
@@ -0,0 +1,60 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import os
+import unittest
+from unittest.mock import patch
+
+from helpers import item, products, temp_dir, write_products
+
+import compare
+import streams
+
+
+def document(content_id, versions):
+    return products(
+        {
+            "jammy": {
+                serial: {"items": {"squashfs": item(serial, size, sha)}}
+                for serial, (size, sha) in versions.items()
+            }
+        },
+        content_id,
+    )
+
+
+class TestCompare(unittest.TestCase):
+    def setUp(self):
+        tmp = temp_dir(self)
+        self.old = os.path.join(tmp, "snapshot-1")
+        self.new = os.path.join(tmp, "latest")
+
+    def test_diff(self):
+        write_products(self.old, document("a", {"1": (10, "x"), "2": (20, "y")}))
+        write_products(self.new, document("a", {"2": (25, "z"), "3": (30, "w")}))
+        report = compare.diff(self.old, self.new)
+        assert report == {
+            "added": ["jammy 3"],
+            "removed": ["jammy 1"],
+            "changed": ["jammy 2"],
+            "added-bytes": 30,
+            "removed-bytes": 10,
+            "changed-bytes": 25,
+        }
+        assert compare.diff(self.new, self.new)["changed"] == []
+
+    def test_shared_documents_are_not_read(self):
+        shared = write_products(self.old, document("a", {"1": (10, "x")}))
+        os.makedirs(os.path.join(self.new, ".data"))
+        os.link(shared, os.path.join(self.new, ".data", "a"))
+        write_products(self.new, document("b", {"5": (50, "v")}))
+        with patch("streams.load_products", wraps=streams.load_products) as load:
+            report = compare.diff(self.old, self.new)
+        assert load.call_count == 1
+        assert report["added"] == ["jammy 5"]
+        assert report["removed"] == []
+
+    def test_missing_metadata(self):
+        os.makedirs(os.path.join(self.old, ".data"))
+        with self.assertRaises(ValueError):
+            compare.diff(self.old, self.new)
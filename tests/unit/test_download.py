@@ -0,0 +1,146 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import hashlib
+import json
+import os
+import re
+import unittest
+from unittest.mock import patch
+
+from helpers import QuietHandler, serve, temp_dir
+
+import download
+
+BLOB = bytes(range(256)) * 64
+
+
+class BlobHandler(QuietHandler):
+    protocol_version = "HTTP/1.1"
+    ranges = True
+    fail_after = None
+    requests = []
+
+    def do_GET(self):  # noqa: N802
+        start, end = 0, len(BLOB)
+        header = self.headers.get("Range")
+        self.requests.append(header)
+        if header and self.ranges:
+            first, last = re.match(r"bytes=(\d+)-(\d*)", header).groups()
+            start, end = int(first), int(last) + 1 if last else len(BLOB)
+            self.send_response(206)
+            self.send_header("Content-Range", "bytes {}-{}/{}".format(start, end - 1, len(BLOB)))
+        else:
+            self.send_response(200)
+        body = BLOB[start:end]
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if BlobHandler.fail_after is not None:
+            # send part of the body, then drop the connection
+            self.wfile.write(body[: BlobHandler.fail_after])
+            BlobHandler.fail_after = None
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+class TestDownload(unittest.TestCase):
+    def setUp(self):
+        BlobHandler.ranges = True
+        BlobHandler.fail_after = None
+        BlobHandler.requests = []
+        self.url = serve(self, BlobHandler) + "/jammy/squashfs"
+        self.tmp = temp_dir(self)
+        self.dest = os.path.join(self.tmp, "latest", "jammy", "squashfs")
+        self.sha256 = hashlib.sha256(BLOB).hexdigest()
+        for name, value in (("CHUNK_SIZE", 1024), ("MIN_SEGMENT_SIZE", 4096)):
+            patcher = patch.object(download, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def read_dest(self):
+        with open(self.dest, "rb") as f:
+            return f.read()
+
+    def test_fetch(self):
+        assert download.fetch(self.url, self.dest, size=len(BLOB), sha256=self.sha256) == len(BLOB)
+        assert self.read_dest() == BLOB
+        assert BlobHandler.requests == [None]
+        assert os.listdir(os.path.dirname(self.dest)) == ["squashfs"]
+
+    def test_fetch_segments(self):
+        download.fetch(self.url, self.dest, size=len(BLOB), sha256=self.sha256, segments=4)
+        assert self.read_dest() == BLOB
+        assert sorted(BlobHandler.requests) == [
+            "bytes=0-4095",
+            "bytes=12288-16383",
+            "bytes=4096-8191",
+            "bytes=8192-12287",
+        ]
+
+    def test_resume_after_failure(self):
+        BlobHandler.fail_after = 5000
+        with self.assertRaises(download.DownloadError):
+            download.fetch(self.url, self.dest, size=len(BLOB), sha256=self.sha256)
+        with open(self.dest + ".partial.json") as f:
+            assert json.load(f)["segments"] == [[0, len(BLOB), 5000]]
+        assert not os.path.exists(self.dest)
+        fetched = download.fetch(self.url, self.dest, size=len(BLOB), sha256=self.sha256)
+        assert fetched == len(BLOB) - 5000
+        assert BlobHandler.requests[-1] == "bytes=5000-{}".format(len(BLOB) - 1)
+        assert self.read_dest() == BLOB
+        assert not os.path.exists(self.dest + ".partial")
+
+    def test_resume_from_other_mirror(self):
+        BlobHandler.fail_after = 5000
+        with self.assertRaises(download.DownloadError):
+            download.fetch(self.url, self.dest, size=len(BLOB), sha256=self.sha256)
+        other = "{}?mirror=2".format(self.url)
+        assert download.fetch(other, self.dest, size=len(BLOB), sha256=self.sha256) == (
+            len(BLOB) - 5000
+        )
+        assert self.read_dest() == BLOB
+
+    @patch("time.monotonic")
+    def test_too_slow(self, monotonic):
+        # every chunk appears to take a whole rate window
+        monotonic.side_effect = (n * download.RATE_WINDOW for n in range(1000))
+        with self.assertRaises(download.TooSlow):
+            download.fetch(self.url, self.dest, size=len(BLOB), min_rate=1024)
+        assert os.path.exists(self.dest + ".partial.json")
+        download.fetch(self.url, self.dest, size=len(BLOB), min_rate=1)
+        assert self.read_dest() == BLOB
+
+    @patch("time.monotonic")
+    def test_throttled_time_is_not_too_slow(self, monotonic):
+        monotonic.side_effect = (n * download.RATE_WINDOW for n in range(1000))
+        sizes = []
+
+        def throttle(size):
+            sizes.append(size)
+            # held back for the whole time the chunk appeared to take
+            return download.RATE_WINDOW
+
+        download.fetch(self.url, self.dest, size=len(BLOB), min_rate=1024, throttle=throttle)
+        assert self.read_dest() == BLOB
+        assert sum(sizes) == len(BLOB)
+
+    def test_range_not_supported(self):
+        BlobHandler.ranges = False
+        download.fetch(self.url, self.dest, size=len(BLOB), sha256=self.sha256, segments=4)
+        assert self.read_dest() == BLOB
+
+    def test_checksum_mismatch(self):
+        with self.assertRaises(download.ChecksumError):
+            download.fetch(self.url, self.dest, size=len(BLOB), sha256="0" * 64)
+        assert os.listdir(os.path.dirname(self.dest)) == []
+
+    def test_interrupted_keeps_partial_data(self):
+        with self.assertRaises(download.Interrupted):
+            download.fetch(self.url, self.dest, size=len(BLOB), stop=lambda: True)
+        assert os.path.exists(self.dest + ".partial")
+        assert os.path.exists(self.dest + ".partial.json")
+
+    def test_unknown_size(self):
+        download.fetch(self.url, self.dest)
+        assert self.read_dest() == BLOB
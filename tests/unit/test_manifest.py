@@ -0,0 +1,67 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import os
+import unittest
+
+from helpers import item, products, temp_dir, write_products
+
+import manifest
+
+PRODUCTS = products(
+    {
+        "jammy": {
+            "20240101": {
+                "items": {
+                    "squashfs": item("jammy/amd64/20240101/squashfs", 100, "a" * 64),
+                    "boot-kernel": item(
+                        "jammy/amd64/20240101/ga-22.04/generic/boot-kernel", 10, "b" * 64
+                    ),
+                }
+            }
+        }
+    }
+)
+
+
+class TestManifest(unittest.TestCase):
+    def setUp(self):
+        self.root = temp_dir(self)
+        for name in ("stable", "stable-copy"):
+            write_products(self.root, PRODUCTS, name)
+
+    def test_build(self):
+        built = manifest.build(os.path.join(self.root, ".data"), created=5)
+        assert built["created"] == 5
+        assert built["items"] == 2
+        assert built["bytes"] == 110
+        product = built["products"]["jammy"]
+        assert product["20240101"]["squashfs"] == {
+            "path": "jammy/amd64/20240101/squashfs",
+            "size": 100,
+            "sha256": "a" * 64,
+        }
+
+    def test_update_and_load(self):
+        assert manifest.load(self.root) == {}
+        written = manifest.update(self.root, created=5)
+        assert manifest.load(self.root) == written
+        assert manifest.summary(written) == {"items": 2, "bytes": 110, "created": 5}
+
+    def test_load_summary(self):
+        assert manifest.load_summary(self.root) == {}
+        manifest.update(self.root, created=5)
+        os.remove(manifest.path_of(self.root))
+        # the totals are read without the per-item manifest
+        assert manifest.load_summary(self.root) == {"items": 2, "bytes": 110, "created": 5}
+
+    def test_load_summary_of_older_tree(self):
+        written = manifest.update(self.root, created=5)
+        os.remove(os.path.join(self.root, manifest.SUMMARY_FILE))
+        assert manifest.load_summary(self.root) == manifest.summary(written)
+        assert os.path.exists(os.path.join(self.root, manifest.SUMMARY_FILE))
+
+    def test_load_invalid(self):
+        with open(manifest.path_of(self.root), "w") as f:
+            f.write("[]")
+        assert manifest.load(self.root) == {}
@@ -0,0 +1,87 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import os
+import unittest
+from unittest.mock import patch
+
+from helpers import item, products, temp_dir, write_products
+
+import metrics
+import streams
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.tmp = temp_dir(self)
+        self.target = os.path.join(self.tmp, "latest")
+        self.state_dir = os.path.join(self.tmp, "state")
+        self.textfile_dir = os.path.join(self.tmp, "node-exporter")
+        os.makedirs(os.path.join(self.target, ".data"))
+        os.makedirs(self.textfile_dir)
+
+    def write_products(self, *items):
+        versions = {"1": {"items": {path: item(path, size) for path, size in items}}}
+        write_products(self.target, products({"jammy": versions}))
+
+    def test_item_sizes(self):
+        self.write_products(("jammy/squashfs", 100))
+        assert metrics.item_sizes(self.target, "release~jammy") == {"jammy/squashfs": 100}
+        assert metrics.item_sizes(self.target, "release=focal") == {}
+        assert metrics.item_sizes(self.target, "bogus") == {}
+
+    def test_selector_sizes(self):
+        self.write_products(("jammy/squashfs", 100), ("jammy/kernel", 10))
+        with patch("streams.iter_items", wraps=streams.iter_items) as iter_items:
+            sizes = metrics.selector_sizes(self.target, ["release~jammy", "path~kernel"])
+        assert iter_items.call_count == 1
+        assert sizes == {
+            "release~jammy": {"jammy/squashfs": 100, "jammy/kernel": 10},
+            "path~kernel": {"jammy/kernel": 10},
+        }
+
+    def test_selector_metrics(self):
+        values = metrics.selector_metrics(
+            {"a": 10, "b": 20}, {"a": 10, "b": 25, "c": 75}, 2.0, success=True
+        )
+        assert values["bytes-downloaded"] == 100
+        assert values["files-fetched"] == 2
+        assert values["files-skipped"] == 1
+        assert values["throughput-bytes-per-second"] == 50
+        assert values["success"] == 1
+
+    def test_record_and_render(self):
+        metrics.record(self.state_dir, {"a": {"success": 1}})
+        records = metrics.record(self.state_dir, {'b"c': {"success": 0, "files-fetched": 3}})
+        assert records == {"a": {"success": 1}, 'b"c': {"success": 0, "files-fetched": 3}}
+        path = metrics.write_textfile(self.textfile_dir, "mirror", records)
+        with open(path) as f:
+            text = f.read()
+        assert path.endswith("simple-streams-mirror.prom")
+        assert 'simplestreams_sync_success{app="mirror",selector="a"} 1\n' in text
+        assert 'simplestreams_sync_files_fetched{app="mirror",selector="b\\"c"} 3\n' in text
+        assert "# TYPE simplestreams_sync_duration_seconds gauge\n" in text
+
+    def test_record_hook(self):
+        metrics.record_hook(self.state_dir, "hooks/update-status", 0.5)
+        records = metrics.record_hook(self.state_dir, "hooks/update-status", 0.25)
+        record = records["hooks/update-status"]
+        assert record["duration-seconds"] == 0.25
+        assert record["total-seconds"] == 0.75
+        assert record["count"] == 2
+        assert not os.path.exists(os.path.join(self.state_dir, metrics.METRICS_FILE))
+        path = metrics.write_textfile(self.textfile_dir, "mirror", records, name="hooks")
+        assert path.endswith("simple-streams-mirror-hooks.prom")
+        with open(path) as f:
+            text = f.read()
+        assert (
+            'simplestreams_sync_hook_runs_total{app="mirror",hook="hooks/update-status"} 2\n'
+            in text
+        )
+        assert "# TYPE simplestreams_sync_hook_runs_total counter\n" in text
+        assert "# TYPE simplestreams_sync_hook_duration_seconds_total counter\n" in text
+        assert "# TYPE simplestreams_sync_hook_duration_seconds gauge\n" in text
+
+    def test_write_textfile_without_collector(self):
+        assert metrics.write_textfile(os.path.join(self.tmp, "missing"), "x", {}) is None
+        assert metrics.write_textfile("", "x", {}) is None
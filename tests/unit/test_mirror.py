@@ -0,0 +1,235 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock, call, patch
+
+import download
+import mirror
+
+
+def products_set(tree, data, pedigree):
+    product, version, item = pedigree
+    versions = tree["products"].setdefault(product, {"versions": {}})["versions"]
+    versions.setdefault(version, {"items": {}})["items"][item] = data
+
+
+class FakeObjectFilterMirror:
+    def __init__(self, config=None, objectstore=None):
+        self.config = config
+        self.store = objectstore
+        self.references = {}
+
+    def insert_item(self, data, src, target, pedigree, contentsource):
+        products_set(target, data, pedigree)
+        self.store.insert(data["path"], contentsource)
+        self._inc_rc(data["path"], src, pedigree)
+
+    def _inc_rc(self, path, src, pedigree):
+        self.references.setdefault(path, []).append(pedigree)
+
+    def sync(self, reader, path):
+        # Offer every item of the fake tree and write the products of the
+        # items inserted, as ObjectStoreMirrorWriter does.
+        target = {"products": {}}
+        for pedigree, item in reader.items:
+            if self.filter_item(item, None, target, pedigree):
+                self.insert_item(item, None, target, pedigree, None)
+        self.insert_products(path, target, None)
+
+    def insert_products(self, path, target, content):
+        self.store.insert_content(".data/products", json.dumps(target))
+
+
+class TestMirror(unittest.TestCase):
+    def setUp(self):
+        self.simplestreams = MagicMock()
+        self.simplestreams.mirrors.ObjectFilterMirror = FakeObjectFilterMirror
+        self.simplestreams.util.path_from_mirror_url.return_value = (
+            "http://mirror/",
+            "streams/v1/index.sjson",
+        )
+        self.simplestreams.filters.get_filters.side_effect = lambda args: args
+        self.simplestreams.util.products_set.side_effect = products_set
+        # an item matches a selector when every selector term is in its path
+        self.simplestreams.filters.filter_item.side_effect = (
+            lambda terms, data, src, pedigree: all(t in data["path"] for t in terms)
+        )
+        reader = self.simplestreams.mirrors.UrlMirrorReader.return_value
+        self.items = {
+            "p1": {"path": "jammy/amd64/squashfs", "size": 100},
+            "p2": {"path": "grub/amd64/grub.efi", "size": "10"},
+            "p3": {"path": "focal/amd64/squashfs", "size": 100},
+        }
+        reader.items = [
+            (("p1", "v1", "squashfs"), self.items["p1"]),
+            (("p2", "v1", "grub"), self.items["p2"]),
+            (("p3", "v1", "squashfs"), self.items["p3"]),
+        ]
+        patcher = patch.dict(
+            sys.modules,
+            {
+                "simplestreams": self.simplestreams,
+                "simplestreams.filters": self.simplestreams.filters,
+                "simplestreams.mirrors": self.simplestreams.mirrors,
+                "simplestreams.objectstores": self.simplestreams.objectstores,
+                "simplestreams.util": self.simplestreams.util,
+            },
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        fetch = patch("download.fetch")
+        self.download_fetch = fetch.start()
+        self.addCleanup(fetch.stop)
+
+    def test_sync_union_of_selectors(self):
+        summary = mirror.sync(
+            "http://mirror/", "/srv/latest", ["jammy amd64", "grub"], keyring="/k.gpg", max_items=2
+        )
+        assert summary == {
+            "items": 2,
+            "bytes": 110,
+            "selectors": [
+                {"matched": 1, "fetched": 1, "bytes": 100},
+                {"matched": 1, "fetched": 1, "bytes": 10},
+            ],
+        }
+        assert self.download_fetch.call_args_list == [
+            call(
+                "http://mirror/jammy/amd64/squashfs",
+                "/srv/latest/jammy/amd64/squashfs",
+                size=100,
+                sha256=None,
+                segments=1,
+                stop=None,
+                min_rate=0,
+                throttle=None,
+            ),
+            call(
+                "http://mirror/grub/amd64/grub.efi",
+                "/srv/latest/grub/amd64/grub.efi",
+                size=10,
+                sha256=None,
+                segments=1,
+                stop=None,
+                min_rate=0,
+                throttle=None,
+            ),
+        ]
+        self.simplestreams.objectstores.FileStore.assert_called_once_with("/srv/latest")
+        # metadata is fetched through a single reader for all selectors
+        self.simplestreams.mirrors.UrlMirrorReader.assert_called_once()
+
+    def test_sync_writes_downloaded_items_to_products(self):
+        mirror.sync("http://mirror/", "/srv/latest", ["jammy amd64", "grub"])
+        store = self.simplestreams.objectstores.FileStore.return_value
+        # items come from the downloader, not the object store
+        self.assertFalse(store.insert.called)
+        path, content = store.insert_content.call_args[0]
+        assert json.loads(content)["products"] == {
+            "p1": {"versions": {"v1": {"items": {"squashfs": self.items["p1"]}}}},
+            "p2": {"versions": {"v1": {"items": {"grub": self.items["p2"]}}}},
+        }
+
+    def test_sync_concurrent_downloads(self):
+        both_started = threading.Barrier(2, timeout=5)
+        store = self.simplestreams.objectstores.FileStore.return_value
+        done = []
+
+        def fetch(url, dest, **kwargs):
+            both_started.wait()
+            self.assertFalse(store.insert_content.called)
+            done.append(url)
+
+        self.download_fetch.side_effect = fetch
+        progress = MagicMock()
+        summary = mirror.sync(
+            "http://mirror/", "/srv/latest", ["squashfs"], progress=progress, workers=2
+        )
+        assert summary["items"] == 2
+        assert sorted(done) == [
+            "http://mirror/focal/amd64/squashfs",
+            "http://mirror/jammy/amd64/squashfs",
+        ]
+        assert sorted(c[0] for c in progress.call_args_list) == [
+            ("focal/amd64/squashfs", 100),
+            ("jammy/amd64/squashfs", 100),
+        ]
+        # the products are written once, after every download finished
+        assert store.insert_content.call_count == 1
+
+    def test_sync_concurrent_download_fails(self):
+        self.download_fetch.side_effect = download.DownloadError("unreachable")
+        with self.assertRaises(download.DownloadError):
+            mirror.sync("http://mirror/", "/srv/latest", ["amd64"], workers=2)
+        store = self.simplestreams.objectstores.FileStore.return_value
+        self.assertFalse(store.insert_content.called)
+
+    def test_sync_fails_over_to_mirrors(self):
+        def fetch(url, dest, **kwargs):
+            if url.startswith("http://mirror/"):
+                raise download.TooSlow("too slow")
+
+        self.download_fetch.side_effect = fetch
+        mirror.sync(
+            "http://mirror/",
+            "/srv/latest",
+            ["grub"],
+            fallbacks=["/srv/local", "http://other/"],
+            min_rate=1024,
+        )
+        assert [c[0][0] for c in self.download_fetch.call_args_list] == [
+            "http://mirror/grub/amd64/grub.efi",
+            "http://other/grub/amd64/grub.efi",
+        ]
+        assert [c[1]["min_rate"] for c in self.download_fetch.call_args_list] == [1024, 0]
+        self.download_fetch.side_effect = download.DownloadError("unreachable")
+        with self.assertRaises(download.DownloadError):
+            mirror.sync("http://mirror/", "/srv/latest", ["grub"], fallbacks=["http://other/"])
+
+    def test_sync_slow_single_mirror(self):
+        # with no other mirror to fail over to, a slow download carries on
+        mirror.sync("http://mirror/", "/srv/latest", ["grub"], min_rate=1024)
+        assert self.download_fetch.call_args[1]["min_rate"] == 0
+
+    def test_sync_verifies_signed_metadata(self):
+        mirror.sync("http://mirror/", "/srv/latest", ["grub"], keyring="/k.gpg")
+        policy = self.simplestreams.mirrors.UrlMirrorReader.call_args[1]["policy"]
+        policy("content", "streams/v1/index.sjson")
+        self.simplestreams.util.read_signed.assert_called_once_with(
+            "content", keyring="/k.gpg", checked=True
+        )
+
+    def test_sync_unsigned_metadata(self):
+        self.simplestreams.util.path_from_mirror_url.return_value = (
+            "http://mirror/",
+            "streams/v1/index.json",
+        )
+        mirror.sync("http://mirror/", "/srv/latest", ["grub"])
+        policy = self.simplestreams.mirrors.UrlMirrorReader.call_args[1]["policy"]
+        assert policy("content", "streams/v1/index.json") == "content"
+        self.assertFalse(self.simplestreams.util.read_signed.called)
+
+    def test_sync_local_mirror_uses_object_store(self):
+        self.simplestreams.util.path_from_mirror_url.return_value = (
+            "/srv/upstream/",
+            "streams/v1/index.json",
+        )
+        mirror.sync("/srv/upstream/", "/srv/latest", ["grub"])
+        store = self.simplestreams.objectstores.FileStore.return_value
+        assert store.insert.call_args_list == [call("grub/amd64/grub.efi", None)]
+        self.assertFalse(self.download_fetch.called)
+
+    def test_sync_skips_items_already_in_place(self):
+        with tempfile.TemporaryDirectory() as target:
+            os.makedirs(os.path.join(target, "grub/amd64"))
+            with open(os.path.join(target, "grub/amd64/grub.efi"), "wb") as f:
+                f.write(b"0" * 10)
+            summary = mirror.sync("http://mirror/", target, ["grub"], segments=4)
+        self.assertFalse(self.download_fetch.called)
+        assert summary["items"] == 1
@@ -0,0 +1,36 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import unittest
+
+import peers
+
+
+class TestPeers(unittest.TestCase):
+    def setUp(self):
+        self.selectors = ["arch=amd64 release={}".format(n) for n in range(50)]
+        self.units = ["simple-streams/0", "simple-streams/1", "simple-streams/2"]
+
+    def test_owner_is_stable(self):
+        owners = [peers.owner(s, self.units) for s in self.selectors]
+        assert owners == [peers.owner(s, list(reversed(self.units))) for s in self.selectors]
+        assert set(owners) == set(self.units)
+
+    def test_departing_unit_moves_only_its_shard(self):
+        remaining = self.units[:2]
+        for selector in self.selectors:
+            before = peers.owner(selector, self.units)
+            if before in remaining:
+                assert peers.owner(selector, remaining) == before
+
+    def test_source_for(self):
+        config = {"image-source": "http://upstream/", "unit": "simple-streams/0"}
+        assert peers.source_for(config, "arch=amd64") == ("http://upstream/", None)
+        config["peers"] = {unit: "http://{}/latest".format(unit[-1]) for unit in self.units}
+        for selector in self.selectors:
+            owner = peers.owner(selector, self.units)
+            source, source_owner = peers.source_for(config, selector)
+            if owner == "simple-streams/0":
+                assert (source, source_owner) == ("http://upstream/", None)
+            else:
+                assert (source, source_owner) == (config["peers"][owner], owner)
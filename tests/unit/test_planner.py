@@ -0,0 +1,92 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import json
+import os
+import unittest
+from unittest.mock import patch
+
+from helpers import QuietHandler, products, serve, temp_dir, write, write_products
+
+import metrics
+import planner
+import state
+import streams
+
+PRODUCTS = products({"jammy": ["1", "2", "3"], "noble": ["1"]})
+INDEX = {
+    "format": "index:1.0",
+    "index": {PRODUCTS["content_id"]: {"path": "streams/v1/stable.json"}},
+}
+
+
+class StreamHandler(QuietHandler):
+    documents = {
+        "/streams/v1/index.json": INDEX,
+        "/streams/v1/stable.json": PRODUCTS,
+    }
+
+    def do_GET(self):  # noqa: N802
+        if self.path not in self.documents:
+            self.send_error(404)
+            return
+        self.send_body(json.dumps(self.documents[self.path]).encode())
+
+
+class TestPlanner(unittest.TestCase):
+    def setUp(self):
+        self.state_dir = temp_dir(self)
+        self.target = os.path.join(self.state_dir, "latest")
+        self.config = {
+            "image-source": serve(self, StreamHandler) + "/",
+            "path": "streams/v1/index.json",
+            "keyring-file": "",
+            "image-selectors": "release=jammy\nrelease~(jammy|noble)",
+            "image-max": 2,
+            "keep": True,
+            "target": self.target,
+        }
+
+    def test_select(self):
+        items = list(streams.items_of(PRODUCTS))
+        assert sorted(i["path"] for i in streams.select(items, "release=jammy", 2)) == [
+            "jammy/amd64/2/squashfs",
+            "jammy/amd64/3/squashfs",
+        ]
+        assert len(streams.select(items, "arch=amd64")) == 4
+
+    def test_plan(self):
+        write(os.path.join(self.target, "jammy/amd64/3/squashfs"), "x" * 100)
+        plan = planner.plan(self.config)
+        jammy, both = plan["selectors"]
+        assert jammy["items"] == 2
+        assert jammy["add"] == ["jammy/amd64/2/squashfs"]
+        assert jammy["add-bytes"] == 100
+        assert both["add"] == ["jammy/amd64/2/squashfs", "noble/amd64/1/squashfs"]
+        # items shared between selectors are only transferred once
+        assert plan["add"] == 2
+        assert plan["add-bytes"] == 200
+        assert plan["prune"] == 0
+        assert plan["eta-seconds"] is None
+
+    def test_plan_prune_and_eta(self):
+        write_products(self.target, PRODUCTS)
+        state.write_json(
+            os.path.join(self.state_dir, metrics.METRICS_FILE),
+            {"release=jammy": {"throughput-bytes-per-second": 50}},
+        )
+        self.config.update({"keep": False, "image-selectors": "release=jammy"})
+        plan = planner.plan(self.config, self.state_dir)
+        assert plan["selectors"][0]["prune"] == ["jammy/amd64/1/squashfs"]
+        assert plan["prune-bytes"] == 100
+        assert plan["add"] == 2
+        assert plan["eta-seconds"] == 4
+
+    @patch("sources.signature_ok")
+    def test_bad_signature(self, signature_ok):
+        signature_ok.return_value = False
+        self.config.update({"keyring-file": "/k.gpg", "path": ""})
+        StreamHandler.documents["/streams/v1/index.sjson"] = INDEX
+        self.addCleanup(StreamHandler.documents.pop, "/streams/v1/index.sjson")
+        with self.assertRaises(ValueError):
+            planner.plan(self.config)
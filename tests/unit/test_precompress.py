@@ -0,0 +1,99 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import precompress
+
+
+class TestPrecompress(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.root = self.tmp.name
+        self.index = os.path.join(self.root, "streams", "v1", "index.sjson")
+        # simplestreams names the products files of .data after their content id
+        self.products = os.path.join(self.root, ".data", "com.ubuntu.maas:stable:v3:download")
+        self.write(self.index, '{"index": {}}')
+        self.write(self.products, '{"products": {}}' * 100)
+        self.write(os.path.join(self.root, "jammy", "squashfs"), "not metadata")
+
+    def write(self, path, content):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+
+    def checksums(self):
+        with open(os.path.join(self.root, precompress.CHECKSUMS_FILE)) as f:
+            return json.load(f)
+
+    def test_compress_tree(self):
+        summary = precompress.compress_tree(self.root)
+        assert summary["files"] == 2
+        assert summary["compressed"] == 2
+        assert summary["bytes-out"] < summary["bytes-in"]
+        with gzip.open(self.products + ".gz", "rt") as f:
+            assert f.read() == '{"products": {}}' * 100
+        assert sorted(self.checksums()["files"]) == [
+            ".data/com.ubuntu.maas:stable:v3:download",
+            "streams/v1/index.sjson",
+        ]
+        assert not os.path.exists(os.path.join(self.root, "jammy", "squashfs.gz"))
+        assert os.stat(self.index + ".gz").st_mtime_ns == os.stat(self.index).st_mtime_ns
+        entry = self.checksums()["files"]["streams/v1/index.sjson"]
+        with open(self.index + ".gz", "rb") as f:
+            assert entry["gzip"] == hashlib.sha256(f.read()).hexdigest()
+        assert entry["identity"] == hashlib.sha256(b'{"index": {}}').hexdigest()
+
+    def test_only_changed_files_are_recompressed(self):
+        precompress.compress_tree(self.root)
+        assert precompress.compress_tree(self.root)["compressed"] == 0
+        self.write(self.index, '{"index": {"new": {}}}')
+        os.utime(self.index, ns=(0, 10**9))
+        assert precompress.compress_tree(self.root)["compressed"] == 1
+        with gzip.open(self.index + ".gz", "rt") as f:
+            assert f.read() == '{"index": {"new": {}}}'
+
+    def test_snapshot_shares_copies(self):
+        precompress.compress_tree(self.root)
+        snapshot = os.path.join(self.tmp.name, "snapshot")
+        # a snapshot hardlinks the unchanged metadata and copies of latest
+        for rel_path in precompress.metadata_files(self.root):
+            for suffix in ("", ".gz"):
+                os.makedirs(os.path.dirname(os.path.join(snapshot, rel_path)), exist_ok=True)
+                os.link(
+                    os.path.join(self.root, rel_path + suffix),
+                    os.path.join(snapshot, rel_path + suffix),
+                )
+        summary = precompress.compress_tree(snapshot, source=self.root)
+        assert summary["compressed"] == 0
+        assert os.path.samefile(
+            self.index + ".gz", os.path.join(snapshot, "streams/v1/index.sjson.gz")
+        )
+        # without the checksums of latest, copies with the mtime of their original are current
+        os.unlink(os.path.join(snapshot, precompress.CHECKSUMS_FILE))
+        assert precompress.compress_tree(snapshot)["compressed"] == 0
+        with open(os.path.join(snapshot, precompress.CHECKSUMS_FILE)) as f:
+            assert json.load(f) == self.checksums()
+
+    def test_stale_copies_are_removed(self):
+        precompress.compress_tree(self.root)
+        os.unlink(self.products)
+        precompress.compress_tree(self.root)
+        assert not os.path.exists(self.products + ".gz")
+        assert list(self.checksums()["files"]) == ["streams/v1/index.sjson"]
+        precompress.compress_tree(self.root, encodings=[])
+        assert not os.path.exists(self.index + ".gz")
+
+    def test_available(self):
+        with patch("shutil.which", return_value="/usr/bin/zstd"):
+            assert precompress.available("gzip zstd brotli") == ["gzip", "zstd"]
+        with patch("shutil.which", return_value=None):
+            assert precompress.available("zstd gzip") == ["gzip"]
+        assert precompress.available("") == []
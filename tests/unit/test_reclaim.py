@@ -0,0 +1,104 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import os
+import unittest
+
+from helpers import item, products, temp_dir, write, write_products
+
+import reclaim
+import snapshots
+
+
+def metadata(*paths):
+    items = {
+        os.path.basename(path): item(path, 4, "{:064x}".format(i)) for i, path in enumerate(paths)
+    }
+    return products({"jammy": {"1": {"items": items}}})
+
+
+class TestReclaim(unittest.TestCase):
+    def setUp(self):
+        self.image_dir = temp_dir(self)
+        self.latest = os.path.join(self.image_dir, "latest")
+        for name in ("old", "new", "dropped"):
+            write(os.path.join(self.latest, "jammy", name), "data")
+        write(os.path.join(self.latest, "jammy", "next.partial"), "da")
+        write(os.path.join(self.latest, "streams", "v1", "index.sjson"), "{}")
+        self.write_metadata(self.latest, "jammy/new")
+
+    def write_metadata(self, root, *paths):
+        return write_products(root, metadata(*paths))
+
+    def snapshot(self, name, *paths):
+        root = os.path.join(self.image_dir, name)
+        os.makedirs(root)
+        os.symlink(os.path.join(self.latest, "jammy"), os.path.join(root, "jammy"))
+        self.write_metadata(root, *paths)
+        return root
+
+    def test_referenced_by_snapshot(self):
+        self.snapshot("snapshot-20260101000000", "jammy/old")
+        planned = reclaim.plan(self.image_dir)
+        assert planned["snapshots"] == []
+        assert planned["files"] == [os.path.join(self.latest, "jammy", "dropped")]
+        assert planned["bytes"] == 4
+
+    def test_retention(self):
+        self.snapshot("snapshot-20260101000000", "jammy/old")
+        self.snapshot("snapshot-20260201000000", "jammy/new")
+        self.snapshot("snapshot-20260301000000", "jammy/new")
+        os.symlink(
+            os.path.join(self.image_dir, "snapshot-20260101000000"),
+            os.path.join(self.image_dir, "publish"),
+        )
+        assert reclaim.expired_snapshots(self.image_dir, keep_count=1) == [
+            "snapshot-20260201000000"
+        ]
+        os.unlink(os.path.join(self.image_dir, "publish"))
+        now = reclaim.snapshot_time(os.path.join(self.image_dir, "snapshot-20260301000000"))
+        assert reclaim.expired_snapshots(self.image_dir, keep_count=1, keep_days=40, now=now) == [
+            "snapshot-20260101000000"
+        ]
+        assert reclaim.expired_snapshots(self.image_dir) == []
+
+    def test_collect(self):
+        old = self.snapshot("snapshot-20260101000000", "jammy/old")
+        self.snapshot("snapshot-20260201000000", "jammy/new")
+        metadata_size = os.path.getsize(self.write_metadata(old, "jammy/old"))
+        dry_run = reclaim.collect(self.image_dir, keep_count=1, dry_run=True)
+        assert dry_run == {
+            "snapshots-deleted": 1,
+            "files-deleted": 2,
+            "objects-deleted": 0,
+            "bytes-freed": 8 + metadata_size,
+            "dry-run": True,
+            "snapshots": ["snapshot-20260101000000"],
+        }
+        assert os.path.exists(os.path.join(self.latest, "jammy", "old"))
+        assert reclaim.collect(self.image_dir, keep_count=1) == dict(dry_run, **{"dry-run": False})
+        assert sorted(os.listdir(os.path.join(self.latest, "jammy"))) == ["new", "next.partial"]
+        assert os.path.exists(os.path.join(self.latest, "streams", "v1", "index.sjson"))
+        assert not os.path.exists(os.path.join(self.image_dir, "snapshot-20260101000000"))
+
+    def test_store_objects(self):
+        store = os.path.join(self.image_dir, snapshots.STORE_DIR)
+        new = os.path.join(self.latest, "jammy", "new")
+        kept, dropped = (
+            snapshots.object_path(store, digest) for digest in ("{:064x}".format(0), "f" * 64)
+        )
+        for obj in (kept, dropped):
+            os.makedirs(os.path.dirname(obj))
+            os.link(new, obj)
+        planned = reclaim.plan(self.image_dir)
+        assert planned["objects"] == [dropped]
+        # the object shares its inode with latest/jammy/new, which is kept
+        assert planned["bytes"] == 8
+        reclaim.collect(self.image_dir)
+        assert os.path.exists(kept)
+        assert not os.path.exists(os.path.dirname(dropped))
+
+    def test_missing_metadata(self):
+        os.makedirs(os.path.join(self.image_dir, "snapshot-20260101000000"))
+        with self.assertRaises(ValueError):
+            reclaim.plan(self.image_dir)
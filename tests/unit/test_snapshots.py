@@ -0,0 +1,130 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import hashlib
+import os
+import unittest
+from unittest.mock import patch
+
+from helpers import temp_dir, write
+
+import snapshots
+
+SQUASHFS_SHA256 = hashlib.sha256(b"squashfs").hexdigest()
+
+
+class TestDedupCopytree(unittest.TestCase):
+    def setUp(self):
+        self.tmp = temp_dir(self)
+        self.latest = os.path.join(self.tmp, "latest")
+        self.store = os.path.join(self.tmp, snapshots.STORE_DIR)
+        write(os.path.join(self.latest, "jammy/amd64/1/squashfs"), "squashfs")
+        write(os.path.join(self.latest, "jammy/amd64/1/unknown"), "unknown")
+        os.symlink("1", os.path.join(self.latest, "jammy/amd64/current"))
+        self.digests = {"jammy/amd64/1/squashfs": SQUASHFS_SHA256}
+
+    def snapshot(self, name):
+        root = os.path.join(self.tmp, name)
+        os.makedirs(root)
+        counts = snapshots.dedup_copytree(self.latest, root, "jammy", self.digests, self.store)
+        return root, counts
+
+    def test_files_are_stored_once(self):
+        first, counts = self.snapshot("snapshot-1")
+        second, _ = self.snapshot("snapshot-2")
+        assert counts["copy"] == 1
+        assert counts["reflink"] + counts["hardlink"] == 1
+        obj = snapshots.object_path(self.store, SQUASHFS_SHA256)
+        assert os.listdir(os.path.dirname(obj)) == [SQUASHFS_SHA256]
+        for root in (first, second):
+            with open(os.path.join(root, "jammy/amd64/1/squashfs")) as f:
+                assert f.read() == "squashfs"
+            with open(os.path.join(root, "jammy/amd64/1/unknown")) as f:
+                assert f.read() == "unknown"
+            assert os.readlink(os.path.join(root, "jammy/amd64/current")) == "1"
+        if counts["hardlink"]:
+            assert os.stat(obj).st_nlink == 4
+
+    def test_corrupt_files_are_not_stored(self):
+        write(os.path.join(self.latest, "jammy/amd64/1/squashfs"), "squash")
+        root, counts = self.snapshot("snapshot-1")
+        assert counts["copy"] == 2
+        assert not os.path.exists(snapshots.object_path(self.store, SQUASHFS_SHA256))
+        assert (
+            os.listdir(os.path.dirname(snapshots.object_path(self.store, SQUASHFS_SHA256))) == []
+        )
+        with open(os.path.join(root, "jammy/amd64/1/squashfs")) as f:
+            assert f.read() == "squash"
+
+    @patch("snapshots.reflink")
+    def test_falls_back_to_hardlink(self, reflink):
+        reflink.side_effect = OSError(95, "Operation not supported")
+        root, counts = self.snapshot("snapshot-1")
+        assert counts == {"reflink": 0, "hardlink": 1, "copy": 1}
+        assert os.path.samefile(
+            os.path.join(root, "jammy/amd64/1/squashfs"),
+            os.path.join(self.latest, "jammy/amd64/1/squashfs"),
+        )
+
+    @patch("os.link")
+    @patch("snapshots.reflink")
+    def test_falls_back_to_copy(self, reflink, os_link):
+        reflink.side_effect = OSError(95, "Operation not supported")
+        os_link.side_effect = OSError(18, "Invalid cross-device link")
+        root, counts = self.snapshot("snapshot-1")
+        assert counts == {"reflink": 0, "hardlink": 0, "copy": 2}
+        with open(os.path.join(root, "jammy/amd64/1/squashfs")) as f:
+            assert f.read() == "squashfs"
+
+
+class TestIncrementalCopytree(unittest.TestCase):
+    def setUp(self):
+        self.tmp = temp_dir(self)
+        self.image_dir = self.tmp
+        self.data = os.path.join(self.image_dir, "latest", ".data")
+        write(os.path.join(self.data, "products-a"), "a" * 10)
+        write(os.path.join(self.data, "sub", "products-b"), "b" * 20)
+
+    def snapshot(self, name):
+        previous = snapshots.previous_snapshot(self.image_dir, name)
+        return snapshots.incremental_copytree(
+            self.data,
+            os.path.join(self.image_dir, name, ".data"),
+            os.path.join(previous, ".data") if previous else None,
+        )
+
+    def test_first_snapshot_copies_everything(self):
+        assert snapshots.previous_snapshot(self.image_dir) is None
+        assert self.snapshot("snapshot-1") == {
+            "files": 2,
+            "files-changed": 2,
+            "bytes-changed": 30,
+            "files-linked": 0,
+        }
+
+    def test_only_changed_files_are_copied(self):
+        self.snapshot("snapshot-1")
+        write(os.path.join(self.data, "products-a"), "A" * 12)
+        assert self.snapshot("snapshot-2") == {
+            "files": 2,
+            "files-changed": 1,
+            "bytes-changed": 12,
+            "files-linked": 1,
+        }
+        assert os.path.samefile(
+            os.path.join(self.image_dir, "snapshot-1/.data/sub/products-b"),
+            os.path.join(self.image_dir, "snapshot-2/.data/sub/products-b"),
+        )
+        with open(os.path.join(self.image_dir, "snapshot-2/.data/products-a")) as f:
+            assert f.read() == "A" * 12
+        # the next snapshot compares against the most recent one
+        assert self.snapshot("snapshot-3")["files-linked"] == 2
+
+    def test_previous_snapshot_ignores_links(self):
+        os.makedirs(os.path.join(self.image_dir, "snapshot-1"))
+        os.symlink(
+            os.path.join(self.image_dir, "latest"), os.path.join(self.image_dir, "snapshot-2")
+        )
+        assert snapshots.previous_snapshot(self.image_dir) == os.path.join(
+            self.image_dir, "snapshot-1"
+        )
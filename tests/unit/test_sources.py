@@ -0,0 +1,61 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import unittest
+from unittest.mock import Mock, patch
+
+from helpers import QuietHandler, serve
+
+import sources
+
+
+class IndexHandler(QuietHandler):
+    body = b"-----BEGIN PGP SIGNED MESSAGE-----\n{}"
+
+    def do_GET(self):  # noqa: N802
+        if not self.path.startswith("/good/"):
+            self.send_error(404)
+            return
+        self.send_body(self.body)
+
+
+class TestSources(unittest.TestCase):
+    def setUp(self):
+        self.base = serve(self, IndexHandler)
+
+    def test_parse(self):
+        assert sources.parse("http://a/ \n http://b/") == ["http://a/", "http://b/"]
+        assert sources.parse(None) == []
+
+    @patch("subprocess.run")
+    def test_probe(self, run):
+        run.return_value = Mock(returncode=0)
+        result = sources.probe(self.base + "/good/", keyring="/k.gpg")
+        assert result["error"] is None
+        assert result["verified"] is True
+        assert result["latency"] is not None
+        assert result["throughput"] > 0
+        assert run.call_args[0][0][:3] == ["gpgv", "--keyring", "/k.gpg"]
+        run.return_value = Mock(returncode=1)
+        assert sources.probe(self.base + "/good/", keyring="/k.gpg")["error"] == "bad signature"
+        run.side_effect = FileNotFoundError("gpgv")
+        assert sources.probe(self.base + "/good/", keyring="/k.gpg")["error"] is None
+        result = sources.probe(self.base + "/missing/")
+        assert result["latency"] is None
+        assert "404" in result["error"]
+
+    @patch("sources.probe")
+    def test_rank(self, probe):
+        results = {
+            "http://slow/": {"latency": 0.1, "throughput": 10, "error": None},
+            "http://fast/": {"latency": 0.2, "throughput": 100, "error": None},
+            "http://down/": {"latency": None, "throughput": 0, "error": "timed out"},
+            "http://forged/": {"latency": 0.1, "throughput": 1000, "error": "bad signature"},
+        }
+        probe.side_effect = lambda source, path, keyring: dict(results[source], source=source)
+        ranked, probes = sources.rank(list(results), keyring="/k.gpg")
+        assert ranked == ["http://fast/", "http://slow/", "http://down/"]
+        assert len(probes) == 4
+        probe.reset_mock()
+        assert sources.rank(["http://only/"]) == (["http://only/"], [])
+        self.assertFalse(probe.called)
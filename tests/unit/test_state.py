@@ -0,0 +1,46 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import os
+import tempfile
+import unittest
+
+import state
+
+
+class TestState(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, "status.json")
+
+    def test_write_and_read_json(self):
+        assert state.read_json(self.path) == {}
+        state.write_json(self.path, {"phase": "done"})
+        assert state.read_json(self.path) == {"phase": "done"}
+        assert os.listdir(self.tmp.name) == ["status.json"]
+
+    def test_write_compact_json(self):
+        assert state.write_json(self.path, {"a": [1, 2]}, indent=None) == 11
+        with open(self.path) as f:
+            assert f.read() == '{"a":[1,2]}'
+
+    def test_read_invalid_json(self):
+        with open(self.path, "w") as f:
+            f.write("{")
+        assert state.read_json(self.path) == {}
+        with open(self.path, "w") as f:
+            f.write("[]")
+        assert state.read_json(self.path) == {}
+
+    def test_update_json(self):
+        path = os.path.join(self.tmp.name, "state", "metrics.json")
+        assert state.update_json(path, lambda data: dict(data, a=1)) == {"a": 1}
+        assert state.update_json(path, lambda data: dict(data, b=2)) == {"a": 1, "b": 2}
+        assert state.read_json(path) == {"a": 1, "b": 2}
+        assert sorted(os.listdir(os.path.dirname(path))) == ["metrics.json", "metrics.json.lock"]
+
+    def test_format_bytes(self):
+        assert state.format_bytes(512) == "512.0 B"
+        assert state.format_bytes(3 * 1024 * 1024) == "3.0 MiB"
+        assert state.format_bytes(2 * 1024**5) == "2048.0 TiB"
@@ -0,0 +1,111 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import json
+import os
+import tempfile
+import unittest
+
+import streams
+
+PRODUCTS = {
+    "content_id": "com.ubuntu.maas:daily:v3:download",
+    "format": "products:1.0",
+    "products": {
+        "com.ubuntu.maas.daily:v3:boot:22.04:amd64:ga-22.04": {
+            "arch": "amd64",
+            "versions": {
+                "20240101": {
+                    "items": {
+                        "squashfs": {
+                            "path": "jammy/amd64/20240101/squashfs",
+                            "size": 100,
+                            "sha256": "a" * 64,
+                        },
+                        "manifest": {"ftype": "manifest"},
+                    }
+                }
+            },
+        },
+        "com.ubuntu.maas.daily:1:grub-efi:uefi:amd64": {
+            "versions": {
+                "20230901": {
+                    "items": {
+                        "grub": {"path": "bootloaders/grub.efi", "size": "10", "sha256": "b" * 64}
+                    }
+                }
+            },
+        },
+    },
+}
+
+
+class TestStreams(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.data_dir = os.path.join(self.tmp.name, ".data")
+        os.makedirs(self.data_dir)
+        with open(os.path.join(self.data_dir, PRODUCTS["content_id"]), "w") as f:
+            json.dump(PRODUCTS, f)
+        with open(os.path.join(self.data_dir, "notes.txt"), "w") as f:
+            f.write("not metadata")
+
+    def test_iter_items(self):
+        items = sorted(streams.iter_items(self.data_dir), key=lambda item: item["path"])
+        assert [item["path"] for item in items] == [
+            "bootloaders/grub.efi",
+            "jammy/amd64/20240101/squashfs",
+        ]
+        assert items[0]["size"] == 10
+        assert items[1]["product"] == "com.ubuntu.maas.daily:v3:boot:22.04:amd64:ga-22.04"
+        assert items[1]["version"] == "20240101"
+        assert items[1]["content_id"] == PRODUCTS["content_id"]
+
+    def test_item_digests(self):
+        assert streams.item_digests(self.data_dir) == {
+            "jammy/amd64/20240101/squashfs": "a" * 64,
+            "bootloaders/grub.efi": "b" * 64,
+        }
+
+    def test_load_products_rejects_other_files(self):
+        assert streams.load_products(os.path.join(self.data_dir, "notes.txt")) is None
+        assert streams.load_products(os.path.join(self.data_dir, "missing")) is None
+
+    def test_missing_data_dir(self):
+        assert list(streams.iter_items(os.path.join(self.tmp.name, "missing"))) == []
+
+
+class TestSelectors(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        with open(os.path.join(self.tmp.name, "products"), "w") as f:
+            json.dump(PRODUCTS, f)
+
+    def select(self, selector):
+        return sorted(item["path"] for item in streams.matching_items(self.tmp.name, selector))
+
+    def test_inherited_fields(self):
+        assert self.select("arch=amd64") == ["jammy/amd64/20240101/squashfs"]
+        assert self.select("content_id~maas") == [
+            "bootloaders/grub.efi",
+            "jammy/amd64/20240101/squashfs",
+        ]
+
+    def test_regex_and_negation(self):
+        assert self.select("product_name~(grub*|pxelinux)") == ["bootloaders/grub.efi"]
+        assert self.select("arch!=amd64") == ["bootloaders/grub.efi"]
+        assert self.select("item_name!~squash version_name=20230901") == ["bootloaders/grub.efi"]
+
+    def test_invalid_selector(self):
+        with self.assertRaises(ValueError):
+            streams.parse_selector("release")
+
+    def test_parse_document(self):
+        signed = (
+            "-----BEGIN PGP SIGNED MESSAGE-----\nHash: SHA512\n\n"
+            '{"index": {}}\n-----BEGIN PGP SIGNATURE-----\n\nabc\n-----END PGP SIGNATURE-----\n'
+        )
+        assert streams.parse_document(signed.encode()) == {"index": {}}
+        assert streams.parse_document('{"a": 1}') == {"a": 1}
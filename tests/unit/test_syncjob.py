@@ -0,0 +1,572 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import fcntl
+import os
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import call, patch
+
+from helpers import CONTENT_ID, products, write_products
+
+import capacity
+import manifest
+import precompress
+import state
+import streams
+import syncjob
+import trim
+
+
+class TestSyncJob(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.state_dir = self.tmp.name
+        self.config = {
+            "image-selectors": "arch=amd64\nos~(grub*)",
+            "image-source": "http://mirror/",
+            "image-max": 1,
+            "keyring-file": "",
+            "verbose": False,
+            "keep": True,
+            "sync-concurrency": 2,
+            "target": os.path.join(self.tmp.name, "latest"),
+        }
+        os.makedirs(self.config["target"], exist_ok=True)
+
+    def write_config(self):
+        state.write_json(os.path.join(self.state_dir, syncjob.CONFIG_FILE), self.config)
+
+    @patch("subprocess.Popen")
+    def test_start(self, popen):
+        job_id = syncjob.start(self.state_dir, self.config, force=True, env={"A": "b"})
+        assert state.read_json(os.path.join(self.state_dir, syncjob.CONFIG_FILE)) == (self.config)
+        status = syncjob.read_status(self.state_dir)
+        assert status["job-id"] == job_id
+        assert status["phase"] == "queued"
+        args, kwargs = popen.call_args
+        assert args[0][1:] == [
+            os.path.abspath(syncjob.__file__),
+            "--state-dir",
+            self.state_dir,
+            "--job-id",
+            job_id,
+            "--force",
+        ]
+        assert kwargs["start_new_session"]
+        assert kwargs["env"] == {"A": "b"}
+
+    def test_is_running(self):
+        assert not syncjob.is_running(self.state_dir)
+        with open(os.path.join(self.state_dir, syncjob.LOCK_FILE), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            assert syncjob.is_running(self.state_dir)
+            with self.assertRaises(syncjob.AlreadyRunning):
+                self.write_config()
+                syncjob.SyncJob(self.state_dir).run()
+        assert not syncjob.is_running(self.state_dir)
+
+    @patch("syncjob._children")
+    @patch("os.kill")
+    @patch("os.killpg")
+    @patch("os.getpgid")
+    @patch("syncjob.is_running")
+    def test_cancel(self, is_running, getpgid, killpg, kill, children):
+        is_running.return_value = False
+        assert not syncjob.cancel(self.state_dir)
+        is_running.return_value = True
+        state.write_json(os.path.join(self.state_dir, syncjob.STATUS_FILE), {"pid": 4242})
+        getpgid.return_value = 4242
+        assert syncjob.cancel(self.state_dir)
+        assert killpg.call_args == call(4242, signal.SIGTERM)
+        assert not kill.called
+        # a job run by a hook with wait=true does not lead its process group
+        getpgid.return_value = 4000
+        children.return_value = [4300]
+        assert syncjob.cancel(self.state_dir)
+        assert children.call_args == call(4242)
+        assert kill.call_args_list == [call(4300, signal.SIGTERM), call(4242, signal.SIGTERM)]
+        getpgid.side_effect = ProcessLookupError
+        assert not syncjob.cancel(self.state_dir)
+
+    @patch("upstream.check")
+    @patch("subprocess.check_output")
+    def test_run_selectors(self, check_output, check):
+        check.return_value = {}
+        check_output.side_effect = [b"ok", subprocess.CalledProcessError(1, "x", output=b"bad")]
+        self.write_config()
+        status = syncjob.SyncJob(self.state_dir, "sync-1").run()
+        assert status["phase"] == "failed"
+        assert status["selectors-done"] == 2
+        assert status["message"] == "Failed to sync 1 of 2 selectors"
+        assert sorted(r["status"] for r in status["results"].values()) == ["failed", "ok"]
+        assert syncjob.read_status(self.state_dir)["phase"] == "failed"
+
+    @patch("upstream.check")
+    @patch("subprocess.check_output")
+    def test_selectors_sharing_a_content_id(self, check_output, check):
+        check.return_value = {}
+        data_path = os.path.join(self.config["target"], ".data", CONTENT_ID)
+        running = []
+        overlapped = threading.Event()
+
+        def sstream_mirror(cmd, **kwargs):
+            # read the products, fetch, then write them back as sstream-mirror does
+            running.append(cmd)
+            if len(running) > 1:
+                overlapped.set()
+            mirrored = streams.load_products(data_path) or products({})
+            time.sleep(0.05)
+            release = "grub" if cmd[-1].startswith("os") else "jammy"
+            mirrored["products"].update(products({release: ["20240101"]})["products"])
+            write_products(self.config["target"], mirrored)
+            running.remove(cmd)
+            return b""
+
+        check_output.side_effect = sstream_mirror
+        self.write_config()
+        status = syncjob.SyncJob(self.state_dir, "sync-1").run()
+        assert status["phase"] == "done"
+        self.assertFalse(overlapped.is_set())
+        assert sorted(streams.load_products(data_path)["products"]) == ["grub", "jammy"]
+
+    @patch("metrics.selector_sizes")
+    @patch("upstream.check")
+    @patch("subprocess.check_output")
+    def test_run_selectors_from_peer(self, check_output, check, selector_sizes):
+        check.return_value = {}
+        check_output.return_value = b""
+        selector_sizes.side_effect = lambda target, selectors: {s: {} for s in selectors}
+        self.config.update(
+            {
+                "sync-concurrency": 1,
+                "unit": "simple-streams/0",
+                "peers": {"simple-streams/1": "http://peer/latest"},
+            }
+        )
+        self.write_config()
+        status = syncjob.SyncJob(self.state_dir, "sync-1").run()
+        sources = [c[0][0][-3] for c in check_output.call_args_list]
+        # the peer has nothing yet, so every selector falls back to upstream
+        assert sources == ["http://peer/latest", "http://mirror/"] * 2
+        assert status["results"]["selector-1"]["source"] == "upstream"
+        check_output.reset_mock()
+        selector_sizes.side_effect = lambda target, selectors: {
+            s: {"jammy/squashfs": 1} for s in selectors
+        }
+        status = syncjob.SyncJob(self.state_dir, "sync-2").run()
+        sources = [c[0][0][-3] for c in check_output.call_args_list]
+        assert sources == ["http://peer/latest"] * 2
+        assert status["results"]["selector-1"]["source"] == "simple-streams/1"
+        assert check.call_args[0][0] == "http://peer/latest/streams/v1/index.sjson"
+
+    @patch("sources.rank")
+    @patch("upstream.check")
+    @patch("subprocess.check_output")
+    def test_run_selectors_fail_over(self, check_output, check, rank):
+        check.return_value = {}
+        rank.return_value = (["http://fast/", "http://mirror/"], [{}, {}])
+
+        def sync(cmd, **kwargs):
+            if "http://fast/" in cmd:
+                raise subprocess.CalledProcessError(1, cmd, output=b"timed out")
+            return b""
+
+        check_output.side_effect = sync
+        self.config.update({"image-source": "http://mirror/ http://fast/", "sync-concurrency": 1})
+        self.write_config()
+        status = syncjob.SyncJob(self.state_dir, "sync-1").run()
+        assert rank.call_args[0][0] == ["http://mirror/", "http://fast/"]
+        sources = [c[0][0][-3] for c in check_output.call_args_list]
+        # the failing mirror is demoted after the first selector
+        assert sources == ["http://fast/", "http://mirror/", "http://mirror/"]
+        assert status["phase"] == "done"
+        assert status["sources"] == "http://fast/ http://mirror/"
+        assert status["results"]["selector-1"]["mirror"] == "http://mirror/"
+
+    @patch("metrics.selector_metrics")
+    @patch("sources.rank")
+    @patch("upstream.check")
+    @patch("subprocess.check_output")
+    def test_run_selectors_throughput_floor(self, check_output, check, rank, selector_metrics):
+        check.return_value = {}
+        check_output.return_value = b""
+        rank.return_value = (["http://slow/", "http://mirror/"], [{}, {}])
+        selector_metrics.return_value = {
+            "bytes-downloaded": 1024,
+            "throughput-bytes-per-second": 1024,
+        }
+        self.config.update(
+            {
+                "image-source": "http://mirror/ http://slow/",
+                "sync-concurrency": 1,
+                "min-throughput": 2,
+            }
+        )
+        self.write_config()
+        syncjob.SyncJob(self.state_dir, "sync-1").run()
+        sources = [c[0][0][-3] for c in check_output.call_args_list]
+        assert sources == ["http://slow/", "http://mirror/"]
+
+    @patch("sources.rank")
+    def test_no_usable_source(self, rank):
+        rank.return_value = ([], [{"error": "bad signature"}])
+        self.write_config()
+        status = syncjob.SyncJob(self.state_dir, "sync-1").run()
+        assert status["phase"] == "failed"
+        assert status["message"] == ("Sync failed: No image source passed signature verification")
+
+    @patch("metrics.selector_sizes")
+    @patch("upstream.check")
+    @patch("subprocess.check_output")
+    def test_unchanged_selectors_are_not_measured(self, check_output, check, selector_sizes):
+        check.side_effect = [None, None]
+        selector_sizes.side_effect = lambda target, selectors: {s: {} for s in selectors}
+        self.write_config()
+        status = syncjob.SyncJob(self.state_dir, "sync-1").run()
+        assert status["selectors-done"] == 2
+        self.assertFalse(selector_sizes.called)
+        assert not os.path.exists(os.path.join(self.state_dir, "metrics.json"))
+        assert "duration-seconds" not in status["results"]["selector-1"]
+        # .data is parsed before the first sync, then once after each sync
+        check.side_effect = [{}, {}]
+        check_output.return_value = b""
+        syncjob.SyncJob(self.state_dir, "sync-2").run()
+        assert selector_sizes.call_count == 3
+
+    @patch("upstream.check")
+    @patch("subprocess.check_output")
+    def test_run_selectors_writes_metrics(self, check_output, check):
+        check.return_value = {}
+        check_output.return_value = b""
+        textfile_dir = os.path.join(self.tmp.name, "node-exporter")
+        os.makedirs(textfile_dir)
+        self.config.update({"app": "mirror", "metrics-textfile-dir": textfile_dir})
+        self.write_config()
+        status = syncjob.SyncJob(self.state_dir, "sync-1").run()
+        assert status["phase"] == "done"
+        assert status["results"]["selector-1"]["files-fetched"] == "0"
+        assert "duration-seconds" in status["results"]["selector-2"]
+        with open(os.path.join(textfile_dir, "simple-streams-mirror.prom")) as f:
+            assert 'selector="os~(grub*)"' in f.read()
+
+    @patch("upstream.check")
+    @patch("subprocess.check_output")
+    def test_cancelled_job_skips_remaining_selectors(self, check_output, check):
+        check.return_value = {}
+        self.config["sync-concurrency"] = 1
+        self.write_config()
+        job = syncjob.SyncJob(self.state_dir, "sync-1")
+
+        def sync(cmd, **kwargs):
+            job._on_sigterm(signal.SIGTERM, None)
+            raise subprocess.CalledProcessError(-15, cmd, output=b"")
+
+        check_output.side_effect = sync
+        status = job.run()
+        assert status["phase"] == "cancelled"
+        assert check_output.call_count == 1
+        assert status["results"]["selector-2"]["status"] == "cancelled"
+
+    @patch("upstream.record")
+    @patch("upstream.check")
+    @patch("mirror.sync")
+    def test_run_single_pass_from_peer(self, mirror_sync, check, record):
+        check.return_value = {}
+        stats = {"matched": 1, "fetched": 1, "bytes": 10}
+
+        def sync(source, target, selectors, **kwargs):
+            if source == "http://peer/latest":
+                raise OSError("peer unreachable")
+            return {"items": 1, "bytes": 10, "selectors": [stats] * len(selectors)}
+
+        mirror_sync.side_effect = sync
+        self.config.update(
+            {
+                "sync-engine": "simplestreams",
+                "unit": "simple-streams/0",
+                "peers": {"simple-streams/1": "http://peer/latest"},
+            }
+        )
+        self.write_config()
+        status = syncjob.SyncJob(self.state_dir, "sync-1").run()
+        assert [c[0][0] for c in mirror_sync.call_args_list] == [
+            "http://peer/latest",
+            "http://mirror/",
+        ]
+        assert status["phase"] == "done"
+        assert status["results"]["selector-2"]["source"] == "upstream"
+        assert status["results"]["bytes"] == "10"
+        assert syncjob.read_last_run(self.state_dir)["selectors-ok"] == 2
+
+    @patch("sources.rank")
+    @patch("upstream.record")
+    @patch("upstream.check")
+    @patch("mirror.sync")
+    def test_run_single_pass_fail_over(self, mirror_sync, check, record, rank):
+        check.return_value = {}
+        rank.return_value = (["http://fast/", "http://mirror/"], [{}, {}])
+        stats = {"matched": 1, "fetched": 1, "bytes": 10}
+
+        def sync(source, target, selectors, **kwargs):
+            if source == "http://fast/":
+                raise OSError("connection reset")
+            return {"items": 2, "bytes": 20, "selectors": [stats] * len(selectors)}
+
+        mirror_sync.side_effect = sync
+        self.config.update({"sync-engine": "simplestreams", "min-throughput": 100})
+        self.write_config()
+        status = syncjob.SyncJob(self.state_dir, "sync-1").run()
+        assert status["phase"] == "done"
+        calls = mirror_sync.call_args_list
+        assert [c[0][0] for c in calls] == ["http://fast/", "http://mirror/"]
+        assert calls[0][1]["fallbacks"] == ["http://mirror/"]
+        assert calls[1][1]["fallbacks"] == ["http://fast/"]
+        assert calls[1][1]["min_rate"] == 100 * 1024
+
+    @patch("planner.plan")
+    @patch("upstream.record")
+    @patch("upstream.check")
+    @patch("mirror.sync")
+    def test_run_single_pass_progress(self, mirror_sync, check, record, plan):
+        check.return_value = {"etag": "x"}
+        plan.return_value = {"add-bytes": 1000}
+        self.config["sync-engine"] = "simplestreams"
+        self.write_config()
+        job = syncjob.SyncJob(self.state_dir, "sync-1")
+
+        def sync(*args, **kwargs):
+            kwargs["progress"]("jammy/squashfs", 100)
+            status = syncjob.read_status(self.state_dir)
+            assert status["current"] == "jammy/squashfs"
+            assert status["bytes-needed"] == 1000
+            assert status["eta"] is not None
+            job.cancelled = True
+            kwargs["progress"]("jammy/kernel", 10)
+
+        mirror_sync.side_effect = sync
+        status = job.run()
+        assert not os.path.exists(os.path.join(self.state_dir, "metrics.json"))
+        assert status["phase"] == "cancelled"
+        assert status["bytes-done"] == 100
+        self.assertFalse(record.called)
+
+    @patch("upstream.check")
+    @patch("mirror.sync")
+    def test_run_single_pass_unchanged(self, mirror_sync, check):
+        check.return_value = None
+        self.config["sync-engine"] = "simplestreams"
+        self.write_config()
+        status = syncjob.SyncJob(self.state_dir, "sync-1").run()
+        self.assertFalse(mirror_sync.called)
+        assert status["results"]["selector-2"] == {
+            "selector": "os~(grub*)",
+            "status": "unchanged",
+            "source": "upstream",
+        }
+        last_run = syncjob.read_last_run(self.state_dir)
+        assert last_run["selectors-unchanged"] == 2
+        assert last_run["selectors-ok"] == 0
+
+    @patch("time.sleep")
+    @patch("throttle.in_window")
+    @patch("upstream.record")
+    @patch("upstream.check")
+    @patch("mirror.sync")
+    def test_run_single_pass_sync_windows(self, mirror_sync, check, record, in_window, sleep):
+        check.return_value = {"etag": "x"}
+        self.config.update(
+            {"sync-engine": "simplestreams", "sync-windows": "22:00-06:00", "max-bandwidth": "8"}
+        )
+        self.write_config()
+        job = syncjob.SyncJob(self.state_dir, "sync-1")
+        # open at the start, then closed for two polls after the first item
+        in_window.side_effect = [True, False, False, False, False, True, True]
+        phases = []
+        sleep.side_effect = lambda _: phases.append(syncjob.read_status(self.state_dir)["phase"])
+
+        def sync(*args, **kwargs):
+            assert kwargs["throttle"].schedule == (8192, [])
+            kwargs["progress"]("jammy/squashfs", 100)
+            kwargs["progress"]("jammy/kernel", 10)
+            stats = {"matched": 1, "fetched": 1, "bytes": 55}
+            return {"items": 2, "bytes": 110, "selectors": [stats, stats]}
+
+        mirror_sync.side_effect = sync
+        status = job.run()
+        assert phases == ["paused", "paused"]
+        assert status["phase"] == "done"
+        assert status["bytes-done"] == 110
+
+    @patch("time.sleep")
+    @patch("throttle.in_window")
+    @patch("subprocess.check_output")
+    def test_paused_job_can_be_cancelled(self, check_output, in_window, sleep):
+        self.config["sync-windows"] = "22:00-06:00"
+        self.write_config()
+        job = syncjob.SyncJob(self.state_dir, "sync-1")
+        in_window.return_value = False
+
+        def cancel(_):
+            status = syncjob.read_status(self.state_dir)
+            assert syncjob.describe(status) == "Sync paused until {}".format(
+                time.ctime(status["resumes"])
+            )
+            job.cancelled = True
+
+        sleep.side_effect = cancel
+        assert job.run()["phase"] == "cancelled"
+        self.assertFalse(check_output.called)
+
+    @patch("capacity.free_bytes")
+    @patch("planner.plan")
+    @patch("subprocess.check_output")
+    def test_not_enough_space(self, check_output, plan, free_bytes):
+        self.config.update({"disk-reserve": 1, "image-dir": self.tmp.name})
+        self.write_config()
+        plan.return_value = {"add-bytes": 3 * 1024 * 1024}
+        free_bytes.return_value = 2 * 1024 * 1024
+        status = syncjob.SyncJob(self.state_dir, "sync-1").run()
+        assert plan.call_args[0][0]["image-source"] == "http://mirror/"
+        assert status["phase"] == "blocked"
+        assert status["message"] == "Not enough disk space: sync needs 4.0 MiB, 2.0 MiB free"
+        assert status["bytes-needed"] == 3 * 1024 * 1024
+        self.assertFalse(check_output.called)
+        assert syncjob.read_last_run(self.state_dir)["phase"] == "blocked"
+        assert "latest" in capacity.load(self.state_dir)["trees"]
+
+    @patch("capacity.free_bytes")
+    @patch("planner.plan")
+    @patch("upstream.check")
+    @patch("subprocess.check_output")
+    def test_out_of_space_during_sync(self, check_output, check, plan, free_bytes):
+        self.config.update({"disk-reserve": 1, "sync-concurrency": 1})
+        self.write_config()
+        check.return_value = {}
+        plan.side_effect = OSError("Connection refused")
+        free_bytes.return_value = 1024
+        job = syncjob.SyncJob(self.state_dir, "sync-1")
+
+        def sstream_mirror(*args, **kwargs):
+            job._watch_space()
+            return b""
+
+        check_output.side_effect = sstream_mirror
+        status = job.run()
+        assert check_output.call_count == 1
+        assert status["phase"] == "blocked"
+        assert status["message"] == "Out of disk space: 1.0 KiB free"
+        assert status["results"]["selector-2"]["status"] == "cancelled"
+
+    @patch("capacity.update")
+    @patch("manifest.update")
+    @patch("planner.plan")
+    @patch("upstream.check")
+    @patch("subprocess.check_output")
+    def test_unchanged_run_skips_planning_and_refresh(
+        self, check_output, check, plan, manifest_update, capacity_update
+    ):
+        check.return_value = None
+        self.config.update({"disk-reserve": 1, "image-dir": self.tmp.name})
+        self.write_config()
+        assert syncjob.SyncJob(self.state_dir, "sync-1").run()["phase"] == "done"
+        # the first run refreshes the metadata it has no record of
+        assert manifest_update.call_count == 1
+        assert syncjob.SyncJob(self.state_dir, "sync-2").run()["phase"] == "done"
+        self.assertFalse(plan.called)
+        self.assertFalse(check_output.called)
+        self.assertFalse(capacity_update.called)
+        assert manifest_update.call_count == 1
+        # settings the metadata depends on changed, so it is refreshed once more
+        self.config["trimmed-streams"] = True
+        self.write_config()
+        syncjob.SyncJob(self.state_dir, "sync-3").run()
+        assert manifest_update.call_count == 2
+        self.assertFalse(capacity_update.called)
+
+    @patch("upstream.check")
+    @patch("subprocess.check_output")
+    def test_last_run(self, check_output, check):
+        check.side_effect = [{}, None]
+        check_output.return_value = b""
+        self.config["metadata-compression"] = "gzip"
+        self.config["trimmed-streams"] = True
+        self.write_config()
+        os.makedirs(self.config["target"], exist_ok=True)
+        assert syncjob.read_last_run(self.state_dir) == {}
+        syncjob.SyncJob(self.state_dir, "sync-1", trigger="cron").run()
+        last_run = syncjob.read_last_run(self.state_dir)
+        assert last_run["job-id"] == "sync-1"
+        assert last_run["trigger"] == "cron"
+        assert last_run["phase"] == "done"
+        assert last_run["selectors-ok"] == 1
+        assert last_run["selectors-unchanged"] == 1
+        assert last_run["selectors-failed"] == 0
+        assert last_run["duration"] >= 0
+        assert manifest.load(self.config["target"])["items"] == 0
+        assert os.path.exists(os.path.join(self.config["target"], precompress.CHECKSUMS_FILE))
+        trimmed_index = os.path.join(self.config["target"], trim.TRIMMED_DIR, trim.INDEX_FILE)
+        assert os.path.exists(trimmed_index + ".gz")
+
+    @patch("reclaim.collect")
+    @patch("upstream.check")
+    @patch("subprocess.check_output")
+    def test_gc_after_sync(self, check_output, check, collect):
+        check.return_value = None
+        collect.return_value = {"bytes-freed": 42}
+        self.config.update({"image-dir": self.tmp.name, "snapshot-keep-count": 2})
+        self.write_config()
+        status = syncjob.SyncJob(self.state_dir, "sync-1").run()
+        self.assertFalse(collect.called)
+        self.config["gc-after-sync"] = True
+        self.write_config()
+        status = syncjob.SyncJob(self.state_dir, "sync-2").run()
+        assert collect.call_args == call(self.tmp.name, keep_count=2, keep_days=0)
+        assert status["phase"] == "done"
+        assert status["gc-bytes-freed"] == 42
+
+    def test_eta_and_describe(self):
+        self.write_config()
+        job = syncjob.SyncJob(self.state_dir, "sync-1")
+        job.status.update(
+            {
+                "phase": "syncing",
+                "started": 100,
+                "selectors-done": 1,
+                "selectors-total": 4,
+                "current": "arch=amd64",
+                "bytes-done": 2 * 1024**3,
+            }
+        )
+        assert job._eta(160) == 180
+        job.status["eta"] = 180
+        assert syncjob.describe(job.status) == (
+            "Syncing arch=amd64 (1/4 selectors), 2.0 GiB, ETA 3m"
+        )
+        # with the planned bytes known, the ETA follows the bytes fetched
+        job.status.update({"selectors-done": 0, "bytes-needed": 8 * 1024**3})
+        assert job._eta(160) == 180
+
+    def test_children(self):
+        with subprocess.Popen(["sleep", "5"]) as child:
+            assert syncjob._children(os.getpid()) == [child.pid]
+            child.terminate()
+        assert syncjob._children(-1) == []
+
+    @patch("os.setpgid")
+    @patch("syncjob.SyncJob")
+    def test_main(self, sync_job, setpgid):
+        sync_job.return_value.run.return_value = {"phase": "done"}
+        assert syncjob.main(["--state-dir", self.state_dir, "--job-id", "sync-1"]) == 0
+        assert sync_job.call_args == call(self.state_dir, "sync-1", False, "action")
+        sync_job.return_value.run.side_effect = syncjob.AlreadyRunning("sync-0")
+        assert syncjob.main(["--state-dir", self.state_dir, "--scheduled"]) == 0
+        assert sync_job.call_args == call(self.state_dir, None, False, "cron")
+        sync_job.return_value.run.side_effect = None
+        sync_job.return_value.run.return_value = {"phase": "failed"}
+        assert syncjob.main(["--state-dir", self.state_dir]) == 1
@@ -0,0 +1,60 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import time
+import unittest
+from unittest.mock import patch
+
+import throttle
+
+
+def at(hour, minute=0):
+    """Return the timestamp of a local time of day."""
+    return time.mktime((2026, 1, 15, hour, minute, 0, 0, 0, -1))
+
+
+class TestThrottle(unittest.TestCase):
+    def test_parse_windows(self):
+        assert throttle.parse_windows("22:00-06:00 12:30-13:00") == [(1320, 360), (750, 780)]
+        assert throttle.parse_windows("") == []
+        assert throttle.parse_windows("22:00-24:00") == [(1320, 0)]
+        for value in ("22:00", "25:00-01:00", "ab:cd-01:00", "22:00-24:30", "10:60-11:00"):
+            with self.assertRaises(ValueError):
+                throttle.parse_windows(value)
+
+    def test_in_window(self):
+        windows = throttle.parse_windows("22:00-06:00 12:30-13:00")
+        assert throttle.in_window(windows, at(23))
+        assert throttle.in_window(windows, at(5, 59))
+        assert throttle.in_window(windows, at(12, 45))
+        assert not throttle.in_window(windows, at(6))
+        assert not throttle.in_window(windows, at(13))
+        assert throttle.in_window([], at(13))
+
+    def test_next_opening(self):
+        windows = throttle.parse_windows("22:00-06:00 12:30-13:00")
+        assert throttle.next_opening(windows, at(10)) == at(12, 30)
+        assert throttle.next_opening(windows, at(14)) == at(22)
+        assert throttle.next_opening(windows, at(23)) == at(23)
+
+    def test_bandwidth(self):
+        schedule = throttle.parse_bandwidth("8192 08:00-18:00=2048")
+        assert schedule == (8192 * 1024, [(480, 1080, 2048 * 1024)])
+        assert throttle.limit_at(schedule, at(9)) == 2048 * 1024
+        assert throttle.limit_at(schedule, at(19)) == 8192 * 1024
+        assert throttle.limit_at(throttle.parse_bandwidth(""), at(9)) == 0
+        with self.assertRaises(ValueError):
+            throttle.parse_bandwidth("fast")
+
+    @patch("time.sleep")
+    @patch("time.monotonic")
+    def test_limiter(self, monotonic, sleep):
+        monotonic.return_value = 100.0
+        limiter = throttle.Limiter((1024, []))
+        # the first second of transfer is allowed as a burst
+        assert limiter(1024) == 0
+        assert limiter(2048) == 2
+        assert sleep.call_args[0][0] == 2
+        monotonic.return_value = 110.0
+        assert limiter(512) == 0
+        assert throttle.Limiter((0, []))(10**9) == 0
@@ -0,0 +1,66 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import json
+import os
+import unittest
+
+from helpers import products, temp_dir, write_products
+
+import streams
+import trim
+
+PRODUCTS = products({"jammy": ["1", "2", "3"], "focal": ["1"]})
+
+
+class TestTrim(unittest.TestCase):
+    def setUp(self):
+        self.root = temp_dir(self)
+        write_products(self.root, PRODUCTS)
+
+    def load(self, name):
+        with open(os.path.join(self.root, trim.TRIMMED_DIR, name)) as f:
+            return json.load(f)
+
+    def test_trim(self):
+        trimmed = trim.trim(PRODUCTS, ["release=jammy"], 2)
+        assert list(trimmed["products"]) == ["jammy"]
+        assert sorted(trimmed["products"]["jammy"]["versions"]) == ["2", "3"]
+        assert trimmed["products"]["jammy"]["arch"] == "amd64"
+        assert trimmed["content_id"] == PRODUCTS["content_id"]
+        # the source document is left alone
+        assert len(PRODUCTS["products"]["jammy"]["versions"]) == 3
+
+    def test_update(self):
+        summary = trim.update(self.root, ["release=jammy", "release=focal", ""], 1)
+        assert summary["products"] == 2
+        assert summary["items"] == 2
+        assert summary["bytes-out"] < summary["bytes-in"]
+        index = self.load(trim.INDEX_FILE)
+        entry = index["index"][PRODUCTS["content_id"]]
+        assert entry["path"] == "streams/v1/trimmed/com.ubuntu.maas:stable:v3:download.json"
+        assert entry["products"] == ["focal", "jammy"]
+        assert entry["datatype"] == "image-downloads"
+        assert index["updated"] == PRODUCTS["updated"]
+        products = self.load(os.path.basename(entry["path"]))
+        assert sorted(i["path"] for i in streams.items_of(products)) == [
+            "focal/amd64/1/squashfs",
+            "jammy/amd64/3/squashfs",
+        ]
+
+    def test_update_unchanged(self):
+        trim.update(self.root, ["release=jammy"])
+        path = os.path.join(self.root, trim.TRIMMED_DIR, trim.INDEX_FILE)
+        os.utime(path, (0, 0))
+        trim.update(self.root, ["release=jammy"])
+        assert os.stat(path).st_mtime == 0
+
+    def test_update_removes_stale(self):
+        trim.update(self.root, ["release=jammy"])
+        out_dir = os.path.join(self.root, trim.TRIMMED_DIR)
+        assert len(os.listdir(out_dir)) == 2
+        trim.update(self.root, ["release=noble"])
+        assert os.listdir(out_dir) == [trim.INDEX_FILE]
+        assert self.load(trim.INDEX_FILE)["index"] == {}
+        assert trim.update(self.root, []) is None
+        assert not os.path.exists(out_dir)
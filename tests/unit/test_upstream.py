@@ -0,0 +1,64 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import os
+import unittest
+
+from helpers import QuietHandler, serve, temp_dir
+
+import upstream
+
+
+class IndexHandler(QuietHandler):
+    body = b'{"index": {}}'
+    etag = '"v1"'
+    requests = []
+
+    def do_GET(self):  # noqa: N802
+        self.requests.append(dict(self.headers))
+        if not self.path.endswith("index.sjson"):
+            self.send_error(404)
+            return
+        if self.etag and self.headers.get("If-None-Match") == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_body(self.body, {"ETag": self.etag} if self.etag else None)
+
+
+class TestUpstream(unittest.TestCase):
+    def setUp(self):
+        IndexHandler.etag = '"v1"'
+        IndexHandler.requests = []
+        self.url = serve(self, IndexHandler) + "/streams/v1/index.sjson"
+        self.state = os.path.join(temp_dir(self), "latest", upstream.STATE_FILE)
+
+    def test_index_url(self):
+        assert upstream.index_url("http://m/daily/") == "http://m/daily/streams/v1/index.sjson"
+        assert upstream.index_url("http://m/daily", "streams/v1/index.json") == (
+            "http://m/daily/streams/v1/index.json"
+        )
+        assert upstream.index_url("http://m/streams/v1/x.json") == "http://m/streams/v1/x.json"
+
+    def test_check_etag(self):
+        fingerprint = upstream.check(self.url, self.state, "key")
+        assert fingerprint["etag"] == '"v1"'
+        upstream.record(self.state, "key", fingerprint)
+        assert upstream.check(self.url, self.state, "key") is None
+        assert IndexHandler.requests[-1]["If-None-Match"] == '"v1"'
+        # other sync configurations keep their own validators
+        assert upstream.check(self.url, self.state, "other") is not None
+
+    def test_check_content_hash(self):
+        IndexHandler.etag = None
+        fingerprint = upstream.check(self.url, self.state, "key")
+        upstream.record(self.state, "key", fingerprint)
+        assert upstream.check(self.url, self.state, "key") is None
+        IndexHandler.body = b'{"index": {"new": {}}}'
+        self.addCleanup(setattr, IndexHandler, "body", b'{"index": {}}')
+        assert upstream.check(self.url, self.state, "key") is not None
+
+    def test_check_error_is_a_change(self):
+        assert upstream.check(self.url + ".missing", self.state, "key") == {}
+        upstream.record(self.state, "key", {})
+        self.assertFalse(os.path.exists(self.state))
@@ -0,0 +1,56 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import hashlib
+import os
+import unittest
+from unittest.mock import patch
+
+from helpers import item, products, temp_dir, write, write_products
+
+import download
+import verify
+
+
+class TestVerify(unittest.TestCase):
+    def setUp(self):
+        tmp = temp_dir(self)
+        self.root = os.path.join(tmp, "latest")
+        self.cache_path = os.path.join(tmp, verify.CACHE_FILE)
+        items = {}
+        for name in ("good", "bad", "gone"):
+            content = name.encode() * 100
+            path = "jammy/{}".format(name)
+            items[name] = item(path, len(content), hashlib.sha256(content).hexdigest())
+            self.write(path, content)
+        items["unsigned"] = {"path": "jammy/unsigned", "size": 1}
+        os.unlink(os.path.join(self.root, "jammy", "gone"))
+        self.write("jammy/bad", b"b" * 300)
+        write_products(self.root, products({"jammy": {"1": {"items": items}}}))
+
+    def write(self, path, content):
+        write(os.path.join(self.root, path), content)
+
+    def test_verify(self):
+        report = verify.verify(self.root, workers=2)
+        assert report == {
+            "items": 3,
+            "hashed": 2,
+            "cached": 0,
+            "bytes-hashed": 700,
+            "missing": ["jammy/gone"],
+            "corrupt": ["jammy/bad"],
+        }
+
+    def test_cache(self):
+        verify.verify(self.root, self.cache_path)
+        with patch("download.sha256sum", wraps=download.sha256sum) as sha256sum:
+            report = verify.verify(self.root, self.cache_path)
+            self.assertFalse(sha256sum.called)
+            assert report["cached"] == 2
+            assert report["corrupt"] == ["jammy/bad"]
+            self.write("jammy/good", b"g" * 400)
+            report = verify.verify(self.root, self.cache_path)
+            assert sha256sum.call_count == 1
+            assert report["hashed"] == 1
+            assert report["corrupt"] == ["jammy/bad", "jammy/good"]